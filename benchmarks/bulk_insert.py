@@ -0,0 +1,74 @@
+"""
+Сравнение скорости массового добавления расходов (add_many)
+с добавлением по одному объекту (add) в цикле.
+
+Запуск из корневой папки проекта:
+python -m benchmarks.bulk_insert --rows 10000
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable
+
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import AbstractRepository
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SqliteRepository
+
+def make_expenses(n: int, categories: int = 20) -> list[Expense]:
+    """ Сгенерировать n расходов в категориях с id от 1 до categories """
+    start = datetime(2023, 1, 1)
+    return [Expense(amount=i % 1000, category=i % categories + 1,
+                    expense_date=start + timedelta(minutes=i),
+                    added_date=start, comment=f'expense {i}')
+            for i in range(n)]
+
+
+def rows_per_sec(n: int, action: Callable[[], object]) -> float:
+    """ Выполнить action и вернуть скорость в строках в секунду """
+    start = time.perf_counter()
+    action()
+    return n / (time.perf_counter() - start)
+
+
+def add_one_by_one(repo: AbstractRepository[Expense], objs: list[Expense]) -> None:
+    """ Добавить объекты по одному """
+    for obj in objs:
+        repo.add(obj)
+
+
+def sqlite_repo(directory: str, name: str) -> SqliteRepository[Expense]:
+    """ Создать репозиторий расходов в новом файле БД """
+    return SqliteRepository(os.path.join(directory, name), Expense,
+                            indexes=('expense_date', 'category'))
+
+
+def main() -> None:
+    """ Точка входа """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10_000)
+    args = parser.parse_args()
+    n = args.rows
+
+    print(f'{"backend":<10}{"add (rows/s)":>16}{"add_many (rows/s)":>20}')
+    loop_objs, bulk_objs = make_expenses(n), make_expenses(n)
+    memory = (
+        rows_per_sec(n, lambda: add_one_by_one(MemoryRepository(), loop_objs)),
+        rows_per_sec(n, lambda: MemoryRepository().add_many(bulk_objs)),
+    )
+    print(f'{"memory":<10}{memory[0]:>16.0f}{memory[1]:>20.0f}')
+    with tempfile.TemporaryDirectory() as directory:
+        with sqlite_repo(directory, 'loop.db') as loop_repo, \
+                sqlite_repo(directory, 'bulk.db') as bulk_repo:
+            loop_objs, bulk_objs = make_expenses(n), make_expenses(n)
+            sqlite = (
+                rows_per_sec(n, lambda: add_one_by_one(loop_repo, loop_objs)),
+                rows_per_sec(n, lambda: bulk_repo.add_many(bulk_objs)),
+            )
+    print(f'{"sqlite":<10}{sqlite[0]:>16.0f}{sqlite[1]:>20.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Сравнение загрузки дерева категорий из файла: read_tree и
+Category.create_from_tree (список пар, add для каждой категории)
+с iter_tree_paths и Category.create_from_paths (поток путей, add_many
+по уровням порциями), а также пиковой памяти при чтении файла
+read_tree и iter_tree.
+
+Запуск из корневой папки проекта:
+python -m benchmarks.category_tree --nodes 50000
+"""
+import argparse
+import os
+import tempfile
+import tracemalloc
+from typing import Callable, Iterable
+
+from benchmarks.bulk_insert import rows_per_sec
+from benchmarks.suite import make_tree
+from bookkeeper.models.category import Category
+from bookkeeper.repository.abstract_repository import AbstractRepository
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SqliteRepository
+from bookkeeper.utils import iter_tree, iter_tree_paths, read_tree
+
+
+def peak_memory(action: Callable[[], object]) -> int:
+    """ Выполнить action и вернуть пиковый объем выделенной памяти в байтах """
+    tracemalloc.start()
+    try:
+        action()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def load_pairs(tree_file: str, repo: AbstractRepository[Category]) -> None:
+    """ Загрузить дерево списком пар и add для каждой категории """
+    with open(tree_file, encoding='utf-8') as lines:
+        Category.create_from_tree(read_tree(lines), repo)
+
+
+def load_paths(tree_file: str, repo: AbstractRepository[Category]) -> None:
+    """ Загрузить дерево потоком путей и add_many по уровням """
+    with open(tree_file, encoding='utf-8') as lines:
+        Category.create_from_paths(iter_tree_paths(lines), repo)
+
+
+def main() -> None:
+    """ Точка входа """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--nodes', type=int, default=50_000)
+    parser.add_argument('--fanout', type=int, default=10)
+    args = parser.parse_args()
+    n = args.nodes
+    with tempfile.TemporaryDirectory() as tmp:
+        tree_file = os.path.join(tmp, 'tree.txt')
+        with open(tree_file, 'w', encoding='utf-8') as out:
+            out.write('\n'.join(make_tree(n, args.fanout)))
+
+        def count(reader: Callable[[Iterable[str]], Iterable[object]]) -> None:
+            with open(tree_file, encoding='utf-8') as lines:
+                for _ in reader(lines):
+                    pass
+        print(f'{"reader":<12}{"peak memory (KiB)":>20}')
+        for name, reader in (('read_tree', read_tree), ('iter_tree', iter_tree)):
+            print(f'{name:<12}{peak_memory(lambda: count(reader)) / 1024:>20.0f}')
+
+        print(f'{"backend":<12}{"pairs (rows/s)":>16}{"paths (rows/s)":>16}')
+        memory = (rows_per_sec(n, lambda: load_pairs(tree_file, MemoryRepository())),
+                  rows_per_sec(n, lambda: load_paths(tree_file, MemoryRepository())))
+        print(f'{"memory":<12}{memory[0]:>16.0f}{memory[1]:>16.0f}')
+        pairs_db, paths_db = os.path.join(tmp, 'pairs.db'), os.path.join(tmp, 'paths.db')
+        with SqliteRepository[Category](pairs_db, Category) as pairs, \
+                SqliteRepository[Category](paths_db, Category) as paths:
+            sqlite = (rows_per_sec(n, lambda: load_pairs(tree_file, pairs)),
+                      rows_per_sec(n, lambda: load_paths(tree_file, paths)))
+        print(f'{"sqlite":<12}{sqlite[0]:>16.0f}{sqlite[1]:>16.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Сравнение колоночного репозитория расходов с MemoryRepository:
+объем памяти на запись и время суммирования расходов за месяц
+по категориям.
+
+Запуск из корневой папки проекта:
+python -m benchmarks.columnar --rows 1000000
+"""
+import argparse
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Callable
+
+from benchmarks.bulk_insert import make_expenses
+from bookkeeper.repository.columnar_repository import ColumnarExpenseRepository
+from bookkeeper.repository.memory_repository import MemoryRepository
+
+COMMENTS = ['', 'продукты', 'кафе', 'такси', 'подарок']
+
+
+def filled(factory: Callable[[], Any], n: int) -> tuple[Any, float]:
+    """
+    Создать репозиторий с n расходами, вернуть его и количество байт
+    на запись, включая объекты расходов, которые хранит репозиторий
+    """
+    tracemalloc.start()
+    exps = make_expenses(n)
+    for exp in exps:
+        exp.comment = COMMENTS[exp.amount % len(COMMENTS)]
+    repo = factory()
+    repo.add_many(exps)
+    del exps
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return repo, size / n
+
+
+def seconds(action: Callable[[], object]) -> float:
+    """ Время выполнения action """
+    start = time.perf_counter()
+    action()
+    return time.perf_counter() - start
+
+
+def memory_totals(repo: MemoryRepository, lo: datetime, hi: datetime) -> dict[int, int]:
+    """ Суммы по категориям через объекты Expense """
+    totals: dict[int, int] = defaultdict(int)
+    for exp in repo.iter_between('expense_date', lo, hi):
+        totals[exp.category] += exp.amount
+    return totals
+
+
+def main() -> None:
+    """ Точка входа """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=200_000)
+    args = parser.parse_args()
+    n = args.rows
+    lo, hi = datetime(2023, 1, 1), datetime(2023, 1, 31, 23, 59)
+
+    print(f'{"repository":<12}{"bytes/row":>12}{"totals (s)":>14}')
+    memory, size = filled(MemoryRepository, n)
+    elapsed = seconds(lambda: memory_totals(memory, lo, hi))
+    print(f'{"memory":<12}{size:>12.0f}{elapsed:>14.4f}')
+    del memory
+    columnar, size = filled(ColumnarExpenseRepository, n)
+    elapsed = seconds(lambda: columnar.totals_by_category(lo, hi))
+    print(f'{"columnar":<12}{size:>12.0f}{elapsed:>14.4f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""
+Сравнение скорости добавления расходов по одному (add) в репозитории
+в памяти, в SQLite и в репозитории с журналом и отложенной записью.
+
+Запуск из корневой папки проекта:
+python -m benchmarks.journaled --rows 10000
+"""
+import argparse
+import os
+import tempfile
+
+from benchmarks.bulk_insert import add_one_by_one, make_expenses, rows_per_sec
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.journaled_repository import JournaledRepository
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SqliteRepository
+
+
+def main() -> None:
+    """ Точка входа """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10_000)
+    args = parser.parse_args()
+    n = args.rows
+    with tempfile.TemporaryDirectory() as tmp:
+        memory = MemoryRepository[Expense]()
+        speed = rows_per_sec(n, lambda: add_one_by_one(memory, make_expenses(n)))
+        print(f'{"memory":<12}{speed:>12.0f} rows/s')
+        with SqliteRepository[Expense](os.path.join(tmp, 'sqlite.db'), Expense) as sqlite:
+            speed = rows_per_sec(n, lambda: add_one_by_one(sqlite, make_expenses(n)))
+        print(f'{"sqlite":<12}{speed:>12.0f} rows/s')
+        with JournaledRepository[Expense](os.path.join(tmp, 'journaled.db'),
+                                          Expense) as journaled:
+            speed = rows_per_sec(n, lambda: add_one_by_one(journaled, make_expenses(n)))
+        print(f'{"journaled":<12}{speed:>12.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Скорость чтения объектов из SqliteRepository (объектов в секунду)
+для расходов и категорий: прежнее преобразование строки через словарь
+аргументов в сравнении с генерируемой для модели функцией.
+
+Запуск из корневой папки проекта:
+python -m benchmarks.row_factory --rows 100000
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Callable
+
+from benchmarks.bulk_insert import make_expenses
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.sqlite_repository import SqliteRepository
+
+def dict_row2obj(repo: SqliteRepository[Any]) -> Callable[[tuple[Any, ...]], Any]:
+    """ Прежний способ: словарь аргументов, даты остаются строками """
+    def row2obj(row: tuple[Any, ...]) -> Any:
+        kwargs = dict(zip(repo.fields, row))
+        obj = repo.obj_cls(**kwargs)
+        obj.pk = row[-1]
+        return obj
+    return row2obj
+
+
+def objects_per_sec(repo: SqliteRepository[Any], rows: list[tuple[Any, ...]],
+                    row2obj: Callable[[tuple[Any, ...]], Any]) -> float:
+    """ Скорость преобразования строк rows в объекты """
+    start = time.perf_counter()
+    list(map(row2obj, rows))
+    return len(rows) / (time.perf_counter() - start)
+
+
+def get_all_per_sec(repo: SqliteRepository[Any], n: int) -> float:
+    """ Скорость чтения всех объектов методом get_all """
+    start = time.perf_counter()
+    repo.get_all()
+    return n / (time.perf_counter() - start)
+
+
+def fill(directory: str, cls: type, n: int) -> SqliteRepository[Any]:
+    """ Создать репозиторий модели cls с n объектами """
+    repo: SqliteRepository[Any] = SqliteRepository(
+        os.path.join(directory, f'{cls.__name__}.db'), cls)
+    if cls is Expense:
+        repo.add_many(make_expenses(n))
+    else:
+        repo.add_many(Category(f'category {i}', i if i else None) for i in range(n))
+    return repo
+
+
+def main() -> None:
+    """ Точка входа """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100_000)
+    args = parser.parse_args()
+    n = args.rows
+
+    print(f'{"model":<10}{"dict (obj/s)":>16}{"factory (obj/s)":>18}'
+          f'{"get_all (obj/s)":>18}')
+    # замеряется внутренний метод репозитория _row2obj
+    # pylint: disable=protected-access
+    with tempfile.TemporaryDirectory() as directory:
+        for cls in (Expense, Category):
+            with fill(directory, cls, n) as repo:
+                with repo.pool.connection() as con:
+                    rows = con.execute(repo._sql_select).fetchall()
+                old = objects_per_sec(repo, rows, dict_row2obj(repo))
+                new = objects_per_sec(repo, rows, repo._row2obj)
+                loaded = get_all_per_sec(repo, n)
+                sample = repo.get(1)
+                assert sample is not None
+                if cls is Expense:
+                    assert isinstance(sample.expense_date, datetime)
+            print(f'{cls.__name__:<10}{old:>16.0f}{new:>18.0f}{loaded:>18.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Сравнение прогрева репозиториев в оперативной памяти (MemoryRepository
+и ColumnarExpenseRepository): чтение всех расходов из SQLite (get_all)
+и загрузка двоичного снимка учета.
+Также выводятся время записи снимка и размеры файлов.
+
+Запуск из корневой папки проекта:
+python -m benchmarks.snapshot --rows 200000
+"""
+import argparse
+import os
+import tempfile
+import time
+from typing import Callable
+
+from benchmarks.bulk_insert import make_expenses
+from benchmarks.columnar import COMMENTS
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.columnar_repository import ColumnarExpenseRepository
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.snapshot import SnapshotReader, export_ledger
+from bookkeeper.repository.sqlite_repository import SqliteRepository
+
+
+def seconds(action: Callable[[], object]) -> float:
+    """ Время выполнения action """
+    start = time.perf_counter()
+    action()
+    return time.perf_counter() - start
+
+
+def warm_from_sqlite(repo: SqliteRepository[Expense]) -> None:
+    """ Прогрев из SQLite: все расходы читаются и добавляются с сохранением id """
+    MemoryRepository[Expense]().restore_many(repo.get_all())
+
+
+def warm_from_snapshot(path: str) -> None:
+    """ Прогрев из снимка """
+    with SnapshotReader(path) as reader:
+        reader.load('expense', MemoryRepository[Expense]())
+
+
+def warm_columnar_from_sqlite(repo: SqliteRepository[Expense]) -> None:
+    """ Прогрев колоночного репозитория из SQLite """
+    ColumnarExpenseRepository().restore_many(repo.get_all())
+
+
+def warm_columnar_from_snapshot(path: str) -> None:
+    """ Прогрев колоночного репозитория из снимка: столбцы без объектов """
+    with SnapshotReader(path) as reader:
+        reader.load('expense', ColumnarExpenseRepository())
+
+
+def main() -> None:
+    """ Точка входа """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=200_000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, 'ledger.db')
+        path = os.path.join(tmp, 'ledger.snap')
+        cat_repo = SqliteRepository[Category](db_file, Category)
+        exp_repo = SqliteRepository[Expense](db_file, Expense)
+        cat_repo.add_many([Category(f'category {i}') for i in range(20)])
+        exps = make_expenses(args.rows)
+        for exp in exps:
+            exp.comment = COMMENTS[exp.amount % len(COMMENTS)]
+        exp_repo.add_many(exps)
+        export = seconds(lambda: export_ledger(path, cat_repo, exp_repo))
+        print(f'export:             {export:8.3f} s')
+        print(f'sqlite file:        {os.path.getsize(db_file) / 2**20:8.1f} MiB')
+        print(f'snapshot file:      {os.path.getsize(path) / 2**20:8.1f} MiB')
+        print(f'warm from sqlite:   {seconds(lambda: warm_from_sqlite(exp_repo)):8.3f} s')
+        print(f'warm from snapshot: {seconds(lambda: warm_from_snapshot(path)):8.3f} s')
+        print(f'columnar from sqlite:   '
+              f'{seconds(lambda: warm_columnar_from_sqlite(exp_repo)):8.3f} s')
+        print(f'columnar from snapshot: '
+              f'{seconds(lambda: warm_columnar_from_snapshot(path)):8.3f} s')
+        cat_repo.close()
+        exp_repo.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+"""
+Набор замеров производительности репозиториев и операций моделей
+на синтетических данных разного объема.
+
+Для каждого размера данных и каждого репозитория (memory, sqlite)
+строится дерево категорий и генерируются расходы, после чего замеряются
+операции add, get, get_all (с условием и без), get_all_like,
+Budget.update_spent и Category.get_subcategories (с индексом иерархии
+и без него), Category.get_all_parents с индексом, а также
+utils.read_tree для текста дерева категорий. Каждая операция выполняется
+несколько раз, в результат попадает время одного вызова: лучшее и медиана.
+
+Результаты записываются в JSON вместе с описанием окружения, чтобы
+сравнивать их между коммитами (ключ --compare).
+
+Запуск из корневой папки проекта:
+python -m benchmarks.suite --sizes 1000,100000,1000000 -o new.json
+python -m benchmarks.suite --sizes 1000,100000 --compare old.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Callable
+
+from benchmarks.bulk_insert import make_expenses
+from bookkeeper.models.budget import Budget
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import AbstractRepository
+from bookkeeper.repository.analytics import make_analytics
+from bookkeeper.repository.category_hierarchy import (
+    AbstractCategoryHierarchy, CategoryHierarchy, SqliteCategoryHierarchy)
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SqliteRepository
+from bookkeeper.utils import read_tree
+
+BACKENDS = ('memory', 'sqlite')
+
+
+def make_tree(n: int, fanout: int = 5) -> list[str]:
+    """
+    Сгенерировать текст дерева из n категорий, у каждой категории
+    не больше fanout подкатегорий (строки с отступами для read_tree)
+    """
+    children: dict[int, list[int]] = {i: [] for i in range(n)}
+    for i in range(1, n):
+        children[(i - 1) // fanout].append(i)
+    lines = []
+    stack = [(0, 0)]
+    while stack:
+        node, depth = stack.pop()
+        lines.append('    ' * depth + f'category {node}')
+        stack.extend((child, depth + 1) for child in reversed(children[node]))
+    return lines
+
+
+def measure(action: Callable[[], object], repeat: int,
+            calls: int = 1) -> dict[str, float]:
+    """
+    Выполнить action repeat раз и вернуть время одного вызова в секундах.
+    calls - сколько вызовов операции выполняет один запуск action
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        action()
+        times.append((time.perf_counter() - start) / calls)
+    return {'best': min(times), 'median': statistics.median(times)}
+
+
+def make_repos(backend: str, directory: str
+               ) -> tuple[AbstractRepository[Category], AbstractRepository[Expense]]:
+    """ Создать пустые репозитории категорий и расходов """
+    if backend == 'memory':
+        return MemoryRepository(), MemoryRepository()
+    db_file = os.path.join(directory, f'{backend}.db')
+    if os.path.exists(db_file):
+        os.remove(db_file)
+    return (SqliteRepository(db_file, Category),
+            SqliteRepository(db_file, Expense, indexes=('expense_date', 'category')))
+
+
+def make_hierarchy(cat_repo: AbstractRepository[Category]) -> AbstractCategoryHierarchy:
+    """ Создать индекс иерархии, подходящий для репозитория категорий """
+    if isinstance(cat_repo, SqliteRepository):
+        return SqliteCategoryHierarchy(cat_repo)
+    return CategoryHierarchy(cat_repo)
+
+
+def run_backend(backend: str, size: int, tree: list[str],
+                repeat: int, sample: int) -> list[dict[str, Any]]:
+    """ Замерить операции репозиториев backend на size расходах """
+    results = []
+
+    def record(operation: str, timing: dict[str, float]) -> None:
+        results.append({'backend': backend, 'size': size,
+                        'operation': operation, **timing})
+
+    rnd = random.Random(size)
+    with tempfile.TemporaryDirectory() as directory:
+        cat_repo, exp_repo = make_repos(backend, directory)
+        cats = Category.create_from_tree(read_tree(tree), cat_repo)
+        exps = make_expenses(size, categories=len(cats))
+        exp_repo.add_many(exps)
+        first, last = exps[0].expense_date, exps[-1].expense_date
+        middle = first + (last - first) / 2
+        pks = [rnd.choice(exps).pk for _ in range(sample)]
+        cat = rnd.choice(cats)
+
+        record('get', measure(lambda: [exp_repo.get(pk) for pk in pks],
+                              repeat, calls=sample))
+        record('get_all', measure(exp_repo.get_all, repeat))
+        record('get_all_where', measure(
+            lambda: exp_repo.get_all({'category': cat.pk}), repeat))
+        record('get_all_like', measure(
+            lambda: exp_repo.get_all_like({'comment': '99'}), repeat))
+        budget, total = Budget('Month'), make_analytics(exp_repo).total
+        record('update_spent', measure(
+            lambda: budget.update_spent(exp_repo, now=middle, total=total), repeat))
+        record('get_subcategories', measure(
+            lambda: list(cats[0].get_subcategories(cat_repo)), repeat))
+        hierarchy = make_hierarchy(cat_repo)
+        record('subcategories_idx', measure(
+            lambda: list(cats[0].get_subcategories(cat_repo, hierarchy)), repeat))
+        record('all_parents_idx', measure(
+            lambda: list(cats[-1].get_all_parents(cat_repo, hierarchy)), repeat))
+        new = make_expenses(sample * repeat, categories=len(cats))
+        batches = iter(range(0, len(new), sample))
+
+        def add_batch() -> None:
+            i = next(batches)
+            for exp in new[i:i + sample]:
+                exp_repo.add(exp)
+        record('add', measure(add_batch, repeat, calls=sample))
+        for repo in (cat_repo, exp_repo):
+            if isinstance(repo, SqliteRepository):
+                repo.close()
+    return results
+
+
+def environment() -> dict[str, Any]:
+    """ Описание окружения, в котором выполнялись замеры """
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+    }
+
+
+def run(sizes: list[int], categories: int, repeat: int, sample: int,
+        backends: tuple[str, ...] = BACKENDS) -> dict[str, Any]:
+    """ Выполнить все замеры и вернуть отчет """
+    tree = make_tree(categories)
+    results = [{'backend': 'utils', 'size': categories, 'operation': 'read_tree',
+                **measure(lambda: read_tree(tree), repeat)}]
+    for size in sizes:
+        for backend in backends:
+            results.extend(run_backend(backend, size, tree, repeat, sample))
+    return {'environment': environment(),
+            'parameters': {'sizes': sizes, 'categories': categories,
+                           'repeat': repeat, 'sample': sample},
+            'results': results}
+
+
+def result_key(result: dict[str, Any]) -> tuple[str, int, str]:
+    """ Ключ для сопоставления замеров разных запусков """
+    return result['backend'], result['size'], result['operation']
+
+
+def print_report(report: dict[str, Any], baseline: dict[str, Any] | None) -> None:
+    """
+    Вывести таблицу замеров. Если задан baseline (отчет предыдущего
+    запуска), вывести также отношение медиан: > 1 означает замедление
+    """
+    old = {result_key(r): r for r in baseline['results']} if baseline else {}
+    print(f'{"backend":<8}{"size":>10}  {"operation":<18}'
+          f'{"best, ms":>12}{"median, ms":>12}' + ('   vs base' if old else ''),
+          file=sys.stderr)
+    for result in report['results']:
+        line = (f'{result["backend"]:<8}{result["size"]:>10}  '
+                f'{result["operation"]:<18}'
+                f'{result["best"] * 1e3:>12.4f}{result["median"] * 1e3:>12.4f}')
+        prev = old.get(result_key(result))
+        if prev is not None and prev['median'] > 0:
+            line += f'{result["median"] / prev["median"]:>10.2f}x'
+        print(line, file=sys.stderr)
+
+
+def main() -> None:
+    """ Точка входа """
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='количества расходов через запятую')
+    parser.add_argument('--categories', type=int, default=200,
+                        help='количество категорий в дереве')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='количество повторов каждой операции')
+    parser.add_argument('--sample', type=int, default=1000,
+                        help='количество вызовов get и add в одном повторе')
+    parser.add_argument('--backend', choices=BACKENDS, action='append',
+                        help='замерять только этот репозиторий')
+    parser.add_argument('-o', '--output', help='файл для отчета в JSON '
+                                               '(по умолчанию - стандартный вывод)')
+    parser.add_argument('--compare', help='отчет предыдущего запуска в JSON')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            baseline = json.load(file)
+    report = run([int(size) for size in args.sizes.split(',')], args.categories,
+                 args.repeat, args.sample, tuple(args.backend or BACKENDS))
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
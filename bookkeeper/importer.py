@@ -0,0 +1,295 @@
+"""
+Потоковый импорт расходов из выписок в форматах CSV и OFX
+
+Файл читается построчно: парсеры (read_csv, read_ofx) выдают записи
+по одной, импортер (ExpenseImporter) преобразует их в расходы,
+определяет категории и добавляет расходы в репозиторий пакетами
+по chunk_size методом add_many, каждый пакет - в своей транзакции.
+Поэтому объем занятой памяти не зависит от размера файла.
+Записи, которые не удалось преобразовать, пропускаются и попадают
+в отчет об импорте вместе с причиной.
+"""
+import csv
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from itertools import islice
+from typing import Any, Iterable, Iterator, Mapping, NamedTuple, TextIO
+
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import AbstractRepository
+
+# форматы дат в CSV, кроме ISO 8601
+DATE_FORMATS = ('%d.%m.%Y %H:%M:%S', '%d.%m.%Y %H:%M', '%d.%m.%Y', '%d/%m/%Y')
+
+# дата OFX: YYYYMMDD[HH[MM[SS[.XXX]]]][смещение в часах[:название пояса]]
+_OFX_DATE = re.compile(r'(\d{8}(?:\d{2}){0,3})(?:\.\d+)?'
+                       r'(?:\[([+-]?\d+(?:\.\d+)?)(?::[^\]]*)?\])?')
+
+
+class Record(NamedTuple):
+    """
+    Запись выписки.
+    line - номер строки файла, с которой начинается запись
+    fields - значения полей: date, amount, category, comment
+    """
+    line: int
+    fields: dict[str, str]
+
+
+def read_csv(file: Iterable[str], columns: Mapping[str, str] | None = None,
+             delimiter: str = ',') -> Iterator[Record]:
+    """
+    Прочитать записи из CSV с заголовком.
+    columns - соответствие полей записи (date, amount, category, comment)
+    столбцам файла, по умолчанию столбцы называются так же, как поля
+    """
+    names = {'date': 'date', 'amount': 'amount',
+             'category': 'category', 'comment': 'comment', **(columns or {})}
+    reader = csv.DictReader(file, delimiter=delimiter)
+    for row in reader:
+        yield Record(reader.line_num, {name: row.get(column) or ''
+                                       for name, column in names.items()})
+
+
+_OFX_TAG = re.compile(r'<(/?)([A-Z0-9.]+)>([^<\r\n]*)')
+
+
+def read_ofx(file: Iterable[str]) -> Iterator[Record]:
+    """
+    Прочитать операции (STMTTRN) из выписки OFX в формате SGML или XML.
+    Списания (отрицательные TRNAMT) становятся записями с положительной
+    суммой, поступления - записями с отрицательной суммой, которые
+    импортер отклоняет. Комментарий составляется из NAME и MEMO.
+    """
+    current: dict[str, str] | None = None
+    start = 0
+    for number, line in enumerate(file, 1):
+        for closing, tag, value in _OFX_TAG.findall(line):
+            if tag == 'STMTTRN':
+                if closing and current is not None:
+                    yield _ofx_record(start, current)
+                    current = None
+                elif not closing:
+                    current, start = {}, number
+            elif current is not None and not closing:
+                current[tag] = value.strip()
+    if current is not None:
+        yield _ofx_record(start, current)
+
+
+def _ofx_record(line: int, tags: dict[str, str]) -> Record:
+    amount = tags.get('TRNAMT', '')
+    amount = amount[1:] if amount.startswith('-') else f'-{amount}'
+    comment = ' '.join(filter(None, (tags.get('NAME'), tags.get('MEMO'))))
+    return Record(line, {'date': tags.get('DTPOSTED', ''), 'amount': amount,
+                         'category': '', 'comment': comment})
+
+
+def parse_date(value: str) -> datetime:
+    """
+    Разобрать дату в формате ISO 8601, OFX (YYYYMMDDHHMMSS с необязательными
+    долями секунды и часовым поясом) или одном из DATE_FORMATS.
+    Даты ISO 8601 и OFX со смещением часового пояса переводятся в местное
+    время без часового пояса: репозитории сравнивают даты расходов между
+    собой, а сравнение дат с часовым поясом и без него невозможно.
+    """
+    value = value.strip()
+    ofx = _OFX_DATE.fullmatch(value)
+    if ofx is not None:
+        digits, offset = ofx.groups()
+        date = datetime.strptime(digits, '%Y%m%d%H%M%S'[:len(digits) - 2])
+        if offset is not None:
+            date = date.replace(tzinfo=timezone(timedelta(hours=float(offset))))
+            date = date.astimezone().replace(tzinfo=None)
+        return date
+    try:
+        date = datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    else:
+        if date.tzinfo is not None:
+            date = date.astimezone().replace(tzinfo=None)
+        return date
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            pass
+    raise ValueError(f'invalid date "{value}"')
+
+
+def parse_amount(value: str, scale: int = 1) -> int:
+    """
+    Разобрать сумму, умножить на scale (например, 100, чтобы хранить копейки)
+    и округлить до целого. Пробелы между разрядами и десятичная запятая
+    допускаются.
+    """
+    text = value.replace('\xa0', '').replace(' ', '').replace(',', '.')
+    try:
+        return int((Decimal(text) * scale).quantize(Decimal(1), ROUND_HALF_UP))
+    except (InvalidOperation, ValueError, OverflowError):
+        raise ValueError(f'invalid amount "{value}"') from None
+
+
+class CategoryResolver:
+    """
+    Определение категории расхода. Категория ищется по названию
+    без учета регистра. Если название не задано, категория выбирается
+    по правилам rules (подстрока комментария -> название категории),
+    иначе используется категория default.
+    create_missing - создавать категории верхнего уровня
+    для неизвестных названий
+    """
+
+    def __init__(self, repo: AbstractRepository[Category],
+                 rules: Mapping[str, str] | None = None, default: str | None = None,
+                 create_missing: bool = False) -> None:
+        self.repo = repo
+        self.rules = {key.lower(): name for key, name in (rules or {}).items()}
+        self.default = default
+        self.create_missing = create_missing
+        self._pks = {cat.name.lower(): cat.pk for cat in repo.get_all()}
+
+    def _lookup(self, name: str) -> int:
+        pk = self._pks.get(name.lower())
+        if pk is None:
+            if not self.create_missing:
+                raise ValueError(f'unknown category "{name}"')
+            pk = self._pks[name.lower()] = self.repo.add(Category(name))
+        return pk
+
+    def resolve(self, name: str, comment: str = '') -> int:
+        """ Получить id категории по названию name или комментарию comment """
+        if name:
+            return self._lookup(name)
+        text = comment.lower()
+        for key, rule_name in self.rules.items():
+            if key in text:
+                return self._lookup(rule_name)
+        if self.default is None:
+            raise ValueError('category is not specified')
+        return self._lookup(self.default)
+
+
+class Reject(NamedTuple):
+    """ Отклоненная запись: номер строки, причина и исходные поля """
+    line: int
+    reason: str
+    fields: dict[str, str]
+
+
+@dataclass
+class ImportReport:
+    """
+    Отчет об импорте.
+    read - количество прочитанных записей
+    imported - количество добавленных расходов
+    rejected - количество отклоненных записей
+    rejects - первые отклоненные записи (не больше max_rejects импортера)
+    chunks - количество транзакций
+    elapsed - время импорта в секундах
+    """
+    read: int = 0
+    imported: int = 0
+    rejected: int = 0
+    rejects: list[Reject] = field(default_factory=list)
+    chunks: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def rows_per_sec(self) -> float:
+        """ Скорость импорта в записях в секунду """
+        return self.read / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self) -> str:
+        return (f'read {self.read}, imported {self.imported}, '
+                f'rejected {self.rejected} in {self.elapsed:.2f} s '
+                f'({self.rows_per_sec:.0f} rows/s)')
+
+
+class ExpenseImporter:
+    """
+    Импорт записей выписки в репозиторий расходов.
+    chunk_size - количество записей в одной транзакции
+    scale - множитель сумм (см. parse_amount)
+    max_rejects - сколько отклоненных записей хранить в отчете
+    """
+
+    def __init__(self,  # pylint: disable=too-many-arguments
+                 exp_repo: AbstractRepository[Expense], resolver: CategoryResolver,
+                 chunk_size: int = 5000, scale: int = 1,
+                 max_rejects: int = 1000) -> None:
+        if chunk_size < 1:
+            raise ValueError(f'chunk size must be positive, got {chunk_size}')
+        self.exp_repo = exp_repo
+        self.resolver = resolver
+        self.chunk_size = chunk_size
+        self.scale = scale
+        self.max_rejects = max_rejects
+
+    def convert(self, record: Record, added: datetime) -> Expense:
+        """ Преобразовать запись в расход, ValueError - запись некорректна """
+        fields = record.fields
+        amount = parse_amount(fields['amount'], self.scale)
+        if amount <= 0:
+            raise ValueError(f'not an expense: amount {fields["amount"]}')
+        expense_date = parse_date(fields['date'])
+        comment = fields.get('comment', '').strip()
+        # категория определяется последней: resolver может создать новую
+        # категорию, и она не должна остаться от отклоненной записи
+        category = self.resolver.resolve(fields.get('category', '').strip(), comment)
+        return Expense(amount, category, expense_date, added, comment)
+
+    def run(self, records: Iterable[Record]) -> ImportReport:
+        """ Импортировать записи records и вернуть отчет """
+        report = ImportReport()
+        start = time.perf_counter()
+        added = datetime.now()
+        records = iter(records)
+        while chunk := list(islice(records, self.chunk_size)):
+            report.read += len(chunk)
+            exps = []
+            for record in chunk:
+                try:
+                    exps.append(self.convert(record, added))
+                except ValueError as error:
+                    report.rejected += 1
+                    if len(report.rejects) < self.max_rejects:
+                        report.rejects.append(Reject(record.line, str(error),
+                                                     record.fields))
+            if exps:
+                with self.exp_repo.transaction():
+                    self.exp_repo.add_many(exps)
+                report.imported += len(exps)
+                report.chunks += 1
+        report.elapsed = time.perf_counter() - start
+        return report
+
+
+def import_file(file: TextIO, exp_repo: AbstractRepository[Expense],
+                cat_repo: AbstractRepository[Category], file_format: str = 'csv',
+                **options: Any) -> ImportReport:
+    """
+    Импортировать выписку из открытого файла file в формате 'csv' или 'ofx'.
+    options - параметры CategoryResolver (rules, default, create_missing),
+    ExpenseImporter (chunk_size, scale, max_rejects) и read_csv
+    (columns, delimiter)
+    """
+    def pick(*names: str) -> dict[str, Any]:
+        return {name: options.pop(name) for name in names if name in options}
+    resolver = CategoryResolver(cat_repo, **pick('rules', 'default', 'create_missing'))
+    importer = ExpenseImporter(exp_repo, resolver,
+                               **pick('chunk_size', 'scale', 'max_rejects'))
+    if file_format == 'csv':
+        records = read_csv(file, **pick('columns', 'delimiter'))
+    elif file_format == 'ofx':
+        records = read_ofx(file)
+    else:
+        raise ValueError(f'unknown file format "{file_format}"')
+    if options:
+        raise TypeError(f'unexpected options: {", ".join(options)}')
+    return importer.run(records)
@@ -1,10 +1,29 @@
 from dataclasses import dataclass
 from datetime import datetime, timedelta
+from typing import Callable
 
 from bookkeeper.repository.abstract_repository import AbstractRepository
 from bookkeeper.models.expense import Expense
 
 
+def period_bounds(period: str, now: datetime) -> tuple[datetime, datetime]:
+    """
+    Получить границы периода (день, неделя или месяц), в который попадает
+    момент now. Возвращает пару (начало, конец), конец не входит в период.
+    """
+    start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == 'Day':
+        return start, start + timedelta(days=1)
+    if period == 'Week':
+        start -= timedelta(days=start.weekday())  # 1й день недели
+        return start, start + timedelta(days=7)
+    if period == 'Month':
+        start = start.replace(day=1)
+        next_month = (start + timedelta(days=31)).replace(day=1)
+        return start, next_month
+    raise ValueError(f'unknown period "{period}"')
+
+
 @dataclass
 class Budget:
     """
@@ -12,6 +31,12 @@ class Budget:
     period - название периода: день, неделя или месяц
     limit - максимальное ограничение на затраты за период,
     spent - сумма, потрачнная за период
+
+    Бюджет может пересчитываться целиком (update_spent) или отслеживать
+    траты инкрементально, подписавшись на изменения репозитория расходов
+    (subscribe). В инкрементальном режиме бюджет помнит вклад каждой
+    траты текущего периода и меняет spent на разницу, а при переходе
+    через границу периода переходит на новый период.
     """
 
     period: str
@@ -26,27 +51,91 @@ class Budget:
         self.limit = limit
         self.spent = spent
         self.pk = pk
+        self._exp_repo: AbstractRepository[Expense] | None = None
+        self._clock: Callable[[], datetime] = datetime.now
+        self._period_start = self._period_end = datetime.min
+        self._contributions: dict[int, int] = {}
 
-    """
-    Метод описывает изменение бюджета при тратах.
-    Рассматриваем изменения за день/неделю/месяц.
-    """
+    def update_spent(self, exp_repo: AbstractRepository[Expense],
+                     now: datetime | None = None,
+                     total: Callable[[datetime, datetime], int] | None = None) -> None:
+        """
+        Метод описывает изменение бюджета при тратах.
+        Рассматриваем изменения за день/неделю/месяц, в который попадает
+        момент now (по умолчанию - текущий).
+        total - функция, возвращающая сумму трат от start до end
+        включительно, например total отчета по расходам (analytics),
+        который для SQLite считает сумму запросом SUM в БД. По умолчанию
+        траты перебираются пакетами без загрузки всего списка в память.
+        """
+        start, end = period_bounds(self.period, now or datetime.now())
+        end -= timedelta(microseconds=1)
+        if total is not None:
+            self.spent = total(start, end)
+        else:
+            self.spent = sum(int(exp.amount)
+                             for exp in exp_repo.iter_between('expense_date', start, end))
+
+    def subscribe(self, exp_repo: AbstractRepository[Expense],
+                  clock: Callable[[], datetime] = datetime.now) -> None:
+        """
+        Включить инкрементальный режим: пересчитать траты за текущий
+        период и подписаться на изменения репозитория расходов.
+        clock - функция, возвращающая текущий момент
+        """
+        self.unsubscribe()
+        self._exp_repo = exp_repo
+        self._clock = clock
+        self._start_period(clock())
+        exp_repo.subscribe(self._on_expense)
+
+    def unsubscribe(self) -> None:
+        """ Выключить инкрементальный режим """
+        if self._exp_repo is not None:
+            self._exp_repo.unsubscribe(self._on_expense)
+            self._exp_repo = None
+        self._contributions.clear()
+
+    def roll_over(self) -> bool:
+        """
+        Перейти на новый период, если текущий закончился.
+        Вызывается при каждом событии репозитория, может также
+        вызываться периодически (например, по таймеру в интерфейсе).
+        Возвращает True, если период сменился.
+        """
+        if self._exp_repo is None:
+            return False
+        now = self._clock()
+        if self._period_start <= now < self._period_end:
+            return False
+        self._start_period(now)
+        return True
+
+    def is_consistent(self) -> bool:
+        """
+        Проверить, что инкрементально посчитанная сумма совпадает
+        с полным пересчетом по репозиторию расходов
+        """
+        if self._exp_repo is None:
+            return True
+        check = Budget(self.period)
+        check.update_spent(self._exp_repo, self._period_start)
+        return check.spent == self.spent
+
+    def _start_period(self, now: datetime) -> None:
+        assert self._exp_repo is not None
+        self._period_start, self._period_end = period_bounds(self.period, now)
+        exps_in_period = self._exp_repo.iter_between(
+            'expense_date', self._period_start,
+            self._period_end - timedelta(microseconds=1))
+        self._contributions = {exp.pk: int(exp.amount) for exp in exps_in_period}
+        self.spent = sum(self._contributions.values())
 
-    def update_spent(self, exp_repo: AbstractRepository[Expense]) -> None:
-        date = datetime.now().isoformat()[:10]  # YYYY-MM-DD format
-        if self.period == "Day":  # траты за день
-            date_mask = f"{date}"
-            exps_in_period = exp_repo.get_all_like(like={"expense_date": date_mask})
-        elif self.period == "Week":  # траты за неделю
-            weekday_now = datetime.now().weekday()
-            day_now = datetime.fromisoformat(date)
-            first_week_day = day_now - timedelta(days=weekday_now)  # 1й день недели
-            exps_in_period = []  # список всех трат за неделю
-            for i in range(7):
-                weekday = first_week_day + timedelta(days=i)
-                date_mask = f"{weekday.isoformat()[:10]}"
-                exps_in_period += exp_repo.get_all_like(like={"expense_date": date_mask})
-        elif self.period == "Month":  # траты за месяц
-            date_mask = f"{date[:7]}-"
-            exps_in_period = exp_repo.get_all_like(like={"expense_date": date_mask})
-        self.spent = sum([int(exp.amount) for exp in exps_in_period])
+    def _on_expense(self, event: str, pk: int, exp: Expense | None) -> None:
+        if self.roll_over():
+            return  # новый период уже посчитан полностью
+        self.spent -= self._contributions.pop(pk, 0)
+        if event != 'delete' and exp is not None \
+                and self._period_start <= exp.expense_date < self._period_end:
+            self._contributions[pk] = int(exp.amount)
+            self.spent += int(exp.amount)
@@ -3,10 +3,13 @@
 """
 from collections import defaultdict
 from dataclasses import dataclass
-from typing import Iterator
+from typing import TYPE_CHECKING, Iterable, Iterator, Sequence
 
 from ..repository.abstract_repository import AbstractRepository
 
+if TYPE_CHECKING:
+    from ..repository.category_hierarchy import AbstractCategoryHierarchy
+
 
 @dataclass
 class Category:
@@ -38,7 +41,8 @@ class Category:
         return repo.get(self.parent)
 
     def get_all_parents(self,
-                        repo: AbstractRepository['Category']
+                        repo: AbstractRepository['Category'],
+                        hierarchy: 'AbstractCategoryHierarchy | None' = None
                         ) -> Iterator['Category']:
         """
         Получить все категории верхнего уровня в иерархии.
@@ -46,11 +50,17 @@ class Category:
         Parameters
         ----------
         repo - репозиторий для получения объектов
+        hierarchy - индекс иерархии категорий repo (CategoryHierarchy или
+        SqliteCategoryHierarchy); если задан, родители берутся из индекса
+        вместо запроса get для каждого уровня
 
         Yields
         -------
         Объекты Category от родителя и выше до категории верхнего уровня
         """
+        if hierarchy is not None:
+            yield from hierarchy.ancestors(self.pk)
+            return
         parent = self.get_parent(repo)
         if parent is None:
             return
@@ -58,7 +68,8 @@ class Category:
         yield from parent.get_all_parents(repo)
 
     def get_subcategories(self,
-                          repo: AbstractRepository['Category']
+                          repo: AbstractRepository['Category'],
+                          hierarchy: 'AbstractCategoryHierarchy | None' = None
                           ) -> Iterator['Category']:
         """
         Получить все подкатегории из иерархии, т.е. непосредственные
@@ -67,6 +78,8 @@ class Category:
         Parameters
         ----------
         repo - репозиторий для получения объектов
+        hierarchy - индекс иерархии категорий repo; если задан, подкатегории
+        берутся из индекса вместо построения дерева по repo.get_all()
 
         Yields
         -------
@@ -80,6 +93,9 @@ class Category:
                 yield x
                 yield from get_children(graph, x.pk)
 
+        if hierarchy is not None:
+            return iter(hierarchy.descendants(self.pk))
+
         subcats = defaultdict(list)
         for cat in repo.get_all():
             subcats[cat.parent].append(cat)
@@ -100,6 +116,11 @@ class Category:
         со стороны СУБД, результат, возможно, будет корректным, если исходные
         данные корректны за исключением сортировки. Если нет, то нет.
         "Мусор на входе, мусор на выходе".
+        Родитель ищется по названию, поэтому названия категорий должны
+        быть уникальными; для деревьев с повторяющимися названиями
+        используйте create_from_paths.
+        Все категории добавляются в одной транзакции репозитория:
+        при ошибке ни одна из них не сохраняется.
 
         Parameters
         ----------
@@ -111,8 +132,79 @@ class Category:
         Список созданных объектов Category
         """
         created: dict[str, Category] = {}
-        for child, parent in tree:
-            cat = cls(child, created[parent].pk if parent is not None else None)
-            repo.add(cat)
-            created[child] = cat
+        with repo.transaction():
+            for child, parent in tree:
+                cat = cls(child, created[parent].pk if parent is not None else None)
+                repo.add(cat)
+                created[child] = cat
         return list(created.values())
+
+    @classmethod
+    def create_from_paths(  # pylint: disable=too-many-arguments
+            cls,
+            paths: Iterable[Sequence[str]],
+            repo: AbstractRepository['Category'],
+            batch_size: int = 1000,
+            separator: str | None = None) -> list['Category']:
+        """
+        Создать дерево категорий из путей (кортежей названий от категории
+        верхнего уровня до самой категории), например, полученных
+        из utils.iter_tree_paths. Путь каждой категории должен идти после
+        пути ее родителя и до путей категорий из других ветвей (порядок
+        обхода в глубину). Родитель ищется по пути, а не по названию,
+        поэтому одинаковые названия на разных уровнях и в разных ветвях
+        допустимы.
+        Пути читаются порциями по batch_size, каждая порция добавляется
+        по уровням: все категории одного уровня одним вызовом add_many.
+        Для поиска родителей хранятся только категории на пути к текущей,
+        поэтому пути можно читать потоком из файла.
+        Все категории добавляются в одной транзакции репозитория:
+        при ошибке ни одна из них не сохраняется.
+
+        Parameters
+        ----------
+        paths - пути категорий в порядке обхода в глубину
+        repo - репозиторий для сохранения объектов
+        batch_size - сколько категорий добавляется за одну порцию
+        separator - если задан, в название категории записывается весь
+        путь через separator, иначе - последнее название пути
+
+        Returns
+        -------
+        Список созданных объектов Category в порядке путей
+        """
+        if batch_size < 1:
+            raise ValueError(f'batch size must be positive, got {batch_size}')
+        created: list[Category] = []
+        ancestors: list[Category] = []  # категории текущего пути
+        current: tuple[str, ...] = ()
+        levels: dict[int, list[tuple[Category, Category | None]]] = defaultdict(list)
+        pending = 0
+
+        def flush() -> None:
+            for depth in sorted(levels):
+                cats = []
+                for cat, parent in levels[depth]:
+                    cat.parent = None if parent is None else parent.pk
+                    cats.append(cat)
+                repo.add_many(cats)
+            levels.clear()
+
+        with repo.transaction():
+            for path in paths:
+                path = tuple(path)
+                depth = len(path) - 1
+                if depth < 0 or path[:-1] != current[:depth]:
+                    raise ValueError(f'parent of category {path} must precede it')
+                cat = cls(separator.join(path) if separator is not None else path[-1])
+                del ancestors[depth:]
+                levels[depth].append((cat, ancestors[-1] if ancestors else None))
+                ancestors.append(cat)
+                created.append(cat)
+                current = path
+                pending += 1
+                if pending == batch_size:
+                    flush()
+                    pending = 0
+            flush()
+        return created
@@ -7,8 +7,13 @@
 использовать его для иных целей.
 """
 
+import threading
 from abc import ABC, abstractmethod
-from typing import Generic, TypeVar, Protocol, Any
+from contextlib import contextmanager
+from typing import Callable, Generic, Iterable, Iterator, TypeVar, Protocol, Any, Sequence
+
+from bookkeeper.repository.expressions import Where
+from bookkeeper.repository.query import OrderBy, select
 
 
 class Model(Protocol):  # pylint: disable=too-few-public-methods
@@ -20,6 +25,10 @@ class Model(Protocol):  # pylint: disable=too-few-public-methods
 
 T = TypeVar('T', bound=Model)
 
+# Подписчик на изменения репозитория. Получает название события
+# ('add', 'update' или 'delete'), id объекта и сам объект (None при удалении)
+Listener = Callable[[str, int, Any], None]
+
 
 class AbstractRepository(ABC, Generic[T]):
     """
@@ -31,8 +40,74 @@ class AbstractRepository(ABC, Generic[T]):
     get_all_like
     update
     delete
+
+    Массовые операции add_many, update_many и delete_many по умолчанию
+    выполняют соответствующую операцию для каждого объекта, наследники
+    могут переопределить их более эффективной реализацией.
+
+    На изменения репозитория можно подписаться методом subscribe.
+    Наследники вызывают _notify после каждого успешного изменения.
+
+    Несколько изменений можно объединить в транзакцию (transaction).
+    События изменений внутри транзакции доставляются подписчикам
+    после ее успешного завершения и отбрасываются при откате.
     """
 
+    def __init__(self) -> None:
+        self._listeners: list[Listener] = []
+        self._deferred = threading.local()
+
+    def subscribe(self, listener: Listener) -> None:
+        """ Подписать listener на события add, update и delete """
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener: Listener) -> None:
+        """ Отписать listener от событий репозитория """
+        self._listeners.remove(listener)
+
+    def _notify(self, event: str, pk: int, obj: T | None) -> None:
+        events = getattr(self._deferred, 'events', None)
+        if events is not None:
+            events.append((event, pk, obj))
+            return
+        for listener in self._listeners:
+            listener(event, pk, obj)
+
+    @property
+    def events_deferred(self) -> bool:
+        """ Отложены ли события текущего потока (идет транзакция) """
+        return getattr(self._deferred, 'events', None) is not None
+
+    @contextmanager
+    def deferred_events(self) -> Iterator[None]:
+        """
+        Отложить доставку событий текущего потока до конца блока with.
+        При успешном завершении блока события доставляются подписчикам,
+        при исключении - отбрасываются. Вложенные блоки входят во внешний.
+        """
+        if getattr(self._deferred, 'events', None) is not None:
+            yield
+            return
+        events: list[tuple[str, int, T | None]] = []
+        self._deferred.events = events
+        try:
+            yield
+        finally:
+            self._deferred.events = None
+        for event in events:
+            self._notify(*event)
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        Выполнить изменения в блоке with как одну транзакцию.
+        Реализация по умолчанию только откладывает события до конца
+        блока, наследники с поддержкой транзакций также фиксируют
+        изменения один раз и откатывают их при исключении.
+        """
+        with self.deferred_events():
+            yield
+
     @abstractmethod
     def add(self, obj: T) -> int:
         """
@@ -45,10 +120,11 @@ class AbstractRepository(ABC, Generic[T]):
         """ Получить объект по id """
 
     @abstractmethod
-    def get_all(self, where: dict[str, Any] | None = None) -> list[T]:
+    def get_all(self, where: Where = None) -> list[T]:
         """
         Получить все записи по некоторому условию
         where - условие в виде словаря {'название_поля': значение}
+        или Expression (см. модуль expressions)
         если условие не задано (по умолчанию), вернуть все записи
         """
 
@@ -59,6 +135,46 @@ class AbstractRepository(ABC, Generic[T]):
         like - условие в виде словаря {'название_поля': значение}
         """
 
+    def iter_all(self, where: Where = None,
+                 batch_size: int = 1000) -> Iterator[T]:
+        """
+        Перебрать все записи по условию where, как в get_all, не загружая
+        их все сразу. batch_size - сколько записей читается за один раз.
+        Реализация по умолчанию загружает все записи методом get_all.
+        """
+        return iter(self.get_all(where))
+
+    def get_between(self, field: str, lo: Any, hi: Any) -> list[T]:
+        """
+        Получить все записи, у которых значение поля field лежит
+        в диапазоне от lo до hi включительно.
+        Реализация по умолчанию перебирает все записи, наследники
+        могут переопределить метод для использования индекса.
+        """
+        return [obj for obj in self.get_all()
+                if lo <= getattr(obj, field) <= hi]
+
+    def iter_between(self, field: str, lo: Any, hi: Any,
+                     batch_size: int = 1000) -> Iterator[T]:
+        """
+        Перебрать записи со значением поля field от lo до hi включительно,
+        как в get_between, не загружая их все сразу
+        """
+        return iter(self.get_between(field, lo, hi))
+
+    def query(self,  # pylint: disable=too-many-arguments
+              fields: Sequence[str] | None = None, where: Where = None,
+              order_by: OrderBy = None, limit: int | None = None,
+              after: Any = None) -> list[Any]:
+        """
+        Получить записи по условию where в порядке order_by, не больше
+        limit, следующие за записью after (см. модуль query).
+        fields - вернуть вместо объектов именованные кортежи с этими полями
+        Реализация по умолчанию перебирает записи iter_all и выбирает
+        первые limit кучей, наследники могут выполнять выборку в БД.
+        """
+        return select(self.iter_all(where), fields, order_by, limit, after)
+
     @abstractmethod
     def update(self, obj: T) -> None:
         """ Обновить данные об объекте. Объект должен содержать поле pk. """
@@ -66,3 +182,29 @@ class AbstractRepository(ABC, Generic[T]):
     @abstractmethod
     def delete(self, pk: int) -> None:
         """ Удалить запись """
+
+    def add_many(self, objs: Iterable[T]) -> list[int]:
+        """
+        Добавить несколько объектов в репозиторий, вернуть список id,
+        также записать id в атрибут pk каждого объекта.
+        """
+        return [self.add(obj) for obj in objs]
+
+    def restore_many(self, objs: Iterable[T]) -> None:
+        """
+        Добавить объекты с уже заполненными id (например, при загрузке
+        резервной копии), сохранив их id. Репозиторий, который
+        не поддерживает заданные извне id, выбрасывает NotImplementedError.
+        """
+        raise NotImplementedError(
+            f'{type(self).__name__} does not support restoring objects with ids')
+
+    def update_many(self, objs: Iterable[T]) -> None:
+        """ Обновить данные о нескольких объектах """
+        for obj in objs:
+            self.update(obj)
+
+    def delete_many(self, pks: Iterable[int]) -> None:
+        """ Удалить несколько записей """
+        for pk in pks:
+            self.delete(pk)
@@ -0,0 +1,242 @@
+"""
+Модуль описывает материализованные агрегаты по расходам
+
+Агрегаты хранят сумму и количество расходов по парам (категория, день)
+и их свертки по неделям и месяцам. Агрегаты обновляются при каждом
+изменении репозитория расходов, поэтому запросы вида "сумма по категориям
+за этот месяц" не требуют чтения самих расходов и выполняются
+за O(количество категорий).
+
+Период обозначается строковым ключом: 'YYYY-MM-DD' для дня,
+дата понедельника 'YYYY-MM-DD' для недели и 'YYYY-MM' для месяца.
+"""
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Any, NamedTuple
+
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import AbstractRepository
+from bookkeeper.repository.sqlite_repository import SqliteRepository
+
+GRANULARITIES = ('day', 'week', 'month')
+
+
+class Totals(NamedTuple):
+    """ Сумма и количество расходов """
+    total: int
+    count: int
+
+
+def period_key(granularity: str, date: datetime) -> str:
+    """ Получить ключ периода granularity, в который попадает дата date """
+    if granularity == 'day':
+        return date.strftime('%Y-%m-%d')
+    if granularity == 'week':
+        return (date - timedelta(days=date.weekday())).strftime('%Y-%m-%d')
+    if granularity == 'month':
+        return date.strftime('%Y-%m')
+    raise ValueError(f'unknown granularity "{granularity}"')
+
+
+class AbstractAggregates(ABC):
+    """
+    Абстрактные агрегаты по расходам.
+    Абстрактные методы:
+    by_category
+    series
+    """
+
+    @abstractmethod
+    def by_category(self, granularity: str, date: datetime) -> dict[int, Totals]:
+        """
+        Получить суммы по категориям за период granularity
+        ('day', 'week' или 'month'), в который попадает дата date
+        """
+
+    @abstractmethod
+    def series(self, granularity: str, category: int | None = None,
+               start: datetime | None = None,
+               end: datetime | None = None) -> dict[str, Totals]:
+        """
+        Получить суммы по периодам granularity, упорядоченные по ключу периода.
+        category - учитывать только эту категорию (по умолчанию - все)
+        start, end - учитывать только периоды, в которые попадают даты
+        от start до end включительно
+        """
+
+
+class MemoryAggregates(AbstractAggregates):
+    """
+    Агрегаты в оперативной памяти, обновляемые по событиям репозитория.
+    Подходят для любого репозитория расходов.
+    """
+
+    def __init__(self, repo: AbstractRepository[Expense]) -> None:
+        self.repo = repo
+        # гранулярность -> ключ периода -> категория -> [сумма, количество]
+        self._data: dict[str, dict[str, dict[int, list[int]]]] = {
+            g: {} for g in GRANULARITIES}
+        # pk -> (категория, дата, сумма), под которыми учтен расход
+        self._seen: dict[int, tuple[int, datetime, int]] = {}
+        for exp in repo.iter_all():
+            self._account(exp.pk, exp)
+        repo.subscribe(self._on_expense)
+
+    def close(self) -> None:
+        """ Отписаться от событий репозитория """
+        self.repo.unsubscribe(self._on_expense)
+
+    def _apply(self, category: int, date: datetime, amount: int, sign: int) -> None:
+        for granularity, periods in self._data.items():
+            key = period_key(granularity, date)
+            cats = periods.setdefault(key, {})
+            cell = cats.setdefault(category, [0, 0])
+            cell[0] += sign * amount
+            cell[1] += sign
+            if cell[1] == 0:
+                del cats[category]
+                if not cats:
+                    del periods[key]
+
+    def _account(self, pk: int, exp: Expense) -> None:
+        seen = (exp.category, exp.expense_date, int(exp.amount))
+        self._seen[pk] = seen
+        self._apply(*seen, sign=1)
+
+    def _on_expense(self, event: str, pk: int, exp: Expense | None) -> None:
+        seen = self._seen.pop(pk, None)
+        if seen is not None:
+            self._apply(*seen, sign=-1)
+        if event != 'delete' and exp is not None:
+            self._account(pk, exp)
+
+    def by_category(self, granularity: str, date: datetime) -> dict[int, Totals]:
+        cats = self._data[granularity].get(period_key(granularity, date), {})
+        return {cat: Totals(*cell) for cat, cell in cats.items()}
+
+    def series(self, granularity: str, category: int | None = None,
+               start: datetime | None = None,
+               end: datetime | None = None) -> dict[str, Totals]:
+        lo = period_key(granularity, start) if start is not None else None
+        hi = period_key(granularity, end) if end is not None else None
+        result = {}
+        for key in sorted(self._data[granularity]):
+            if (lo is not None and key < lo) or (hi is not None and key > hi):
+                continue
+            cats = self._data[granularity][key]
+            if category is None:
+                result[key] = Totals(sum(c[0] for c in cats.values()),
+                                     sum(c[1] for c in cats.values()))
+            elif category in cats:
+                result[key] = Totals(*cats[category])
+        return result
+
+
+# выражения SQLite для ключа периода, совпадающие с period_key
+SQL_PERIOD = {
+    'day': "date({})",
+    'week': "date({}, 'weekday 0', '-6 days')",
+    'month': "strftime('%Y-%m', {})",
+}
+
+
+class SqliteAggregates(AbstractAggregates):
+    """
+    Агрегаты в таблице БД SQLite, которая поддерживается триггерами
+    на таблице расходов. Изменения агрегатов происходят в той же
+    транзакции, что и изменения расходов.
+    """
+
+    def __init__(self, repo: SqliteRepository[Expense]) -> None:
+        self.repo = repo
+        self.table_name = f'{repo.table_name}_totals'
+        with repo.pool.transaction() as con:
+            exists = con.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                (self.table_name,)).fetchone()
+            con.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.table_name} ('
+                'granularity TEXT, period TEXT, category INTEGER, '
+                'total INTEGER, cnt INTEGER, '
+                'PRIMARY KEY (granularity, period, category)) WITHOUT ROWID')
+            for sql in self._triggers_sql():
+                con.execute(sql)
+            if exists is None:
+                self._fill(con)
+
+    def _upsert_sql(self, row: str) -> list[str]:
+        return [
+            f'INSERT INTO {self.table_name} VALUES '
+            f"('{g}', {SQL_PERIOD[g].format(f'{row}.expense_date')}, "
+            f'{row}.category, {row}.amount, 1) '
+            f'ON CONFLICT (granularity, period, category) DO UPDATE '
+            f'SET total = total + excluded.total, cnt = cnt + 1;'
+            for g in GRANULARITIES]
+
+    def _subtract_sql(self, row: str) -> list[str]:
+        statements = []
+        for g in GRANULARITIES:
+            key = (f"granularity = '{g}' "
+                   f"AND period = {SQL_PERIOD[g].format(f'{row}.expense_date')} "
+                   f'AND category = {row}.category')
+            statements.append(
+                f'UPDATE {self.table_name} '
+                f'SET total = total - {row}.amount, cnt = cnt - 1 WHERE {key};')
+            statements.append(f'DELETE FROM {self.table_name} WHERE {key} AND cnt = 0;')
+        return statements
+
+    def _triggers_sql(self) -> list[str]:
+        table = self.repo.table_name
+        bodies = {
+            'insert': self._upsert_sql('NEW'),
+            'delete': self._subtract_sql('OLD'),
+            'update OF amount, category, expense_date':
+                self._subtract_sql('OLD') + self._upsert_sql('NEW'),
+        }
+        return [
+            f'CREATE TRIGGER IF NOT EXISTS {self.table_name}_{event.split()[0]} '
+            f'AFTER {event.upper()} ON {table} BEGIN {" ".join(body)} END'
+            for event, body in bodies.items()]
+
+    def _fill(self, con: Any) -> None:
+        for g in GRANULARITIES:
+            period = SQL_PERIOD[g].format('expense_date')
+            con.execute(
+                f'INSERT INTO {self.table_name} '
+                f"SELECT '{g}', {period}, category, sum(amount), count(*) "
+                f'FROM {self.repo.table_name} GROUP BY {period}, category')
+
+    def rebuild(self) -> None:
+        """ Пересчитать агрегаты по таблице расходов """
+        with self.repo.pool.transaction() as con:
+            con.execute(f'DELETE FROM {self.table_name}')
+            self._fill(con)
+
+    def by_category(self, granularity: str, date: datetime) -> dict[int, Totals]:
+        with self.repo.pool.connection() as con:
+            rows = con.execute(
+                f'SELECT category, total, cnt FROM {self.table_name} '
+                'WHERE granularity = ? AND period = ?',
+                (granularity, period_key(granularity, date))).fetchall()
+        return {cat: Totals(total, cnt) for cat, total, cnt in rows}
+
+    def series(self, granularity: str, category: int | None = None,
+               start: datetime | None = None,
+               end: datetime | None = None) -> dict[str, Totals]:
+        conditions = ['granularity = ?']
+        params: list[Any] = [granularity]
+        if category is not None:
+            conditions.append('category = ?')
+            params.append(category)
+        if start is not None:
+            conditions.append('period >= ?')
+            params.append(period_key(granularity, start))
+        if end is not None:
+            conditions.append('period <= ?')
+            params.append(period_key(granularity, end))
+        with self.repo.pool.connection() as con:
+            rows = con.execute(
+                f'SELECT period, sum(total), sum(cnt) FROM {self.table_name} '
+                f'WHERE {" AND ".join(conditions)} GROUP BY period ORDER BY period',
+                params).fetchall()
+        return {key: Totals(total, cnt) for key, total, cnt in rows}
@@ -0,0 +1,349 @@
+"""
+Модуль описывает отчеты по расходам
+
+Отчеты группируют расходы по категориям, поддеревьям категорий, дням,
+неделям или месяцам, считают скользящие средние и выбирают наибольшие
+группы и расходы. Для любого репозитория расходы перебираются пакетами
+(iter_all, iter_between) без загрузки всего списка в память. Для SQLite
+группировка выполняется в БД запросом с GROUP BY, для колоночного
+репозитория - проходом по столбцам без создания объектов, для
+секционированного - запросами только к разделам, пересекающимся
+с периодом отчета.
+
+Отчет для репозитория создается функцией make_analytics.
+"""
+import heapq
+from datetime import datetime, timedelta
+from typing import Any, Hashable, Iterable, Iterator
+
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import AbstractRepository
+from bookkeeper.repository.aggregates import GRANULARITIES, SQL_PERIOD, Totals, period_key
+from bookkeeper.repository.category_hierarchy import (
+    AbstractCategoryHierarchy, SqliteCategoryHierarchy)
+from bookkeeper.repository.columnar_repository import ColumnarExpenseRepository
+from bookkeeper.repository.partitioned_repository import PartitionedExpenseRepository
+from bookkeeper.repository.sqlite_repository import SqliteRepository, quote
+
+GROUPINGS = ('category', *GRANULARITIES)
+
+
+def periods(granularity: str, start: datetime, end: datetime) -> list[str]:
+    """
+    Получить ключи всех периодов granularity ('day', 'week' или 'month'),
+    в которые попадают даты от start до end включительно, по порядку
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f'unknown granularity "{granularity}"')
+    date = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == 'week':
+        date -= timedelta(days=date.weekday())
+    elif granularity == 'month':
+        date = date.replace(day=1)
+    keys = []
+    while date <= end:
+        keys.append(period_key(granularity, date))
+        if granularity == 'month':
+            date = (date + timedelta(days=31)).replace(day=1)
+        else:
+            date += timedelta(days=7 if granularity == 'week' else 1)
+    return keys
+
+
+def period_start(key: str) -> datetime:
+    """ Получить начало периода по ключу периода """
+    return datetime.fromisoformat(key if len(key) > 7 else f'{key}-01')
+
+
+class ExpenseAnalytics:
+    """
+    Отчеты по расходам для любого репозитория. Расходы перебираются
+    пакетами по batch_size, в памяти хранятся только итоги групп.
+    Во всех методах start, end - учитывать только расходы с датой
+    от start до end включительно, where - условие на равенство полей.
+    """
+
+    def __init__(self, repo: AbstractRepository[Expense],
+                 batch_size: int = 1000) -> None:
+        self.repo = repo
+        self.batch_size = batch_size
+
+    def _expenses(self, where: dict[str, Any] | None,
+                  start: datetime | None, end: datetime | None) -> Iterator[Expense]:
+        if start is None and end is None:
+            yield from self.repo.iter_all(where, self.batch_size)
+            return
+        exps = self.repo.iter_between('expense_date', start or datetime.min,
+                                      end or datetime.max, self.batch_size)
+        for exp in exps:
+            if not where or all(getattr(exp, attr) == value
+                                for attr, value in where.items()):
+                yield exp
+
+    def totals(self, by: str, start: datetime | None = None,
+               end: datetime | None = None,
+               where: dict[str, Any] | None = None) -> dict[Any, Totals]:
+        """
+        Получить суммы и количества расходов по группам by: 'category'
+        (ключ - id категории) или 'day', 'week', 'month' (ключ периода,
+        как в aggregates.period_key). Группы упорядочены по ключу.
+        """
+        if by not in GROUPINGS:
+            raise ValueError(f'unknown grouping "{by}"')
+        groups: dict[Any, list[int]] = {}
+        for exp in self._expenses(where, start, end):
+            key = exp.category if by == 'category' else period_key(by, exp.expense_date)
+            cell = groups.setdefault(key, [0, 0])
+            cell[0] += int(exp.amount)
+            cell[1] += 1
+        return {key: Totals(*groups[key]) for key in sorted(groups)}
+
+    def total(self, start: datetime | None = None, end: datetime | None = None,
+              where: dict[str, Any] | None = None) -> int:
+        """ Получить сумму расходов """
+        return sum(int(exp.amount) for exp in self._expenses(where, start, end))
+
+    def subtree_totals(self, hierarchy: AbstractCategoryHierarchy,
+                       pks: Iterable[int], start: datetime | None = None,
+                       end: datetime | None = None) -> dict[int, Totals]:
+        """
+        Получить суммы и количества расходов в каждой категории из pks
+        вместе со всеми ее подкатегориями
+        """
+        by_category = self.totals('category', start, end)
+        result = {}
+        for pk in pks:
+            cells = [by_category[cat] for cat in hierarchy.subtree(pk)
+                     if cat in by_category]
+            result[pk] = Totals(sum(c.total for c in cells), sum(c.count for c in cells))
+        return result
+
+    def rolling_average(self,  # pylint: disable=too-many-arguments
+                        granularity: str, window: int,
+                        start: datetime | None = None, end: datetime | None = None,
+                        where: dict[str, Any] | None = None) -> dict[str, float]:
+        """
+        Получить скользящее среднее сумм расходов по периодам granularity
+        за window последних периодов, включая текущий. Периоды без расходов
+        учитываются с нулевой суммой. В начале ряда, пока периодов меньше
+        window, среднее берется по имеющимся периодам. Если start или end
+        не заданы, ряд начинается (заканчивается) периодом первого
+        (последнего) расхода.
+        """
+        if window < 1:
+            raise ValueError(f'window must be positive, got {window}')
+        series = self.totals(granularity, start, end, where)
+        if not series:
+            return {}
+        keys = periods(granularity, start or period_start(min(series)),
+                       end or period_start(max(series)))
+        result = {}
+        current = 0
+        for i, key in enumerate(keys):
+            current += series[key].total if key in series else 0
+            if i >= window:
+                old = keys[i - window]
+                current -= series[old].total if old in series else 0
+            result[key] = current / min(i + 1, window)
+        return result
+
+    def top(self, n: int, by: str = 'category', start: datetime | None = None,
+            end: datetime | None = None,
+            where: dict[str, Any] | None = None) -> list[tuple[Hashable, Totals]]:
+        """ Получить n групп by с наибольшей суммой расходов по убыванию суммы """
+        groups = self.totals(by, start, end, where)
+        return heapq.nlargest(n, groups.items(), key=lambda item: item[1].total)
+
+    def top_expenses(self, n: int, start: datetime | None = None,
+                     end: datetime | None = None,
+                     where: dict[str, Any] | None = None) -> list[Expense]:
+        """ Получить n наибольших расходов по убыванию суммы """
+        return heapq.nlargest(n, self._expenses(where, start, end),
+                              key=lambda exp: exp.amount)
+
+
+class SqliteExpenseAnalytics(ExpenseAnalytics):
+    """
+    Отчеты по расходам для SQLite: группировка, суммирование и выбор
+    наибольших расходов выполняются в БД, в Python передаются только итоги
+    """
+
+    repo: SqliteRepository[Expense]
+
+    def __init__(self, repo: SqliteRepository[Expense], batch_size: int = 1000) -> None:
+        super().__init__(repo, batch_size)
+
+    def _condition(self, where: dict[str, Any] | None, start: datetime | None,
+                   end: datetime | None, alias: str = '') -> tuple[str, list[Any]]:
+        conditions, params = [], []
+        for attr, value in (where or {}).items():
+            if attr not in self.repo.fields:
+                raise ValueError(f'unknown field "{attr}"')
+            conditions.append(f'{alias}{quote(attr)} = ?')
+            params.append(value)
+        if start is not None:
+            conditions.append(f'{alias}expense_date >= ?')
+            params.append(start)
+        if end is not None:
+            conditions.append(f'{alias}expense_date <= ?')
+            params.append(end)
+        return (f' WHERE {" AND ".join(conditions)}' if conditions else ''), params
+
+    def totals(self, by: str, start: datetime | None = None,
+               end: datetime | None = None,
+               where: dict[str, Any] | None = None) -> dict[Any, Totals]:
+        if by not in GROUPINGS:
+            raise ValueError(f'unknown grouping "{by}"')
+        key = 'category' if by == 'category' else SQL_PERIOD[by].format('expense_date')
+        condition, params = self._condition(where, start, end)
+        with self.repo.pool.connection() as con:
+            rows = con.execute(
+                f'SELECT {key}, sum(amount), count(*) FROM {self.repo.table_name}'
+                f'{condition} GROUP BY 1 ORDER BY 1', params).fetchall()
+        return {group: Totals(total, cnt) for group, total, cnt in rows}
+
+    def total(self, start: datetime | None = None, end: datetime | None = None,
+              where: dict[str, Any] | None = None) -> int:
+        condition, params = self._condition(where, start, end)
+        with self.repo.pool.connection() as con:
+            return int(con.execute(
+                f'SELECT coalesce(sum(amount), 0) FROM {self.repo.table_name}'
+                f'{condition}', params).fetchone()[0])
+
+    def subtree_totals(self, hierarchy: AbstractCategoryHierarchy,
+                       pks: Iterable[int], start: datetime | None = None,
+                       end: datetime | None = None) -> dict[int, Totals]:
+        """
+        Получить суммы по поддеревьям. Если иерархия хранится в таблице
+        замыкания той же БД, суммы считаются одним запросом с соединением
+        таблицы расходов и таблицы замыкания.
+        """
+        pks = list(pks)
+        if not isinstance(hierarchy, SqliteCategoryHierarchy):
+            return super().subtree_totals(hierarchy, pks, start, end)
+        condition, params = self._condition(None, start, end, alias='e.')
+        condition = condition.replace(' WHERE ', ' AND ', 1)
+        with self.repo.pool.connection() as con:
+            rows = con.execute(
+                f'SELECT c.ancestor, sum(e.amount), count(*) '
+                f'FROM {self.repo.table_name} e '
+                f'JOIN {hierarchy.table_name} c ON e.category = c.descendant '
+                f'WHERE c.ancestor IN ({", ".join("?" * len(pks))}){condition} '
+                f'GROUP BY c.ancestor', [*pks, *params]).fetchall()
+        found = {pk: Totals(total, cnt) for pk, total, cnt in rows}
+        return {pk: found.get(pk, Totals(0, 0)) for pk in pks}
+
+    def top_expenses(self, n: int, start: datetime | None = None,
+                     end: datetime | None = None,
+                     where: dict[str, Any] | None = None) -> list[Expense]:
+        condition, params = self._condition(where, start, end)
+        with self.repo.pool.connection() as con:
+            rows = con.execute(
+                f'{self.repo._sql_select}{condition} '  # pylint: disable=protected-access
+                f'ORDER BY amount DESC LIMIT ?', [*params, n]).fetchall()
+        return list(map(self.repo._row2obj, rows))  # pylint: disable=protected-access
+
+
+class ColumnarExpenseAnalytics(ExpenseAnalytics):
+    """
+    Отчеты по расходам для колоночного репозитория: группировка
+    выполняется по столбцам без создания объектов Expense
+    """
+
+    repo: ColumnarExpenseRepository
+
+    def __init__(self, repo: ColumnarExpenseRepository, batch_size: int = 1000) -> None:
+        super().__init__(repo, batch_size)
+
+    def totals(self, by: str, start: datetime | None = None,
+               end: datetime | None = None,
+               where: dict[str, Any] | None = None) -> dict[Any, Totals]:
+        if by not in GROUPINGS:
+            raise ValueError(f'unknown grouping "{by}"')
+        if by == 'category':
+            groups = self.repo.group_totals('category', where, start, end)
+            return {key: Totals(*groups[key]) for key in sorted(groups)}
+        # группы по дням от начала эпохи сводятся в периоды
+        day = timedelta(days=1)
+        days = self.repo.group_totals('expense_date', where, start, end,
+                                      bucket=day // timedelta(microseconds=1))
+        result: dict[str, list[int]] = {}
+        for number in sorted(days):
+            total, cnt = days[number]
+            cell = result.setdefault(
+                period_key(by, datetime(1970, 1, 1) + day * number), [0, 0])
+            cell[0] += total
+            cell[1] += cnt
+        return {key: Totals(*cell) for key, cell in result.items()}
+
+    def total(self, start: datetime | None = None, end: datetime | None = None,
+              where: dict[str, Any] | None = None) -> int:
+        return self.repo.total(where, start, end)
+
+
+class PartitionedExpenseAnalytics(ExpenseAnalytics):
+    """
+    Отчеты по секционированному репозиторию расходов: запросы
+    SqliteExpenseAnalytics выполняются в разделах, пересекающихся
+    с периодом от start до end, и их итоги складываются
+    """
+
+    repo: PartitionedExpenseRepository
+
+    def __init__(self, repo: PartitionedExpenseRepository,
+                 batch_size: int = 1000) -> None:
+        super().__init__(repo, batch_size)
+
+    def _parts(self, start: datetime | None,
+               end: datetime | None) -> list[SqliteExpenseAnalytics]:
+        return [SqliteExpenseAnalytics(part, self.batch_size)
+                for part in self.repo.partitions(start, end)]
+
+    @staticmethod
+    def _merge(groups: Iterable[dict[Any, Totals]]) -> dict[Any, Totals]:
+        result: dict[Any, list[int]] = {}
+        for group in groups:
+            for key, cell in group.items():
+                merged = result.setdefault(key, [0, 0])
+                merged[0] += cell.total
+                merged[1] += cell.count
+        return {key: Totals(*result[key]) for key in sorted(result)}
+
+    def totals(self, by: str, start: datetime | None = None,
+               end: datetime | None = None,
+               where: dict[str, Any] | None = None) -> dict[Any, Totals]:
+        if by not in GROUPINGS:
+            raise ValueError(f'unknown grouping "{by}"')
+        return self._merge(part.totals(by, start, end, where)
+                           for part in self._parts(start, end))
+
+    def total(self, start: datetime | None = None, end: datetime | None = None,
+              where: dict[str, Any] | None = None) -> int:
+        return sum(part.total(start, end, where) for part in self._parts(start, end))
+
+    def subtree_totals(self, hierarchy: AbstractCategoryHierarchy,
+                       pks: Iterable[int], start: datetime | None = None,
+                       end: datetime | None = None) -> dict[int, Totals]:
+        pks = list(pks)
+        merged = self._merge(part.subtree_totals(hierarchy, pks, start, end)
+                             for part in self._parts(start, end))
+        return {pk: merged.get(pk, Totals(0, 0)) for pk in pks}
+
+    def top_expenses(self, n: int, start: datetime | None = None,
+                     end: datetime | None = None,
+                     where: dict[str, Any] | None = None) -> list[Expense]:
+        return heapq.nlargest(n, (exp for part in self._parts(start, end)
+                                  for exp in part.top_expenses(n, start, end, where)),
+                              key=lambda exp: exp.amount)
+
+
+def make_analytics(repo: AbstractRepository[Expense],
+                   batch_size: int = 1000) -> ExpenseAnalytics:
+    """ Создать отчеты по расходам, подходящие для репозитория repo """
+    if isinstance(repo, SqliteRepository):
+        return SqliteExpenseAnalytics(repo, batch_size)
+    if isinstance(repo, ColumnarExpenseRepository):
+        return ColumnarExpenseAnalytics(repo, batch_size)
+    if isinstance(repo, PartitionedExpenseRepository):
+        return PartitionedExpenseAnalytics(repo, batch_size)
+    return ExpenseAnalytics(repo, batch_size)
@@ -0,0 +1,217 @@
+"""
+Модуль содержит асинхронный интерфейс репозитория и его реализации
+
+Асинхронный репозиторий не блокирует цикл событий (например, цикл
+графического интерфейса) на время обращения к диску: методы репозитория
+возвращают awaitable-объекты, а работа с БД выполняется в отдельных потоках.
+"""
+import asyncio
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from typing import Any, AsyncIterator, Callable, Generic, Iterable, TypeVar
+
+from bookkeeper.repository.abstract_repository import AbstractRepository, T
+from bookkeeper.repository.connection_pool import ConnectionPool
+from bookkeeper.repository.expressions import Where
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SqliteRepository
+
+R = TypeVar('R')
+
+
+class AsyncAbstractRepository(ABC, Generic[T]):
+    """
+    Абстрактный асинхронный репозиторий. Методы повторяют
+    AbstractRepository, но являются сопрограммами.
+    Абстрактные методы:
+    add
+    get
+    get_all
+    get_all_like
+    update
+    delete
+    """
+
+    @abstractmethod
+    async def add(self, obj: T) -> int:
+        """
+        Добавить объект в репозиторий, вернуть id объекта,
+        также записать id в атрибут pk.
+        """
+
+    @abstractmethod
+    async def get(self, pk: int) -> T | None:
+        """ Получить объект по id """
+
+    @abstractmethod
+    async def get_all(self, where: Where = None) -> list[T]:
+        """ Получить все записи по условию where (см. AbstractRepository) """
+
+    @abstractmethod
+    async def get_all_like(self, like: dict[str, str]) -> list[T]:
+        """ Получить все записи по условию like """
+
+    @abstractmethod
+    async def update(self, obj: T) -> None:
+        """ Обновить данные об объекте. Объект должен содержать поле pk. """
+
+    @abstractmethod
+    async def delete(self, pk: int) -> None:
+        """ Удалить запись """
+
+    async def add_many(self, objs: Iterable[T]) -> list[int]:
+        """ Добавить несколько объектов, вернуть список id """
+        return [await self.add(obj) for obj in objs]
+
+    async def update_many(self, objs: Iterable[T]) -> None:
+        """ Обновить данные о нескольких объектах """
+        for obj in objs:
+            await self.update(obj)
+
+    async def delete_many(self, pks: Iterable[int]) -> None:
+        """ Удалить несколько записей """
+        for pk in pks:
+            await self.delete(pk)
+
+    async def get_between(self, field: str, lo: Any, hi: Any) -> list[T]:
+        """ Получить записи со значением поля field от lo до hi включительно """
+        return [obj for obj in await self.get_all()
+                if lo <= getattr(obj, field) <= hi]
+
+    async def iter_all(self, where: Where = None,
+                       batch_size: int = 1000) -> AsyncIterator[T]:
+        """ Перебрать все записи по условию where """
+        for obj in await self.get_all(where):
+            yield obj
+
+
+class AsyncMemoryRepository(AsyncAbstractRepository[T]):
+    """
+    Асинхронный адаптер репозитория в оперативной памяти.
+    Операции выполняются сразу, без потоков: они не обращаются к диску.
+    """
+
+    def __init__(self, repo: AbstractRepository[T] | None = None) -> None:
+        self.repo: AbstractRepository[T] = repo if repo is not None \
+            else MemoryRepository()
+
+    async def add(self, obj: T) -> int:
+        return self.repo.add(obj)
+
+    async def add_many(self, objs: Iterable[T]) -> list[int]:
+        return self.repo.add_many(objs)
+
+    async def get(self, pk: int) -> T | None:
+        return self.repo.get(pk)
+
+    async def get_all(self, where: Where = None) -> list[T]:
+        return self.repo.get_all(where)
+
+    async def get_all_like(self, like: dict[str, str]) -> list[T]:
+        return self.repo.get_all_like(like)
+
+    async def get_between(self, field: str, lo: Any, hi: Any) -> list[T]:
+        return self.repo.get_between(field, lo, hi)
+
+    async def update(self, obj: T) -> None:
+        self.repo.update(obj)
+
+    async def update_many(self, objs: Iterable[T]) -> None:
+        self.repo.update_many(objs)
+
+    async def delete(self, pk: int) -> None:
+        self.repo.delete(pk)
+
+    async def delete_many(self, pks: Iterable[int]) -> None:
+        self.repo.delete_many(pks)
+
+
+class AsyncSqliteRepository(AsyncAbstractRepository[T]):
+    """
+    Асинхронный репозиторий для SQLite. Чтение выполняется в пуле
+    из readers потоков и может идти параллельно, запись выполняется
+    в одном отдельном потоке, поэтому операции записи упорядочены.
+    Подписчики событий синхронного репозитория (self.repo) вызываются
+    в потоке записи.
+    """
+
+    def __init__(self, db_file: str, cls: type, readers: int = 4,
+                 pool: ConnectionPool | None = None) -> None:
+        if pool is None:
+            pool = ConnectionPool(db_file, size=readers + 1)
+            self._owns_pool = True
+        else:
+            self._owns_pool = False
+        self.repo: SqliteRepository[T] = SqliteRepository(db_file, cls, pool=pool)
+        self._readers = ThreadPoolExecutor(readers, thread_name_prefix='sqlite-read')
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix='sqlite-write')
+
+    async def _read(self, func: Callable[..., R], *args: Any) -> R:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, partial(func, *args))
+
+    async def _write(self, func: Callable[..., R], *args: Any) -> R:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, partial(func, *args))
+
+    def close(self) -> None:
+        """ Дождаться завершения операций, остановить потоки и закрыть соединения """
+        self._writer.shutdown()
+        self._readers.shutdown()
+        if self._owns_pool:
+            self.repo.pool.close()
+
+    async def aclose(self) -> None:
+        """
+        То же, что close, но ожидание операций выполняется в отдельном
+        потоке и не блокирует цикл событий
+        """
+        await asyncio.to_thread(self.close)
+
+    async def __aenter__(self) -> 'AsyncSqliteRepository[T]':
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.aclose()
+
+    async def add(self, obj: T) -> int:
+        return await self._write(self.repo.add, obj)
+
+    async def add_many(self, objs: Iterable[T]) -> list[int]:
+        return await self._write(self.repo.add_many, list(objs))
+
+    async def get(self, pk: int) -> T | None:
+        return await self._read(self.repo.get, pk)
+
+    async def get_all(self, where: Where = None) -> list[T]:
+        return await self._read(self.repo.get_all, where)
+
+    async def get_all_like(self, like: dict[str, str]) -> list[T]:
+        return await self._read(self.repo.get_all_like, like)
+
+    async def get_between(self, field: str, lo: Any, hi: Any) -> list[T]:
+        return await self._read(self.repo.get_between, field, lo, hi)
+
+    async def iter_all(self, where: Where = None,
+                       batch_size: int = 1000) -> AsyncIterator[T]:
+        """
+        Перебрать записи, читая их пакетами по batch_size в потоках чтения
+        """
+        rows = self.repo.iter_all(where, batch_size)
+        while batch := await self._read(lambda: list(islice(rows, batch_size))):
+            for obj in batch:
+                yield obj
+
+    async def update(self, obj: T) -> None:
+        await self._write(self.repo.update, obj)
+
+    async def update_many(self, objs: Iterable[T]) -> None:
+        await self._write(self.repo.update_many, list(objs))
+
+    async def delete(self, pk: int) -> None:
+        await self._write(self.repo.delete, pk)
+
+    async def delete_many(self, pks: Iterable[int]) -> None:
+        await self._write(self.repo.delete_many, list(pks))
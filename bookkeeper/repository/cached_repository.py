@@ -0,0 +1,191 @@
+"""
+Модуль описывает кэширующую обертку над репозиторием
+"""
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Hashable, Iterable, Iterator, Sequence
+
+from bookkeeper.repository.abstract_repository import AbstractRepository, T
+from bookkeeper.repository.expressions import Expression, Where
+from bookkeeper.repository.query import OrderBy
+
+
+@dataclass
+class CacheStats:
+    """
+    Статистика обращений к кэшу.
+    hits - количество попаданий
+    misses - количество промахов
+    """
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        """ Доля попаданий среди всех обращений """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class CachedRepository(AbstractRepository[T]):
+    """
+    Репозиторий, кэширующий чтение из другого репозитория.
+    Результаты get хранятся в LRU-кэше на maxsize объектов, результаты
+    get_all по условию (если cache_queries) - в LRU-кэше на max_queries
+    запросов. Запись выполняется сразу во внутренний репозиторий,
+    кэш обновляется по событиям внутреннего репозитория, поэтому
+    изменения в обход обертки также учитываются.
+    Отсутствие объекта не кэшируется. Внутри транзакции кэш не
+    используется: события внутреннего репозитория откладываются до ее
+    завершения, и кэш до этого момента не знает об изменениях. Это
+    относится и к транзакциям, открытым прямо во внутреннем репозитории
+    (например, UnitOfWork с внутренним репозиторием), и действует только
+    в потоке, выполняющем транзакцию.
+    Объекты из кэша не копируются: как и в MemoryRepository, изменения
+    объекта нужно сохранять методом update.
+    """
+
+    def __init__(self, repo: AbstractRepository[T], maxsize: int = 1024,
+                 cache_queries: bool = False, max_queries: int = 128) -> None:
+        super().__init__()
+        self.repo = repo
+        self.maxsize = maxsize
+        self.cache_queries = cache_queries
+        self.max_queries = max_queries
+        self.stats = CacheStats()
+        self.query_stats = CacheStats()
+        self._objects: OrderedDict[int, T] = OrderedDict()
+        self._queries: OrderedDict[Hashable, list[T]] = OrderedDict()
+        self._local = threading.local()
+        repo.subscribe(self._on_change)
+
+    def close(self) -> None:
+        """ Отписаться от событий внутреннего репозитория """
+        self.repo.unsubscribe(self._on_change)
+
+    def clear(self) -> None:
+        """ Очистить кэш """
+        self._objects.clear()
+        self._queries.clear()
+
+    def _remember(self, pk: int, obj: T) -> None:
+        self._objects[pk] = obj
+        self._objects.move_to_end(pk)
+        if len(self._objects) > self.maxsize:
+            self._objects.popitem(last=False)
+
+    def _on_change(self, event: str, pk: int, obj: T | None) -> None:
+        self._queries.clear()
+        if event == 'delete':
+            self._objects.pop(pk, None)
+        elif obj is not None and (pk in self._objects or event == 'add'):
+            self._remember(pk, obj)
+        self._notify(event, pk, obj)
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        Выполнить блок with в транзакции внутреннего репозитория.
+        До завершения транзакции чтение идет мимо кэша, при откате
+        кэш очищается, так как мог запомнить отмененные изменения.
+        """
+        local = self._local
+        local.transactions = getattr(local, 'transactions', 0) + 1
+        try:
+            with self.deferred_events(), self.repo.transaction():
+                yield
+        except BaseException:
+            self.clear()
+            raise
+        finally:
+            local.transactions -= 1
+
+    def _bypass(self) -> bool:
+        """ Читать мимо кэша: в текущем потоке идет транзакция """
+        return bool(getattr(self._local, 'transactions', 0)) or self.repo.events_deferred
+
+    def add(self, obj: T) -> int:
+        return self.repo.add(obj)
+
+    def add_many(self, objs: Iterable[T]) -> list[int]:
+        return self.repo.add_many(objs)
+
+    def restore_many(self, objs: Iterable[T]) -> None:
+        self.repo.restore_many(objs)
+
+    def get(self, pk: int) -> T | None:
+        if self._bypass():
+            return self.repo.get(pk)
+        if pk in self._objects:
+            self.stats.hits += 1
+            self._objects.move_to_end(pk)
+            return self._objects[pk]
+        self.stats.misses += 1
+        obj = self.repo.get(pk)
+        if obj is not None:
+            self._remember(pk, obj)
+        return obj
+
+    @staticmethod
+    def _query_key(where: Where) -> Hashable | None:
+        if where is None:
+            return ()
+        if isinstance(where, Expression):
+            key: Hashable = (Expression, where.shape, tuple(where.values()))
+        else:
+            key = tuple(sorted(where.items()))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def get_all(self, where: Where = None) -> list[T]:
+        key = self._query_key(where) \
+            if self.cache_queries and not self._bypass() else None
+        if key is None:
+            return self.repo.get_all(where)
+        if key in self._queries:
+            self.query_stats.hits += 1
+            self._queries.move_to_end(key)
+            return list(self._queries[key])
+        self.query_stats.misses += 1
+        result = self.repo.get_all(where)
+        self._queries[key] = result
+        if len(self._queries) > self.max_queries:
+            self._queries.popitem(last=False)
+        return list(result)
+
+    def iter_all(self, where: Where = None,
+                 batch_size: int = 1000) -> Iterator[T]:
+        return self.repo.iter_all(where, batch_size)
+
+    def get_all_like(self, like: dict[str, str]) -> list[T]:
+        return self.repo.get_all_like(like)
+
+    def get_between(self, field: str, lo: Any, hi: Any) -> list[T]:
+        return self.repo.get_between(field, lo, hi)
+
+    def iter_between(self, field: str, lo: Any, hi: Any,
+                     batch_size: int = 1000) -> Iterator[T]:
+        return self.repo.iter_between(field, lo, hi, batch_size)
+
+    def query(self,  # pylint: disable=too-many-arguments
+              fields: Sequence[str] | None = None, where: Where = None,
+              order_by: OrderBy = None, limit: int | None = None,
+              after: Any = None) -> list[Any]:
+        return self.repo.query(fields, where, order_by, limit, after)
+
+    def update(self, obj: T) -> None:
+        self.repo.update(obj)
+
+    def update_many(self, objs: Iterable[T]) -> None:
+        self.repo.update_many(objs)
+
+    def delete(self, pk: int) -> None:
+        self.repo.delete(pk)
+
+    def delete_many(self, pks: Iterable[int]) -> None:
+        self.repo.delete_many(pks)
@@ -0,0 +1,252 @@
+"""
+Модуль описывает кэшированные индексы иерархии категорий
+
+Индекс иерархии отвечает на вопросы "все подкатегории", "все родители"
+и "сколько потрачено в поддереве" без обхода дерева запросами к репозиторию
+по одному уровню. Индекс в памяти строится по обходу дерева в глубину
+(Euler tour): каждой категории сопоставляется интервал позиций в порядке
+обхода, и поддерево категории - это непрерывный отрезок этого порядка.
+Индекс для SQLite хранит таблицу замыкания (closure table) со всеми парами
+"предок-потомок", которая поддерживается триггерами на таблице категорий.
+"""
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Mapping
+
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import AbstractRepository
+from bookkeeper.repository.sqlite_repository import SqliteRepository
+
+
+class AbstractCategoryHierarchy(ABC):
+    """
+    Абстрактный индекс иерархии категорий.
+    Абстрактные методы:
+    descendants
+    ancestors
+    subtree
+    """
+
+    @abstractmethod
+    def descendants(self, pk: int) -> list[Category]:
+        """ Получить все подкатегории категории pk любого уровня """
+
+    @abstractmethod
+    def ancestors(self, pk: int) -> list[Category]:
+        """ Получить всех родителей категории pk от ближайшего к верхнему """
+
+    @abstractmethod
+    def subtree(self, pk: int) -> list[int]:
+        """ Получить id категории pk и всех ее подкатегорий """
+
+    def subtree_spent(self, pk: int, exp_repo: AbstractRepository[Expense],
+                      start: datetime | None = None,
+                      end: datetime | None = None) -> int:
+        """
+        Получить сумму расходов в категории pk и всех ее подкатегориях.
+        start, end - учитывать только расходы с датой от start до end включительно
+        """
+        cats = set(self.subtree(pk))
+        if start is None and end is None:
+            exps = exp_repo.iter_all()
+        else:
+            exps = exp_repo.iter_between('expense_date',
+                                        start or datetime.min, end or datetime.max)
+        return sum(int(exp.amount) for exp in exps if exp.category in cats)
+
+    def subtree_totals(self, pk: int, totals: Mapping[int, int]) -> int:
+        """
+        Сложить суммы по категориям totals (например, полученные
+        из агрегатов расходов) для категории pk и всех ее подкатегорий
+        """
+        return sum(totals.get(cat, 0) for cat in self.subtree(pk))
+
+
+class CategoryHierarchy(AbstractCategoryHierarchy):
+    """
+    Индекс иерархии в оперативной памяти для любого репозитория категорий.
+    Индекс строится при первом запросе и сбрасывается при любом изменении
+    репозитория категорий.
+    """
+
+    def __init__(self, repo: AbstractRepository[Category]) -> None:
+        self.repo = repo
+        self._cats: dict[int, Category] | None = None
+        self._order: list[int] = []
+        # pk -> (позиция входа, позиция выхода) в порядке обхода
+        self._intervals: dict[int, tuple[int, int]] = {}
+        repo.subscribe(self._invalidate)
+
+    def close(self) -> None:
+        """ Отписаться от событий репозитория """
+        self.repo.unsubscribe(self._invalidate)
+
+    def _invalidate(self, event: str, pk: int, obj: Any) -> None:
+        self._cats = None
+
+    def _build(self) -> dict[int, Category]:
+        if self._cats is not None:
+            return self._cats
+        cats = {cat.pk: cat for cat in self.repo.get_all()}
+        children: dict[int | None, list[int]] = defaultdict(list)
+        for cat in cats.values():
+            # категории с отсутствующим родителем считаются корнями
+            parent = cat.parent if cat.parent in cats else None
+            children[parent].append(cat.pk)
+        order: list[int] = []
+        intervals: dict[int, tuple[int, int]] = {}
+        stack = [(pk, False) for pk in reversed(children[None])]
+        while stack:
+            pk, leaving = stack.pop()
+            if leaving:
+                intervals[pk] = (intervals[pk][0], len(order))
+                continue
+            intervals[pk] = (len(order), 0)
+            order.append(pk)
+            stack.append((pk, True))
+            stack.extend((child, False) for child in reversed(children[pk]))
+        self._cats, self._order, self._intervals = cats, order, intervals
+        return cats
+
+    def subtree(self, pk: int) -> list[int]:
+        self._build()
+        enter, leave = self._intervals[pk]
+        return self._order[enter:leave]
+
+    def descendants(self, pk: int) -> list[Category]:
+        cats = self._build()
+        return [cats[sub] for sub in self.subtree(pk)[1:]]
+
+    def ancestors(self, pk: int) -> list[Category]:
+        cats = self._build()
+        result = []
+        parent = cats[pk].parent
+        while parent is not None and parent in cats:
+            result.append(cats[parent])
+            parent = cats[parent].parent
+        return result
+
+    def is_descendant(self, pk: int, ancestor: int) -> bool:
+        """ Проверить, является ли категория pk подкатегорией ancestor """
+        self._build()
+        enter, leave = self._intervals[ancestor]
+        return enter < self._intervals[pk][0] < leave
+
+
+class SqliteCategoryHierarchy(AbstractCategoryHierarchy):
+    """
+    Индекс иерархии для SQLite в виде таблицы замыкания
+    (предок, потомок, глубина), включая пары (категория, она же, 0).
+    Таблица поддерживается триггерами на таблице категорий и изменяется
+    в той же транзакции, что и категории.
+    """
+
+    def __init__(self, repo: SqliteRepository[Category]) -> None:
+        self.repo = repo
+        self.table_name = f'{repo.table_name}_closure'
+        with repo.pool.transaction() as con:
+            exists = con.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                (self.table_name,)).fetchone()
+            con.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.table_name} ('
+                'ancestor INTEGER, descendant INTEGER, depth INTEGER, '
+                'PRIMARY KEY (ancestor, descendant)) WITHOUT ROWID')
+            con.execute(
+                f'CREATE INDEX IF NOT EXISTS {self.table_name}_descendant '
+                f'ON {self.table_name} (descendant, depth)')
+            for sql in self._triggers_sql():
+                con.execute(sql)
+            if exists is None:
+                self._fill(con)
+
+    def _triggers_sql(self) -> list[str]:
+        closure, table = self.table_name, self.repo.table_name
+        subtree = f'SELECT descendant FROM {closure} WHERE ancestor = OLD.ROWID'
+        return [
+            f'CREATE TRIGGER IF NOT EXISTS {closure}_insert '
+            f'AFTER INSERT ON {table} BEGIN '
+            f'INSERT INTO {closure} '
+            f'SELECT ancestor, NEW.ROWID, depth + 1 FROM {closure} '
+            f'WHERE descendant = NEW.parent '
+            f'UNION ALL SELECT NEW.ROWID, NEW.ROWID, 0; END',
+
+            f'CREATE TRIGGER IF NOT EXISTS {closure}_delete '
+            f'AFTER DELETE ON {table} BEGIN '
+            f'DELETE FROM {closure} '
+            f'WHERE descendant = OLD.ROWID OR ancestor = OLD.ROWID; END',
+
+            # перенос поддерева: удалить связи с прежними предками
+            # и добавить связи со всеми предками нового родителя
+            f'CREATE TRIGGER IF NOT EXISTS {closure}_update '
+            f'AFTER UPDATE OF parent ON {table} '
+            f'WHEN OLD.parent IS NOT NEW.parent BEGIN '
+            f'DELETE FROM {closure} '
+            f'WHERE descendant IN ({subtree}) AND ancestor NOT IN ({subtree}); '
+            f'INSERT INTO {closure} '
+            f'SELECT a.ancestor, d.descendant, a.depth + d.depth + 1 '
+            f'FROM {closure} a, {closure} d '
+            f'WHERE a.descendant = NEW.parent AND d.ancestor = NEW.ROWID; END',
+        ]
+
+    def _fill(self, con: Any) -> None:
+        table = self.repo.table_name
+        con.execute(
+            f'INSERT INTO {self.table_name} '
+            f'WITH RECURSIVE tree(ancestor, descendant, depth) AS ('
+            f'SELECT ROWID, ROWID, 0 FROM {table} '
+            f'UNION ALL SELECT tree.ancestor, c.ROWID, tree.depth + 1 '
+            f'FROM tree JOIN {table} c ON c.parent = tree.descendant) '
+            f'SELECT * FROM tree')
+
+    def rebuild(self) -> None:
+        """ Пересчитать таблицу замыкания по таблице категорий """
+        with self.repo.pool.transaction() as con:
+            con.execute(f'DELETE FROM {self.table_name}')
+            self._fill(con)
+
+    def subtree(self, pk: int) -> list[int]:
+        with self.repo.pool.connection() as con:
+            rows = con.execute(
+                f'SELECT descendant FROM {self.table_name} '
+                f'WHERE ancestor = ? ORDER BY depth', (pk,)).fetchall()
+        return [row[0] for row in rows]
+
+    def descendants(self, pk: int) -> list[Category]:
+        return self.repo._select(  # pylint: disable=protected-access
+            f'ROWID IN (SELECT descendant FROM {self.table_name} '
+            f'WHERE ancestor = ? AND depth > 0)', (pk,))
+
+    def ancestors(self, pk: int) -> list[Category]:
+        with self.repo.pool.connection() as con:
+            depth = dict(con.execute(
+                f'SELECT ancestor, depth FROM {self.table_name} '
+                f'WHERE descendant = ? AND depth > 0', (pk,)).fetchall())
+        cats = self.repo._select(  # pylint: disable=protected-access
+            f'ROWID IN ({", ".join("?" * len(depth))})', depth)
+        return sorted(cats, key=lambda cat: depth[cat.pk])
+
+    def subtree_spent(self, pk: int, exp_repo: AbstractRepository[Expense],
+                      start: datetime | None = None,
+                      end: datetime | None = None) -> int:
+        """
+        Получить сумму расходов в поддереве одним запросом с соединением
+        таблицы расходов и таблицы замыкания. Таблица расходов должна
+        находиться в той же БД.
+        """
+        if not isinstance(exp_repo, SqliteRepository):
+            return super().subtree_spent(pk, exp_repo, start, end)
+        sql = (f'SELECT coalesce(sum(e.amount), 0) FROM {exp_repo.table_name} e '
+               f'JOIN {self.table_name} c ON e.category = c.descendant '
+               f'WHERE c.ancestor = ?')
+        params: list[Any] = [pk]
+        if start is not None:
+            sql += ' AND e.expense_date >= ?'
+            params.append(start)
+        if end is not None:
+            sql += ' AND e.expense_date <= ?'
+            params.append(end)
+        with self.repo.pool.connection() as con:
+            return int(con.execute(sql, params).fetchone()[0])
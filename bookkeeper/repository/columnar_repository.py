@@ -0,0 +1,440 @@
+"""
+Модуль описывает колоночный репозиторий расходов в оперативной памяти
+
+Вместо объектов Expense репозиторий хранит по одному типизированному
+массиву (array) на каждое поле: сумму, категорию, даты (в микросекундах
+от начала эпохи) и номер комментария в общей таблице строк. Строка
+таблицы занимает около 50 байт вместо сотен байт на объект, а фильтры
+и суммы вычисляются проходом по массивам без создания объектов.
+Объекты Expense создаются только при чтении записей.
+
+Если установлен NumPy, фильтры и суммы вычисляются векторно
+над теми же массивами без копирования.
+"""
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Callable, Iterable, Iterator, Mapping, Sequence
+
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import AbstractRepository
+from bookkeeper.repository.expressions import Expression, Where, equalities
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - NumPy необязателен
+    np = None
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_DATES = ('expense_date', 'added_date')
+COLUMNS = ('amount', 'category', 'expense_date', 'added_date', 'comment')
+
+
+class ColumnarExpenseRepository(AbstractRepository[Expense]):
+    """
+    Колоночный репозиторий расходов в оперативной памяти.
+    Записи хранятся в порядке id, поэтому запись по id находится
+    двоичным поиском. Удаленные записи помечаются и вычищаются, когда
+    их становится больше половины. Каждый вызов get и get_all создает
+    новые объекты Expense: изменения объектов нужно сохранять методом
+    update. Даты хранятся без часового пояса с точностью до микросекунды.
+    use_numpy - вычислять фильтры средствами NumPy (по умолчанию - если
+    NumPy установлен)
+    """
+
+    def __init__(self, use_numpy: bool | None = None) -> None:
+        super().__init__()
+        if use_numpy and np is None:
+            raise ImportError('NumPy is not installed')
+        self.use_numpy = np is not None if use_numpy is None else use_numpy
+        self._columns: dict[str, array] = {
+            name: array('q') for name in ('pk', *COLUMNS)}
+        self._alive = bytearray()
+        self._deleted = 0
+        self._next_pk = 1
+        self._strings: list[str] = []
+        self._string_ids: dict[str, int] = {}
+        # в транзакции: номер строки -> значения полей и признак живой
+        # строки до начала транзакции (только для строк, бывших до нее)
+        self._undo: dict[int, tuple[list[int], int]] | None = None
+        self._undo_rows = 0
+
+    def __len__(self) -> int:
+        return len(self._alive) - self._deleted
+
+    # преобразование значений полей в числа столбцов и обратно
+
+    def _string_id(self, value: str) -> int:
+        string_id = self._string_ids.get(value)
+        if string_id is None:
+            string_id = self._string_ids[value] = len(self._strings)
+            self._strings.append(value)
+        return string_id
+
+    def _encode(self, field: str, value: Any) -> int:
+        if field in _DATES:
+            return (value - _EPOCH) // _MICROSECOND
+        if field == 'comment':
+            return self._string_id(value)
+        return value
+
+    def _encode_query(self, field: str, value: Any) -> int | None:
+        """ Закодировать значение условия, None - значение не встречается """
+        if field not in self._columns:
+            raise ValueError(f'unknown field "{field}"')
+        if field == 'comment':
+            return self._string_ids.get(value)
+        return self._encode(field, value)
+
+    def _row_values(self, obj: Expense) -> list[int]:
+        return [self._encode(field, getattr(obj, field)) for field in COLUMNS]
+
+    def _make(self, row: int) -> Expense:
+        cols = self._columns
+        return Expense(cols['amount'][row], cols['category'][row],
+                       _EPOCH + _MICROSECOND * cols['expense_date'][row],
+                       _EPOCH + _MICROSECOND * cols['added_date'][row],
+                       self._strings[cols['comment'][row]], cols['pk'][row])
+
+    def _row(self, pk: int) -> int | None:
+        pks = self._columns['pk']
+        row = bisect_left(pks, pk)
+        if row < len(pks) and pks[row] == pk and self._alive[row]:
+            return row
+        return None
+
+    # выборка строк
+
+    def _match(self, where: dict[str, Any] | None = None, field: str | None = None,
+               lo: Any = None, hi: Any = None) -> Sequence[int]:
+        """
+        Получить номера строк, удовлетворяющих условиям на равенство where
+        и условию lo <= field <= hi (если задано поле field)
+        """
+        conditions = []
+        for attr, value in (where or {}).items():
+            code = self._encode_query(attr, value)
+            if code is None:
+                return []
+            conditions.append((self._columns[attr], code))
+        bounds = None
+        if field is not None:
+            if field not in self._columns or field == 'comment':
+                raise ValueError(f'unknown field "{field}"')
+            bounds = (self._columns[field],
+                      self._encode(field, lo), self._encode(field, hi))
+        if self.use_numpy:
+            return self._match_numpy(conditions, bounds)
+        rows: Iterable[int]
+        if self._deleted:
+            rows = [i for i, alive in enumerate(self._alive) if alive]
+        else:
+            rows = range(len(self._alive))
+        for column, code in conditions:
+            rows = [i for i in rows if column[i] == code]
+        if bounds is not None:
+            column, low, high = bounds
+            rows = [i for i in rows if low <= column[i] <= high]
+        return rows
+
+    def _match_numpy(self, conditions: list[tuple[array, int]],
+                     bounds: tuple[array, int, int] | None) -> Sequence[int]:
+        mask = np.frombuffer(self._alive, dtype=np.uint8).astype(bool)
+        for column, code in conditions:
+            mask &= np.frombuffer(column, dtype=np.int64) == code
+        if bounds is not None:
+            column, low, high = bounds
+            values = np.frombuffer(column, dtype=np.int64)
+            mask &= (values >= low) & (values <= high)
+        result: list[int] = np.flatnonzero(mask).tolist()
+        return result
+
+    # интерфейс репозитория
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        Выполнить изменения в блоке with как одну транзакцию: при исключении
+        восстановить содержимое столбцов. Добавленные строки отрезаются,
+        для измененных и удаленных запоминаются прежние значения, поэтому
+        транзакция стоит O(числа изменений). Удаленные строки в транзакции
+        не вычищаются, чтобы запомненные номера строк оставались верными.
+        """
+        if self._undo is not None:
+            yield
+            return
+        self._undo, self._undo_rows = {}, len(self._alive)
+        deleted, next_pk = self._deleted, self._next_pk
+        try:
+            with self.deferred_events():
+                yield
+        except BaseException:
+            self._rollback(self._undo, self._undo_rows)
+            self._deleted, self._next_pk = deleted, next_pk
+            raise
+        finally:
+            self._undo = None
+
+    def _save(self, rows: Iterable[int]) -> None:
+        """ Запомнить прежние значения строк rows, если идет транзакция """
+        undo = self._undo
+        if undo is None:
+            return
+        for row in rows:
+            if row < self._undo_rows and row not in undo:
+                undo[row] = ([self._columns[field][row] for field in COLUMNS],
+                             self._alive[row])
+
+    def _rollback(self, undo: dict[int, tuple[list[int], int]], length: int) -> None:
+        """ Отрезать строки после length и вернуть строкам из undo прежние значения """
+        for column in self._columns.values():
+            del column[length:]
+        del self._alive[length:]
+        for row, (values, alive) in undo.items():
+            for field, value in zip(COLUMNS, values):
+                self._columns[field][row] = value
+            self._alive[row] = alive
+
+    def add(self, obj: Expense) -> int:
+        return self.add_many([obj])[0]
+
+    def add_many(self, objs: Iterable[Expense]) -> list[int]:
+        objs = list(objs)
+        for obj in objs:
+            if getattr(obj, 'pk', None) != 0:
+                raise ValueError(f'trying to add object {obj} with filled `pk` attribute')
+        pks = list(range(self._next_pk, self._next_pk + len(objs)))
+        self._append(pks, objs)
+        for pk, obj in zip(pks, objs):
+            obj.pk = pk
+        for obj in objs:
+            self._notify('add', obj.pk, obj)
+        return pks
+
+    def restore_many(self, objs: Iterable[Expense]) -> None:
+        """
+        Добавить расходы с заполненными id. Записи хранятся в порядке id,
+        поэтому id должны возрастать и быть больше всех id в репозитории.
+        """
+        objs = list(objs)
+        pks = [obj.pk for obj in objs]
+        if any(a >= b for a, b in zip([self._next_pk - 1, *pks], pks)):
+            raise ValueError('restored ids must be increasing and greater '
+                             'than existing ids')
+        self._append(pks, objs)
+        for obj in objs:
+            self._notify('add', obj.pk, obj)
+
+    def restore_columns(self, columns: Mapping[str, Sequence[int]],
+                        strings: Sequence[str]) -> None:
+        """
+        Добавить расходы с заполненными id из столбцов, не создавая
+        объектов (например, из снимка учета). columns - значения pk и полей
+        COLUMNS, даты - в микросекундах от начала эпохи, comment - номера
+        строк в strings. Требования к id - как в restore_many.
+        """
+        pks = array('q', columns['pk'])
+        if any(a >= b for a, b in zip([self._next_pk - 1, *pks], pks)):
+            raise ValueError('restored ids must be increasing and greater '
+                             'than existing ids')
+        string_ids = [self._string_id(value) for value in strings]
+        # значения проверяются при построении массивов до изменения столбцов
+        values = {field: array('q', columns[field]) for field in COLUMNS
+                  if field != 'comment'}
+        values['comment'] = array('q', map(string_ids.__getitem__, columns['comment']))
+        first = len(self._alive)
+        if pks:
+            self._next_pk = pks[-1] + 1
+        self._columns['pk'].extend(pks)
+        for field, column in values.items():
+            self._columns[field].extend(column)
+        self._alive.extend(b'\x01' * len(pks))
+        if self._listeners:
+            for row in range(first, len(self._alive)):
+                self._notify('add', pks[row - first], self._make(row))
+
+    def _append(self, pks: list[int], objs: list[Expense]) -> None:
+        # значения проверяются при построении массивов до изменения столбцов
+        rows = [self._row_values(obj) for obj in objs]
+        values = [array('q', column) for column in zip(*rows)]
+        if pks:
+            self._next_pk = pks[-1] + 1
+        self._columns['pk'].extend(pks)
+        for field, column in zip(COLUMNS, values):
+            self._columns[field].extend(column)
+        self._alive.extend(b'\x01' * len(objs))
+
+    def get(self, pk: int) -> Expense | None:
+        row = self._row(pk)
+        return None if row is None else self._make(row)
+
+    def _split(self, where: Where) -> tuple[dict[str, Any] | None,
+                                            Callable[[Expense], bool] | None]:
+        """
+        Разделить условие на равенства, проверяемые по столбцам,
+        и проверку созданных объектов (для Expression)
+        """
+        if not isinstance(where, Expression):
+            return where, None
+        for field in where.fields():
+            if field not in self._columns:
+                raise ValueError(f'unknown field "{field}"')
+        return equalities(where), where.predicate()
+
+    def get_all(self, where: Where = None) -> list[Expense]:
+        equal, match = self._split(where)
+        objs = map(self._make, self._match(equal))
+        return list(objs if match is None else filter(match, objs))
+
+    def iter_all(self, where: Where = None,
+                 batch_size: int = 1000) -> Iterator[Expense]:
+        """
+        Перебрать записи по условию where. Список id снимается до начала
+        перебора, поэтому репозиторий можно изменять во время перебора.
+        """
+        equal, match = self._split(where)
+        pks = self._columns['pk']
+        for pk in [pks[row] for row in self._match(equal)]:
+            row = self._row(pk)
+            if row is not None:
+                obj = self._make(row)
+                if match is None or match(obj):
+                    yield obj
+
+    def get_all_like(self, like: dict[str, str]) -> list[Expense]:
+        """
+        Получить записи, поля которых содержат подстроки из like.
+        Подстрока в комментарии ищется по таблице строк один раз
+        для каждой различной строки.
+        """
+        rows: Sequence[int] = self._match()
+        for attr, value in like.items():
+            if attr == 'comment':
+                ids = {i for i, s in enumerate(self._strings) if value in s}
+                column = self._columns['comment']
+                rows = [i for i in rows if column[i] in ids]
+            elif attr in self._columns:
+                rows = [i for i in rows if value in str(getattr(self._make(i), attr))]
+            else:
+                raise ValueError(f'unknown field "{attr}"')
+        return list(map(self._make, rows))
+
+    def get_between(self, field: str, lo: Any, hi: Any) -> list[Expense]:
+        return list(map(self._make, self._match(field=field, lo=lo, hi=hi)))
+
+    def iter_between(self, field: str, lo: Any, hi: Any,
+                     batch_size: int = 1000) -> Iterator[Expense]:
+        pks = self._columns['pk']
+        for pk in [pks[row] for row in self._match(field=field, lo=lo, hi=hi)]:
+            row = self._row(pk)
+            if row is not None:
+                yield self._make(row)
+
+    def update(self, obj: Expense) -> None:
+        self.update_many([obj])
+
+    def update_many(self, objs: Iterable[Expense]) -> None:
+        objs = list(objs)
+        rows = [self._row(obj.pk) for obj in objs]
+        if None in rows:
+            raise ValueError('No object with such primary key to update.')
+        values = [array('q', self._row_values(obj)) for obj in objs]
+        self._save(rows)  # type: ignore[arg-type]
+        for row, row_values in zip(rows, values):
+            for field, value in zip(COLUMNS, row_values):
+                self._columns[field][row] = value  # type: ignore[index]
+        for obj in objs:
+            self._notify('update', obj.pk, obj)
+
+    def delete(self, pk: int) -> None:
+        self.delete_many([pk])
+
+    def delete_many(self, pks: Iterable[int]) -> None:
+        pks = list(dict.fromkeys(pks))
+        rows = [self._row(pk) for pk in pks]
+        if None in rows:
+            raise KeyError('No object with such primary key to delete.')
+        self._save(rows)  # type: ignore[arg-type]
+        for row in rows:
+            self._alive[row] = 0  # type: ignore[index]
+        self._deleted += len(rows)
+        if self._deleted * 2 > len(self._alive) and self._undo is None:
+            self._compact()
+        for pk in pks:
+            self._notify('delete', pk, None)
+
+    def _compact(self) -> None:
+        """ Удалить из столбцов помеченные строки """
+        alive = self._alive
+        self._columns = {
+            name: array('q', (v for v, a in zip(col, alive) if a))
+            for name, col in self._columns.items()}
+        self._alive = bytearray(b'\x01' * (len(alive) - self._deleted))
+        self._deleted = 0
+
+    # агрегирование без создания объектов
+
+    def count(self, where: dict[str, Any] | None = None,
+              start: datetime | None = None, end: datetime | None = None) -> int:
+        """
+        Получить количество расходов по условию where
+        с датой от start до end включительно
+        """
+        return len(self._match_period(where, start, end))
+
+    def total(self, where: dict[str, Any] | None = None,
+              start: datetime | None = None, end: datetime | None = None) -> int:
+        """
+        Получить сумму расходов по условию where
+        с датой от start до end включительно
+        """
+        rows = self._match_period(where, start, end)
+        amounts = self._columns['amount']
+        if self.use_numpy:
+            return int(np.frombuffer(amounts, dtype=np.int64)[rows].sum())
+        return sum(map(amounts.__getitem__, rows))
+
+    def totals_by_category(self, start: datetime | None = None,
+                           end: datetime | None = None) -> dict[int, int]:
+        """ Получить суммы расходов по категориям с датой от start до end """
+        groups = self.group_totals('category', start=start, end=end)
+        return {cat: total for cat, (total, _) in groups.items()}
+
+    def group_totals(self, field: str,  # pylint: disable=too-many-arguments
+                     where: dict[str, Any] | None = None,
+                     start: datetime | None = None, end: datetime | None = None,
+                     bucket: int = 1) -> dict[int, tuple[int, int]]:
+        """
+        Сгруппировать расходы по условию where с датой от start до end
+        по значению столбца field, целочисленно деленному на bucket.
+        Вернуть для каждой группы пару (сумма, количество). Даты хранятся
+        в микросекундах от начала эпохи, поэтому, например, группировка
+        по дням - это field='expense_date', bucket=86400 * 10 ** 6.
+        """
+        if field not in COLUMNS:
+            raise ValueError(f'unknown field "{field}"')
+        rows = self._match_period(where, start, end)
+        column, amounts = self._columns[field], self._columns['amount']
+        if self.use_numpy and len(rows):
+            keys = np.frombuffer(column, dtype=np.int64)[rows] // bucket
+            groups, inverse = np.unique(keys, return_inverse=True)
+            sums = np.zeros(len(groups), dtype=np.int64)
+            np.add.at(sums, inverse, np.frombuffer(amounts, dtype=np.int64)[rows])
+            counts = np.bincount(inverse, minlength=len(groups))
+            return {key: (total, cnt) for key, total, cnt in zip(
+                groups.tolist(), sums.tolist(), counts.tolist())}
+        result: dict[int, list[int]] = {}
+        for row in rows:
+            cell = result.setdefault(column[row] // bucket, [0, 0])
+            cell[0] += amounts[row]
+            cell[1] += 1
+        return {key: (total, cnt) for key, (total, cnt) in result.items()}
+
+    def _match_period(self, where: dict[str, Any] | None,
+                      start: datetime | None, end: datetime | None) -> Sequence[int]:
+        if start is None and end is None:
+            return self._match(where)
+        return self._match(where, 'expense_date',
+                           start or datetime.min, end or datetime.max)
@@ -0,0 +1,172 @@
+"""
+Модуль содержит пул соединений с базой данных SQLite
+
+Пул хранит небольшое количество долгоживущих соединений с одним файлом БД
+и выдает их потокам на время выполнения операции. Соединение, полученное
+потоком, закрепляется за ним до возврата в пул, поэтому вложенные запросы
+соединения из того же потока получают то же самое соединение.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from queue import Empty, LifoQueue
+from typing import TYPE_CHECKING, Any, Iterator
+
+if TYPE_CHECKING:
+    from bookkeeper.repository.instrumentation import QueryProfiler
+
+# Настройки соединений по умолчанию: журнал WAL позволяет читать БД
+# во время записи, synchronous = NORMAL в режиме WAL не теряет
+# согласованность БД при сбое, cache_size < 0 задает размер кэша в КиБ
+DEFAULT_PRAGMAS: dict[str, Any] = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16_000,
+    'mmap_size': 64 * 2 ** 20,
+}
+
+
+class ConnectionPool:
+    """
+    Потокобезопасный пул соединений с файлом БД SQLite.
+    db_file - путь к файлу БД
+    size - максимальное количество одновременно открытых соединений
+    cached_statements - размер кэша подготовленных выражений каждого соединения
+    pragmas - настройки PRAGMA, выполняемые для каждого нового соединения,
+    дополняют и переопределяют DEFAULT_PRAGMAS
+    profiler - профилировщик запросов (см. instrumentation.QueryProfiler);
+    его можно подключить и отключить позже через атрибут profiler
+    """
+
+    _shared: dict[str, 'ConnectionPool'] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, db_file: str, size: int = 4,
+                 cached_statements: int = 256,
+                 pragmas: dict[str, Any] | None = None,
+                 profiler: 'QueryProfiler | None' = None) -> None:
+        if size < 1:
+            raise ValueError(f'pool size must be positive, got {size}')
+        self.pragmas = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+        for name, value in self.pragmas.items():
+            if not name.isidentifier() or not str(value).lstrip('-').isalnum():
+                raise ValueError(f'invalid pragma "{name} = {value}"')
+        self.db_file = db_file
+        # каждое соединение с ':memory:' открывает отдельную БД
+        self.size = 1 if db_file == ':memory:' else size
+        self.cached_statements = cached_statements
+        self.profiler = profiler
+        self._idle: LifoQueue[sqlite3.Connection] = LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._local = threading.local()
+        self._closed = False
+
+    @classmethod
+    def shared(cls, db_file: str) -> 'ConnectionPool':
+        """
+        Получить общий пул для файла db_file. Репозитории, созданные
+        с одним общим пулом, используют одни и те же соединения.
+        """
+        key = db_file if db_file == ':memory:' else os.path.abspath(db_file)
+        with cls._shared_lock:
+            pool = cls._shared.get(key)
+            if pool is None or pool.closed:
+                pool = cls(db_file)
+                cls._shared[key] = pool
+            return pool
+
+    @property
+    def closed(self) -> bool:
+        """ Закрыт ли пул """
+        return self._closed
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.db_file, check_same_thread=False,
+                              cached_statements=self.cached_statements)
+        con.execute('PRAGMA foreign_keys = ON')
+        for name, value in self.pragmas.items():
+            con.execute(f'PRAGMA {name} = {value}')
+        return con
+
+    def _acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise sqlite3.ProgrammingError('Cannot operate on a closed pool.')
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            pass
+        try:
+            return self._connect()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, con: sqlite3.Connection) -> None:
+        if self._closed:
+            con.close()
+        else:
+            self._idle.put(con)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Получить соединение из пула на время блока with.
+        Вложенные вызовы в одном потоке возвращают то же соединение.
+        Если подключен профилировщик, соединение обернуто профилировщиком.
+        """
+        con: sqlite3.Connection | None = getattr(self._local, 'con', None)
+        if con is not None:
+            yield con
+            return
+        raw = self._acquire()
+        profiler = self.profiler
+        con = raw if profiler is None else profiler.wrap(raw)  # type: ignore[assignment]
+        self._local.con = con
+        try:
+            yield con
+        finally:
+            self._local.con = None
+            if con is not raw:
+                con.finish()  # type: ignore[attr-defined]
+            self._release(raw)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Выполнить блок with в одной транзакции: зафиксировать изменения
+        при успешном завершении блока и откатить при исключении.
+        Транзакции, вложенные в одном потоке, становятся частью внешней:
+        изменения фиксируются один раз при выходе из внешней транзакции.
+        """
+        with self.connection() as con:
+            if getattr(self._local, 'in_transaction', False):
+                yield con
+                return
+            self._local.in_transaction = True
+            try:
+                with con:
+                    yield con
+            finally:
+                self._local.in_transaction = False
+
+    def close(self) -> None:
+        """
+        Закрыть пул и все свободные соединения. Соединения, занятые
+        в момент закрытия, будут закрыты при возврате в пул.
+        """
+        self._closed = True
+        while True:
+            try:
+                con = self._idle.get_nowait()
+            except Empty:
+                break
+            con.close()
+
+    def __enter__(self) -> 'ConnectionPool':
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
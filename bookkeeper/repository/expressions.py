@@ -0,0 +1,359 @@
+"""
+Модуль описывает условия выборки на полях модели
+
+Условие строится из ссылок на поля F и операций сравнения:
+    (F('amount') >= 100) & F('category').in_([1, 2]) | ~(F('comment') == '')
+Поддерживаются ==, !=, <, <=, >, >=, in_, between, сравнение с None
+(IS NULL), а также & (И), | (ИЛИ) и ~ (НЕ). Условие можно передать
+в get_all, iter_all и query вместо словаря where.
+
+Условие компилируется в текст SQL с параметрами для SQLite и в функцию
+Python для остальных репозиториев. Результат компиляции кэшируется
+по форме условия (структуре без значений), поэтому условия, которые
+отличаются только значениями, компилируются один раз.
+
+Сравнение поля со значением None ложно, поэтому ~ от сравнения
+его выполняет: ~(F('parent') > 1) выбирает и объекты с parent = None.
+В SQL результат тот же, хотя сравнение с NULL там дает NULL.
+"""
+import keyword
+from functools import lru_cache
+from typing import Any, Callable, Iterable
+
+Shape = tuple[Any, ...]
+
+_SQL_OPS = {'=': '=', '!=': '!=', '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+_PYTHON_OPS = {'=': '==', '!=': '!=', '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+
+
+class _Values(tuple):  # type: ignore[type-arg]
+    """ Значения условия IN: в SQL каждое значение - отдельный параметр """
+    __slots__ = ()
+
+
+class Expression:
+    """
+    Условие выборки. Экземпляры создаются операциями над F
+    и объединяются операциями &, | и ~.
+    """
+    __slots__ = ()
+
+    def __and__(self, other: 'Expression') -> 'Expression':
+        return And((*_parts(self, And), *_parts(other, And)))
+
+    def __or__(self, other: 'Expression') -> 'Expression':
+        return Or((*_parts(self, Or), *_parts(other, Or)))
+
+    def __invert__(self) -> 'Expression':
+        return Not(self)
+
+    def __bool__(self) -> bool:
+        raise TypeError('use &, | and ~ instead of and, or and not in conditions')
+
+    @property
+    def shape(self) -> Shape:
+        """ Форма условия: структура без значений, ключ кэша компиляции """
+        raise NotImplementedError
+
+    def values(self) -> list[Any]:
+        """ Значения условия в порядке их появления в форме """
+        raise NotImplementedError
+
+    def fields(self) -> set[str]:
+        """ Поля, используемые в условии """
+        raise NotImplementedError
+
+    def sql(self) -> tuple[str, list[Any]]:
+        """ Получить текст условия WHERE (без ключевого слова) и параметры """
+        params: list[Any] = []
+        for value in self.values():
+            if isinstance(value, _Values):
+                params.extend(value)
+            else:
+                params.append(value)
+        return compile_sql(self.shape), params
+
+    def predicate(self) -> Callable[[Any], bool]:
+        """ Получить функцию, проверяющую условие для объекта """
+        make = compile_python(self.shape)
+        return make(*(_lookup_set(value) if isinstance(value, _Values) else value
+                      for value in self.values()))
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({compile_sql(self.shape)}, {self.values()})'
+
+
+# условие выборки: словарь равенств {'название_поля': значение},
+# Expression или None (все записи)
+Where = dict[str, Any] | Expression | None
+
+
+def _parts(expr: Expression, cls: type) -> tuple[Expression, ...]:
+    return expr.items if isinstance(expr, cls) else (expr,)  # type: ignore[attr-defined]
+
+
+def _lookup_set(values: tuple[Any, ...]) -> Any:
+    try:
+        return frozenset(values)
+    except TypeError:
+        return values
+
+
+class F:
+    """ Ссылка на поле модели name (или pk) в условии """
+    __slots__ = ('name',)
+
+    def __init__(self, name: str) -> None:
+        if not name.isidentifier() or keyword.iskeyword(name):
+            raise ValueError(f'invalid field name "{name}"')
+        self.name = name
+
+    def __eq__(self, value: Any) -> Expression:  # type: ignore[override]
+        if value is None:
+            return IsNull(self.name)
+        return Comparison(self.name, '=', value)
+
+    def __ne__(self, value: Any) -> Expression:  # type: ignore[override]
+        if value is None:
+            return IsNull(self.name, negated=True)
+        return Comparison(self.name, '!=', value)
+
+    def __lt__(self, value: Any) -> Expression:
+        return Comparison(self.name, '<', value)
+
+    def __le__(self, value: Any) -> Expression:
+        return Comparison(self.name, '<=', value)
+
+    def __gt__(self, value: Any) -> Expression:
+        return Comparison(self.name, '>', value)
+
+    def __ge__(self, value: Any) -> Expression:
+        return Comparison(self.name, '>=', value)
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def in_(self, values: Iterable[Any]) -> Expression:
+        """ Значение поля равно одному из values """
+        return In(self.name, values)
+
+    def between(self, lo: Any, hi: Any) -> Expression:
+        """ Значение поля от lo до hi включительно """
+        return Between(self.name, lo, hi)
+
+
+class Comparison(Expression):
+    """ Сравнение поля со значением """
+    __slots__ = ('field', 'op', 'value')
+
+    def __init__(self, field: str, op: str, value: Any) -> None:
+        self.field, self.op, self.value = field, op, value
+
+    @property
+    def shape(self) -> Shape:
+        return ('cmp', self.field, self.op)
+
+    def values(self) -> list[Any]:
+        return [self.value]
+
+    def fields(self) -> set[str]:
+        return {self.field}
+
+
+class In(Expression):
+    """ Значение поля входит в список значений """
+    __slots__ = ('field', 'items')
+
+    def __init__(self, field: str, values: Iterable[Any]) -> None:
+        self.field, self.items = field, _Values(values)
+
+    @property
+    def shape(self) -> Shape:
+        return ('in', self.field, len(self.items))
+
+    def values(self) -> list[Any]:
+        return [self.items]
+
+    def fields(self) -> set[str]:
+        return {self.field}
+
+
+class Between(Expression):
+    """ Значение поля от lo до hi включительно """
+    __slots__ = ('field', 'lo', 'hi')
+
+    def __init__(self, field: str, lo: Any, hi: Any) -> None:
+        self.field, self.lo, self.hi = field, lo, hi
+
+    @property
+    def shape(self) -> Shape:
+        return ('between', self.field)
+
+    def values(self) -> list[Any]:
+        return [self.lo, self.hi]
+
+    def fields(self) -> set[str]:
+        return {self.field}
+
+
+class IsNull(Expression):
+    """ Значение поля равно (negated - не равно) None """
+    __slots__ = ('field', 'negated')
+
+    def __init__(self, field: str, negated: bool = False) -> None:
+        self.field, self.negated = field, negated
+
+    @property
+    def shape(self) -> Shape:
+        return ('null', self.field, self.negated)
+
+    def values(self) -> list[Any]:
+        return []
+
+    def fields(self) -> set[str]:
+        return {self.field}
+
+
+class And(Expression):
+    """ Выполнены все условия items """
+    __slots__ = ('items',)
+
+    def __init__(self, items: Iterable[Expression]) -> None:
+        self.items = tuple(items)
+
+    @property
+    def shape(self) -> Shape:
+        return (type(self).__name__.lower(), *(item.shape for item in self.items))
+
+    def values(self) -> list[Any]:
+        return [value for item in self.items for value in item.values()]
+
+    def fields(self) -> set[str]:
+        return set().union(*(item.fields() for item in self.items))
+
+
+class Or(And):
+    """ Выполнено хотя бы одно из условий items """
+    __slots__ = ()
+
+
+class Not(Expression):
+    """ Условие item не выполнено """
+    __slots__ = ('item',)
+
+    def __init__(self, item: Expression) -> None:
+        self.item = item
+
+    @property
+    def shape(self) -> Shape:
+        return ('not', self.item.shape)
+
+    def values(self) -> list[Any]:
+        return self.item.values()
+
+    def fields(self) -> set[str]:
+        return self.item.fields()
+
+
+def where_expression(where: dict[str, Any]) -> Expression:
+    """ Получить условие, равносильное словарю where для get_all """
+    return And(F(field) == value for field, value in where.items())
+
+
+def equalities(expr: Expression) -> dict[str, Any]:
+    """
+    Получить равенства полей значениям, которые должны выполняться
+    для всех подходящих объектов (для выбора индекса)
+    """
+    items = expr.items if isinstance(expr, And) and not isinstance(expr, Or) else (expr,)
+    return {item.field: item.value for item in items
+            if isinstance(item, Comparison) and item.op == '='}
+
+
+def field_range(expr: Expression, field: str) -> tuple[Any, Any]:
+    """
+    Получить границы (lo, hi), в которых лежит значение поля field
+    у всех подходящих объектов; None - граница не известна
+    """
+    if isinstance(expr, Between) and expr.field == field:
+        return expr.lo, expr.hi
+    if isinstance(expr, Comparison) and expr.field == field:
+        if expr.op == '=':
+            return expr.value, expr.value
+        if expr.op in ('>', '>='):
+            return expr.value, None
+        if expr.op in ('<', '<='):
+            return None, expr.value
+    if isinstance(expr, And) and not isinstance(expr, Or):
+        lo = hi = None
+        for item in expr.items:
+            item_lo, item_hi = field_range(item, field)
+            if item_lo is not None and (lo is None or item_lo > lo):
+                lo = item_lo
+            if item_hi is not None and (hi is None or item_hi < hi):
+                hi = item_hi
+        return lo, hi
+    return None, None
+
+
+def _column(field: str) -> str:
+    return 'ROWID' if field == 'pk' else f'"{field}"'
+
+
+@lru_cache(maxsize=512)
+def compile_sql(shape: Shape) -> str:
+    """ Получить текст условия SQL с параметрами ? по форме условия """
+    kind = shape[0]
+    if kind == 'cmp':
+        return f'{_column(shape[1])} {_SQL_OPS[shape[2]]} ?'
+    if kind == 'in':
+        return f'{_column(shape[1])} IN ({", ".join("?" * shape[2])})'
+    if kind == 'between':
+        return f'{_column(shape[1])} BETWEEN ? AND ?'
+    if kind == 'null':
+        return f'{_column(shape[1])} IS {"NOT " if shape[2] else ""}NULL'
+    if kind == 'not':
+        # сравнение с NULL дает NULL, а NULL IS NOT 1 истинно: как и в Python,
+        # отрицание сравнения выполняется для значения None
+        return f'(({compile_sql(shape[1])}) IS NOT 1)'
+    if not shape[1:]:
+        return '1' if kind == 'and' else '0'
+    return '(' + f' {kind.upper()} '.join(map(compile_sql, shape[1:])) + ')'
+
+
+def _python(shape: Shape, counter: list[int]) -> str:
+    """ Получить выражение Python от объекта o и значений p0, p1, ... """
+    kind = shape[0]
+    if kind in ('cmp', 'in', 'between'):
+        i = counter[0]
+        counter[0] += 2 if kind == 'between' else 1
+        field = shape[1]
+        if kind == 'between':
+            test = f'p{i} <= v <= p{i + 1}'
+        elif kind == 'in':
+            test = f'v in p{i}'
+        else:
+            test = f'v {_PYTHON_OPS[shape[2]]} p{i}'
+        return f'((v := o.{field}) is not None and {test})'
+    if kind == 'null':
+        return f'(o.{shape[1]} is {"not " if shape[2] else ""}None)'
+    if kind == 'not':
+        return f'(not {_python(shape[1], counter)})'
+    if not shape[1:]:
+        return 'True' if kind == 'and' else 'False'
+    return '(' + f' {kind} '.join(_python(item, counter) for item in shape[1:]) + ')'
+
+
+@lru_cache(maxsize=512)
+def compile_python(shape: Shape) -> Callable[..., Callable[[Any], bool]]:
+    """
+    Получить функцию, которая по значениям условия формы shape
+    возвращает функцию match(o), проверяющую условие для объекта o.
+    Значения попадают в замыкание match, а не в список, так как
+    обращение к переменной замыкания быстрее обращения по индексу.
+    """
+    counter = [0]
+    body = _python(shape, counter)
+    params = ', '.join(f'p{i}' for i in range(counter[0]))
+    make: Callable[..., Callable[[Any], bool]] = eval(  # pylint: disable=eval-used
+        f'lambda {params}: lambda o: {body}', {})
+    return make
@@ -0,0 +1,413 @@
+"""
+Модуль содержит средства замера производительности репозиториев
+
+InstrumentedRepository - обертка над любым репозиторием, которая считает
+вызовы каждого метода, время их выполнения (с гистограммой задержек)
+и количество возвращенных или измененных объектов.
+
+QueryProfiler - профилировщик запросов SQLite, подключаемый к пулу
+соединений (ConnectionPool.profiler). Он собирает статистику по тексту
+каждого запроса, записывает в журнал медленные запросы и может
+прикладывать к ним план выполнения (EXPLAIN QUERY PLAN). Пока
+профилировщик не подключен, пул выдает обычные соединения SQLite
+и замеры ничего не стоят.
+"""
+import logging
+import sqlite3
+from bisect import bisect_left
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field as dc_field
+from time import perf_counter
+from typing import Any, Callable, Iterable, Iterator, Mapping, NamedTuple, Sequence
+
+from bookkeeper.repository.abstract_repository import AbstractRepository, T
+from bookkeeper.repository.expressions import Where
+from bookkeeper.repository.query import OrderBy
+
+logger = logging.getLogger(__name__)
+
+# верхние границы интервалов гистограммы задержек в секундах,
+# последний интервал гистограммы - больше 1 секунды
+LATENCY_BUCKETS = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0)
+
+
+@dataclass
+class TimingStats:
+    """
+    Статистика вызовов операции.
+    calls - количество вызовов
+    errors - количество вызовов, завершившихся исключением
+    rows - количество возвращенных или измененных строк (объектов)
+    total - суммарное время в секундах
+    max - наибольшее время одного вызова
+    histogram - количество вызовов по интервалам LATENCY_BUCKETS
+    """
+    calls: int = 0
+    errors: int = 0
+    rows: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    histogram: list[int] = dc_field(
+        default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+
+    def record(self, elapsed: float, rows: int = 0, error: bool = False) -> None:
+        """ Учесть вызов длительностью elapsed секунд """
+        self.calls += 1
+        self.errors += error
+        self.rows += rows
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.histogram[bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+
+    @property
+    def mean(self) -> float:
+        """ Среднее время вызова """
+        return self.total / self.calls if self.calls else 0.0
+
+
+def format_stats(stats: Mapping[str, TimingStats], limit: int | None = None) -> str:
+    """
+    Получить таблицу статистики, упорядоченную по убыванию
+    суммарного времени. limit - вывести только первые limit строк
+    """
+    lines = [f'{"calls":>8}{"errors":>8}{"rows":>10}{"total, ms":>12}'
+             f'{"mean, ms":>12}{"max, ms":>12}  name']
+    ordered = sorted(stats.items(), key=lambda item: item[1].total, reverse=True)
+    for name, st in ordered[:limit]:
+        lines.append(f'{st.calls:>8}{st.errors:>8}{st.rows:>10}'
+                     f'{st.total * 1e3:>12.3f}{st.mean * 1e3:>12.3f}'
+                     f'{st.max * 1e3:>12.3f}  {name}')
+    return '\n'.join(lines)
+
+
+class InstrumentedRepository(AbstractRepository[T]):
+    """
+    Репозиторий, замеряющий вызовы другого репозитория.
+    Статистика хранится в словаре stats по имени метода. Для методов
+    iter_all и iter_between учитывается время получения всех объектов
+    итератора, запись делается, когда итератор исчерпан или закрыт.
+    События внутреннего репозитория передаются подписчикам обертки.
+    """
+
+    def __init__(self, repo: AbstractRepository[T]) -> None:
+        super().__init__()
+        self.repo = repo
+        self.stats: defaultdict[str, TimingStats] = defaultdict(TimingStats)
+        repo.subscribe(self._on_change)
+
+    def close(self) -> None:
+        """ Отписаться от событий внутреннего репозитория """
+        self.repo.unsubscribe(self._on_change)
+
+    def reset(self) -> None:
+        """ Сбросить статистику """
+        self.stats.clear()
+
+    def report(self, limit: int | None = None) -> str:
+        """ Получить таблицу статистики вызовов """
+        return format_stats(self.stats, limit)
+
+    def _on_change(self, event: str, pk: int, obj: T | None) -> None:
+        self._notify(event, pk, obj)
+
+    def _measure(self, name: str, func: Callable[..., Any], *args: Any,
+                 rows: Callable[[Any], int] = lambda result: 0) -> Any:
+        start = perf_counter()
+        try:
+            result = func(*args)
+        except BaseException:
+            self.stats[name].record(perf_counter() - start, error=True)
+            raise
+        self.stats[name].record(perf_counter() - start, rows(result))
+        return result
+
+    def _iterate(self, name: str, objs: Iterator[T]) -> Iterator[T]:
+        elapsed, rows, error = 0.0, 0, False
+        try:
+            while True:
+                start = perf_counter()
+                try:
+                    obj = next(objs)
+                except StopIteration:
+                    return
+                except BaseException:
+                    error = True
+                    raise
+                finally:
+                    elapsed += perf_counter() - start
+                rows += 1
+                yield obj
+        finally:
+            self.stats[name].record(elapsed, rows, error)
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        with self.deferred_events(), self.repo.transaction():
+            yield
+
+    def add(self, obj: T) -> int:
+        return int(self._measure('add', self.repo.add, obj, rows=lambda _: 1))
+
+    def add_many(self, objs: Iterable[T]) -> list[int]:
+        result: list[int] = self._measure('add_many', self.repo.add_many, objs, rows=len)
+        return result
+
+    def restore_many(self, objs: Iterable[T]) -> None:
+        objs = list(objs)
+        self._measure('restore_many', self.repo.restore_many, objs,
+                      rows=lambda _: len(objs))
+
+    def get(self, pk: int) -> T | None:
+        obj: T | None = self._measure(
+            'get', self.repo.get, pk, rows=lambda result: int(result is not None))
+        return obj
+
+    def get_all(self, where: Where = None) -> list[T]:
+        result: list[T] = self._measure('get_all', self.repo.get_all, where, rows=len)
+        return result
+
+    def iter_all(self, where: Where = None,
+                 batch_size: int = 1000) -> Iterator[T]:
+        return self._iterate('iter_all', self.repo.iter_all(where, batch_size))
+
+    def get_all_like(self, like: dict[str, str]) -> list[T]:
+        result: list[T] = self._measure(
+            'get_all_like', self.repo.get_all_like, like, rows=len)
+        return result
+
+    def get_between(self, field: str, lo: Any, hi: Any) -> list[T]:
+        result: list[T] = self._measure(
+            'get_between', self.repo.get_between, field, lo, hi, rows=len)
+        return result
+
+    def iter_between(self, field: str, lo: Any, hi: Any,
+                     batch_size: int = 1000) -> Iterator[T]:
+        return self._iterate('iter_between',
+                             self.repo.iter_between(field, lo, hi, batch_size))
+
+    def query(self,  # pylint: disable=too-many-arguments
+              fields: Sequence[str] | None = None, where: Where = None,
+              order_by: OrderBy = None, limit: int | None = None,
+              after: Any = None) -> list[Any]:
+        result: list[Any] = self._measure('query', self.repo.query, fields, where,
+                                          order_by, limit, after, rows=len)
+        return result
+
+    def update(self, obj: T) -> None:
+        self._measure('update', self.repo.update, obj, rows=lambda _: 1)
+
+    def update_many(self, objs: Iterable[T]) -> None:
+        objs = list(objs)
+        self._measure('update_many', self.repo.update_many, objs,
+                      rows=lambda _: len(objs))
+
+    def delete(self, pk: int) -> None:
+        self._measure('delete', self.repo.delete, pk, rows=lambda _: 1)
+
+    def delete_many(self, pks: Iterable[int]) -> None:
+        pks = list(pks)
+        self._measure('delete_many', self.repo.delete_many, pks,
+                      rows=lambda _: len(pks))
+
+
+def explain_query_plan(con: sqlite3.Connection, sql: str,
+                       params: Iterable[Any] = ()) -> list[str]:
+    """
+    Получить план выполнения запроса sql (EXPLAIN QUERY PLAN)
+    в виде строк с отступами по уровню вложенности
+    """
+    depth: dict[int, int] = {0: -1}
+    plan = []
+    for node, parent, _, detail in con.execute(
+            f'EXPLAIN QUERY PLAN {sql}', list(params)):
+        depth[node] = depth.get(parent, -1) + 1
+        plan.append('  ' * depth[node] + detail)
+    return plan
+
+
+class SlowQuery(NamedTuple):
+    """ Медленный запрос: текст, параметры, время, строки и план """
+    sql: str
+    params: Any
+    elapsed: float
+    rows: int
+    plan: list[str] | None
+
+
+class QueryProfiler:
+    """
+    Профилировщик запросов SQLite. Подключается к пулу соединений:
+    pool.profiler = QueryProfiler(slow_threshold=0.05)
+    slow_threshold - время в секундах, начиная с которого запрос
+    считается медленным и записывается в журнал (None - не записывать)
+    explain_slow - приложить к медленному запросу план выполнения
+    max_slow - сколько последних медленных запросов хранить в slow
+    Время запроса SELECT включает получение всех прочитанных строк.
+    """
+
+    def __init__(self, slow_threshold: float | None = None,
+                 explain_slow: bool = False, max_slow: int = 100) -> None:
+        self.slow_threshold = slow_threshold
+        self.explain_slow = explain_slow
+        self.queries: defaultdict[str, TimingStats] = defaultdict(TimingStats)
+        self.slow: deque[SlowQuery] = deque(maxlen=max_slow)
+
+    def wrap(self, con: sqlite3.Connection) -> 'ProfiledConnection':
+        """ Получить соединение, сообщающее профилировщику о запросах """
+        return ProfiledConnection(con, self)
+
+    def reset(self) -> None:
+        """ Сбросить статистику """
+        self.queries.clear()
+        self.slow.clear()
+
+    def report(self, limit: int | None = None) -> str:
+        """ Получить таблицу статистики запросов """
+        return format_stats(self.queries, limit)
+
+    def record(self, con: sqlite3.Connection,  # pylint: disable=too-many-arguments
+               sql: str, params: Any, elapsed: float, rows: int,
+               error: bool = False) -> None:
+        """ Учесть выполнение запроса sql на соединении con """
+        self.queries[sql].record(elapsed, rows, error)
+        if self.slow_threshold is None or elapsed < self.slow_threshold:
+            return
+        plan = None
+        if self.explain_slow and params is not None:
+            try:
+                plan = explain_query_plan(con, sql, params)
+            except sqlite3.Error:
+                pass
+        self.slow.append(SlowQuery(sql, params, elapsed, rows, plan))
+        logger.warning('slow query (%.1f ms, %d rows): %s %r%s',
+                       elapsed * 1e3, rows, sql, params,
+                       ''.join(f'\n    {line}' for line in plan or ()))
+
+
+class ProfiledCursor:
+    """
+    Курсор, замеряющий выполнение запроса и чтение его результатов.
+    Запрос учитывается, когда результаты прочитаны полностью либо когда
+    на том же соединении выполняется следующий запрос.
+    """
+
+    def __init__(self, con: 'ProfiledConnection', cur: sqlite3.Cursor,
+                 sql: str, params: Any, elapsed: float) -> None:
+        self._con = con
+        self._cur = cur
+        self._sql = sql
+        self._params = params
+        self._elapsed = elapsed
+        self._rows = 0
+        self._done = False
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cur, name)
+
+    def finish(self) -> None:
+        """ Сообщить о запросе профилировщику, если это еще не сделано """
+        if not self._done:
+            self._done = True
+            self._con.report(self._sql, self._params, self._elapsed, self._rows)
+
+    def _fetch(self, fetch: Callable[..., Any], *args: Any) -> Any:
+        start = perf_counter()
+        result = fetch(*args)
+        self._elapsed += perf_counter() - start
+        return result
+
+    def fetchone(self) -> Any:
+        """ Прочитать следующую строку результата """
+        row = self._fetch(self._cur.fetchone)
+        if row is None:
+            self.finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size: int | None = None) -> list[Any]:
+        """ Прочитать не больше size строк результата """
+        size = self._cur.arraysize if size is None else size
+        rows: list[Any] = self._fetch(self._cur.fetchmany, size)
+        self._rows += len(rows)
+        if len(rows) < size:
+            self.finish()
+        return rows
+
+    def fetchall(self) -> list[Any]:
+        """ Прочитать все оставшиеся строки результата """
+        rows: list[Any] = self._fetch(self._cur.fetchall)
+        self._rows += len(rows)
+        self.finish()
+        return rows
+
+    def __iter__(self) -> Iterator[Any]:
+        return self
+
+    def __next__(self) -> Any:
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+
+class ProfiledConnection:
+    """
+    Обертка над соединением SQLite, передающая в профилировщик
+    текст, параметры, время и количество строк каждого запроса.
+    Остальные атрибуты соединения доступны без изменений.
+    """
+
+    def __init__(self, con: sqlite3.Connection, profiler: QueryProfiler) -> None:
+        self.connection = con
+        self.profiler = profiler
+        self._pending: ProfiledCursor | None = None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.connection, name)
+
+    def __enter__(self) -> 'ProfiledConnection':
+        self.connection.__enter__()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> Any:
+        return self.connection.__exit__(*exc_info)
+
+    def report(self, sql: str, params: Any, elapsed: float, rows: int,
+               error: bool = False) -> None:
+        """ Передать сведения о запросе профилировщику """
+        self.profiler.record(self.connection, sql, params, elapsed, rows, error)
+
+    def finish(self) -> None:
+        """ Учесть запрос, результаты которого прочитаны не полностью """
+        if self._pending is not None:
+            self._pending.finish()
+            self._pending = None
+
+    def _run(self, method: Callable[..., sqlite3.Cursor], sql: str,
+             params: Any, shown: Any) -> Any:
+        self.finish()
+        start = perf_counter()
+        try:
+            cur = method(sql, params)
+        except BaseException:
+            self.report(sql, shown, perf_counter() - start, 0, error=True)
+            raise
+        elapsed = perf_counter() - start
+        if cur.description is None:
+            self.report(sql, shown, elapsed, max(cur.rowcount, 0))
+            return cur
+        self._pending = ProfiledCursor(self, cur, sql, shown, elapsed)
+        return self._pending
+
+    def execute(self, sql: str, params: Any = ()) -> Any:
+        """ Выполнить запрос, как sqlite3.Connection.execute """
+        return self._run(self.connection.execute, sql, params, params)
+
+    def executemany(self, sql: str, params: Iterable[Any]) -> Any:
+        """
+        Выполнить запрос для каждого набора параметров.
+        Наборы параметров профилировщику не передаются (params = None).
+        """
+        return self._run(self.connection.executemany, sql, params, None)
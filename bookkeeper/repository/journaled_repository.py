@@ -0,0 +1,263 @@
+"""
+Модуль описывает репозиторий в оперативной памяти с журналом
+и отложенной записью в SQLite (write-behind)
+
+Все чтения выполняются из памяти. Каждое изменение сразу дописывается
+строкой в файл журнала и запоминается как ожидающее записи в БД.
+Фоновый поток записывает накопленные изменения в SQLite одной
+транзакцией, когда их становится flush_rows или проходит flush_interval
+секунд, после чего записанные изменения удаляются из журнала.
+При запуске репозиторий загружает данные из БД и повторяет журнал,
+поэтому при аварийном завершении теряется не больше одной недописанной
+строки журнала.
+
+Формат строки журнала - JSON: [событие, id, значения полей], даты
+записываются в ISO 8601, байтовые строки - шестнадцатеричными.
+"""
+import json
+import logging
+import os
+import threading
+from operator import attrgetter
+from datetime import date, datetime
+from typing import Any, Iterable, get_args
+
+from bookkeeper.repository.abstract_repository import T
+from bookkeeper.repository.connection_pool import ConnectionPool
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SqliteRepository, quote
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(value: Any) -> Any:
+    """ Преобразовать значение, которое json не умеет записывать """
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.hex()
+    raise TypeError(f'cannot write {type(value).__name__} to journal')
+
+
+_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_encode)
+
+
+def _decoder(hint: Any) -> Any:
+    """ Получить функцию, восстанавливающую значение поля из JSON """
+    args = [arg for arg in get_args(hint) if arg is not type(None)]
+    if len(args) == 1:
+        hint = args[0]
+    decode = {datetime: datetime.fromisoformat, date: date.fromisoformat,
+              bytes: bytes.fromhex}.get(hint)
+    if decode is None:
+        return lambda value: value
+    return lambda value: None if value is None else decode(value)
+
+
+class JournaledRepository(MemoryRepository[T]):
+    """
+    Репозиторий в памяти с журналом изменений и фоновой записью в SQLite.
+    db_file - путь к файлу БД, cls - класс хранимых объектов
+    journal_file - путь к журналу, по умолчанию db_file + '.journal'
+    flush_rows - сколько ожидающих изменений запускают запись в БД
+    flush_interval - наибольшее время в секундах между записями в БД
+    (None - записывать только по количеству изменений)
+    fsync - сбрасывать журнал на диск после каждого изменения; без fsync
+    журнал переживает аварийное завершение процесса, но не системы
+    pool, hash_indexes, sorted_indexes - как в SqliteRepository
+    и MemoryRepository
+    Изменения одного объекта между записями объединяются, в БД
+    записывается последнее состояние. Ошибка фоновой записи сохраняется
+    в last_error, изменения остаются в журнале и записываются повторно.
+    """
+
+    def __init__(self, db_file: str, cls: type,  # pylint: disable=too-many-arguments
+                 journal_file: str | None = None, flush_rows: int = 10_000,
+                 flush_interval: float | None = 1.0, fsync: bool = False,
+                 pool: ConnectionPool | None = None,
+                 hash_indexes: Iterable[str] = (),
+                 sorted_indexes: Iterable[str] = ()) -> None:
+        if flush_rows < 1:
+            raise ValueError(f'flush rows must be positive, got {flush_rows}')
+        super().__init__(hash_indexes, sorted_indexes)
+        self.store = SqliteRepository[T](db_file, cls, pool=pool)
+        self.obj_cls = cls
+        self.journal_file = journal_file or f'{db_file}.journal'
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.flushes = 0
+        self.last_error: Exception | None = None
+        fields = self.store.fields
+        self._values = attrgetter(*fields) if len(fields) > 1 else (
+            lambda obj: (getattr(obj, *fields),))
+        self._decoders = [_decoder(hint) for hint in fields.values()]
+        table, names = self.store.table_name, ', '.join(map(quote, fields))
+        self._sql_upsert = (f'INSERT OR REPLACE INTO {table} (ROWID, {names}) '
+                            f'VALUES (?, {", ".join("?" * len(fields))})')
+        self._sql_delete = f'DELETE FROM {table} WHERE ROWID = ?'
+        # id -> значения полей или None для удаленных объектов
+        self._pending: dict[int, list[Any] | None] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+
+        # загрузка и повтор журнала выполняются до подписки на события,
+        # поэтому сами не попадают в журнал
+        try:
+            self.restore_many(self.store.iter_all())
+            replayed = self._replay()
+        except BaseException:
+            self.store.close()
+            raise
+        self._journal = open(  # pylint: disable=consider-using-with
+            self.journal_file, 'ab')
+        if replayed:
+            self.flush()
+        self.subscribe(self._record)
+        self._thread = threading.Thread(target=self._run, name='journal-flush',
+                                        daemon=True)
+        self._thread.start()
+
+    def _make(self, pk: int, values: list[Any]) -> T:
+        obj: T = self.obj_cls(**{field: decode(value) for field, decode, value
+                                 in zip(self.store.fields, self._decoders, values)})
+        obj.pk = pk  # type: ignore[attr-defined]
+        return obj
+
+    def _replay(self) -> int:
+        """
+        Повторить изменения из журнала в памяти и запомнить их как
+        ожидающие записи в БД. Недописанная последняя строка (без перевода
+        строки) пропускается и отрезается от журнала, поврежденная строка
+        в другом месте журнала - ошибка ValueError: изменения после нее
+        дали бы состояние, которого никогда не было.
+        Вернуть количество повторенных изменений.
+        """
+        if not os.path.exists(self.journal_file):
+            return 0
+        replayed = 0
+        with open(self.journal_file, 'rb') as journal:
+            position = 0
+            for number, line in enumerate(journal, 1):
+                try:
+                    event, pk, values = json.loads(line)
+                except ValueError as error:
+                    if line.endswith(b'\n'):
+                        raise ValueError(f'journal {self.journal_file}: '
+                                         f'damaged line {number}') from error
+                    logger.warning('journal %s: skipping unfinished last line %d',
+                                   self.journal_file, number)
+                    os.truncate(self.journal_file, position)
+                    break
+                position += len(line)
+                if event == 'delete':
+                    if pk in self._container:
+                        self.delete(pk)
+                    self._pending[pk] = None
+                    replayed += 1
+                    continue
+                obj = self._make(pk, values)
+                if pk in self._container:
+                    self.update(obj)
+                else:
+                    self.restore_many([obj])
+                self._pending[pk] = list(self._values(obj))
+                replayed += 1
+        return replayed
+
+    def _record(self, event: str, pk: int, obj: Any) -> None:
+        """ Записать изменение в журнал и в ожидающие изменения """
+        values = None if obj is None else list(self._values(obj))
+        line = _ENCODER.encode([event, pk, values]).encode() + b'\n'
+        with self._lock:
+            self._journal.write(line)
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+            self._pending[pk] = values
+            if len(self._pending) >= self.flush_rows:
+                self._wakeup.set()
+
+    @property
+    def pending(self) -> int:
+        """ Количество объектов с изменениями, еще не записанными в БД """
+        return len(self._pending)
+
+    def _run(self) -> None:
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._stopped:
+                return
+            try:
+                self.flush()
+            except Exception as error:  # pylint: disable=broad-except
+                self.last_error = error
+                logger.exception('journal %s: flush failed', self.journal_file)
+
+    def flush(self) -> int:
+        """
+        Записать ожидающие изменения в БД одной транзакцией и удалить
+        их из журнала. Вернуть количество записанных объектов.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                position = self._journal.tell()
+            if not pending:
+                return 0
+            upserts = [[pk, *values] for pk, values in pending.items()
+                       if values is not None]
+            deletes = [(pk,) for pk, values in pending.items() if values is None]
+            try:
+                with self.store.pool.transaction() as con:
+                    con.executemany(self._sql_upsert, upserts)
+                    con.executemany(self._sql_delete, deletes)
+            except BaseException:
+                # изменения, сделанные после начала записи, новее неудавшихся
+                with self._lock:
+                    self._pending = {**pending, **self._pending}
+                raise
+            with self._lock:
+                self._truncate(position)
+            self.flushes += 1
+            return len(pending)
+
+    def _truncate(self, position: int) -> None:
+        """
+        Удалить из журнала первые position байт, уже записанные в БД.
+        Оставшаяся часть записывается в новый файл, который заменяет
+        журнал, поэтому при сбое журнал не теряется.
+        """
+        self._journal.close()
+        with open(self.journal_file, 'rb') as journal:
+            journal.seek(position)
+            tail = journal.read()
+        temporary = f'{self.journal_file}.tmp'
+        with open(temporary, 'wb') as journal:
+            journal.write(tail)
+            journal.flush()
+            if self.fsync:
+                os.fsync(journal.fileno())
+        os.replace(temporary, self.journal_file)
+        self._journal = open(  # pylint: disable=consider-using-with
+            self.journal_file, 'ab')
+
+    def close(self) -> None:
+        """ Остановить фоновую запись, записать оставшиеся изменения и закрыть БД """
+        if self._stopped:
+            return
+        self._stopped = True
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+        self._journal.close()
+        self.store.close()
+
+    def __enter__(self) -> 'JournaledRepository[T]':
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
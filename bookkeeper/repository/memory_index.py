@@ -0,0 +1,134 @@
+"""
+Модуль описывает вторичные индексы для репозитория в оперативной памяти
+
+Индекс хранит соответствие между значением поля объекта и id (pk) объектов
+с этим значением. Индекс запоминает значение, под которым объект был
+проиндексирован, поэтому удаление из индекса не требует старой версии объекта.
+"""
+from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right, insort
+from math import inf
+from typing import Any, Iterable
+
+
+class Index(ABC):
+    """
+    Абстрактный вторичный индекс по полю field.
+    """
+
+    def __init__(self, field: str) -> None:
+        self.field = field
+        self._values: dict[int, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def add_many(self, items: Iterable[tuple[int, Any]]) -> None:
+        """ Добавить в индекс пары (pk, значение поля) """
+        for pk, value in items:
+            self.add(pk, value)
+
+    @abstractmethod
+    def add(self, pk: int, value: Any) -> None:
+        """ Добавить в индекс объект с id pk и значением поля value """
+
+    @abstractmethod
+    def remove(self, pk: int) -> None:
+        """ Удалить объект из индекса, если он там есть """
+
+    @abstractmethod
+    def lookup(self, value: Any) -> list[int]:
+        """ Получить id объектов, у которых значение поля равно value """
+
+    @abstractmethod
+    def count(self, value: Any) -> int:
+        """ Количество объектов, у которых значение поля равно value """
+
+
+class HashIndex(Index):
+    """
+    Хэш-индекс для поиска по равенству. Значения поля должны быть хэшируемыми.
+    """
+
+    def __init__(self, field: str) -> None:
+        super().__init__(field)
+        self._buckets: dict[Any, set[int]] = {}
+
+    def add(self, pk: int, value: Any) -> None:
+        self.remove(pk)
+        self._values[pk] = value
+        self._buckets.setdefault(value, set()).add(pk)
+
+    def remove(self, pk: int) -> None:
+        if pk not in self._values:
+            return
+        value = self._values.pop(pk)
+        bucket = self._buckets[value]
+        bucket.discard(pk)
+        if not bucket:
+            del self._buckets[value]
+
+    def lookup(self, value: Any) -> list[int]:
+        return list(self._buckets.get(value, ()))
+
+    def count(self, value: Any) -> int:
+        return len(self._buckets.get(value, ()))
+
+
+class SortedIndex(Index):
+    """
+    Отсортированный индекс для поиска по равенству и по диапазону.
+    Значения поля должны быть сравнимы между собой, значения None
+    в индекс не попадают.
+    """
+
+    # пакеты больше этого размера добавляются с пересортировкой списка
+    _bulk_threshold = 32
+
+    def __init__(self, field: str) -> None:
+        super().__init__(field)
+        self._entries: list[tuple[Any, int]] = []
+
+    def add(self, pk: int, value: Any) -> None:
+        self.remove(pk)
+        self._values[pk] = value
+        if value is not None:
+            insort(self._entries, (value, pk))
+
+    def add_many(self, items: Iterable[tuple[int, Any]]) -> None:
+        items = list(items)
+        if len(items) <= self._bulk_threshold:
+            super().add_many(items)
+            return
+        for pk, _ in items:
+            self.remove(pk)
+        self._values.update(items)
+        self._entries.extend((value, pk) for pk, value in items if value is not None)
+        self._entries.sort()
+
+    def remove(self, pk: int) -> None:
+        if pk not in self._values:
+            return
+        value = self._values.pop(pk)
+        if value is not None:
+            del self._entries[bisect_left(self._entries, (value, pk))]
+
+    def lookup(self, value: Any) -> list[int]:
+        return self.range(value, value)
+
+    def count(self, value: Any) -> int:
+        return self.count_range(value, value)
+
+    def range(self, lo: Any, hi: Any) -> list[int]:
+        """
+        Получить id объектов, у которых значение поля лежит в диапазоне
+        от lo до hi включительно, в порядке возрастания значения
+        """
+        start = bisect_left(self._entries, (lo, -inf))
+        stop = bisect_right(self._entries, (hi, inf), lo=start)
+        return [pk for _, pk in self._entries[start:stop]]
+
+    def count_range(self, lo: Any, hi: Any) -> int:
+        """ Количество объектов со значением поля в диапазоне от lo до hi """
+        start = bisect_left(self._entries, (lo, -inf))
+        return bisect_right(self._entries, (hi, inf), lo=start) - start
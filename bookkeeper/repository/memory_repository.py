@@ -2,46 +2,254 @@
 Модуль описывает репозиторий, работающий в оперативной памяти
 """
 
-from itertools import count
-from typing import Any
+from contextlib import contextmanager
+from typing import Any, Iterable, Iterator
 
 from bookkeeper.repository.abstract_repository import AbstractRepository, T
+from bookkeeper.repository.expressions import Expression, Where, equalities
+from bookkeeper.repository.memory_index import HashIndex, Index, SortedIndex
 
 
 class MemoryRepository(AbstractRepository[T]):
     """
     Репозиторий, работающий в оперативной памяти. Хранит данные в словаре.
+
+    Можно объявить вторичные индексы: хэш-индексы (hash_indexes) для
+    поиска по равенству и отсортированные индексы (sorted_indexes) для
+    поиска по равенству и по диапазону. Индексы обновляются при add,
+    update и delete, get_all и get_between используют их автоматически.
+    Для остальных полей первый запрос по диапазону строит отсортированный
+    индекс, который дальше обновляется при изменениях.
+    Объекты, измененные на месте, нужно сохранять методом update.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, hash_indexes: Iterable[str] = (),
+                 sorted_indexes: Iterable[str] = ()) -> None:
+        super().__init__()
         self._container: dict[int, T] = {}
-        self._counter = count(1)
+        self._next_pk = 1
+        self._indexes: dict[str, Index] = {}
+        for field in hash_indexes:
+            self._indexes[field] = HashIndex(field)
+        for field in sorted_indexes:
+            self._indexes[field] = SortedIndex(field)
+        # отсортированные индексы, построенные запросами по диапазону
+        self._sorted: dict[str, SortedIndex] = {}
+        # в транзакции: id -> объект до начала транзакции (None - объекта не было)
+        self._undo: dict[int, T | None] | None = None
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        Выполнить изменения в блоке with как одну транзакцию: при исключении
+        восстановить состав репозитория. Запоминаются только прежние версии
+        измененных объектов, поэтому транзакция стоит O(числа изменений).
+        Сами объекты не копируются, поэтому изменения объектов на месте
+        не откатываются.
+        """
+        if self._undo is not None:
+            yield
+            return
+        self._undo, next_pk = {}, self._next_pk
+        try:
+            with self.deferred_events():
+                yield
+        except BaseException:
+            self._rollback(self._undo)
+            self._next_pk = next_pk
+            raise
+        finally:
+            self._undo = None
+
+    def _save(self, pks: Iterable[int]) -> None:
+        """ Запомнить прежние версии объектов pks, если идет транзакция """
+        if self._undo is not None:
+            for pk in pks:
+                if pk not in self._undo:
+                    self._undo[pk] = self._container.get(pk)
+
+    def _rollback(self, undo: dict[int, T | None]) -> None:
+        """ Вернуть объектам из undo прежние версии и обновить индексы """
+        self._unindex(undo)
+        for pk, obj in undo.items():
+            if obj is None:
+                self._container.pop(pk, None)
+            else:
+                self._container[pk] = obj
+        self._index([(pk, obj) for pk, obj in undo.items() if obj is not None])
+
+    def _sorted_index(self, field: str) -> SortedIndex:
+        """
+        Получить отсортированный индекс по полю, не объявленному
+        в sorted_indexes: он строится при первом запросе по диапазону
+        и дальше обновляется при изменениях, как объявленные индексы
+        """
+        index = self._sorted.get(field)
+        if index is None:
+            index = SortedIndex(field)
+            index.add_many((pk, getattr(obj, field))
+                           for pk, obj in self._container.items())
+            self._sorted[field] = index
+        return index
+
+    def _all_indexes(self) -> Iterator[Index]:
+        yield from self._indexes.values()
+        yield from self._sorted.values()
+
+    def _index(self, items: list[tuple[int, T]]) -> None:
+        """ Обновить индексы для пар (pk, объект) """
+        for index in self._all_indexes():
+            index.add_many((pk, getattr(obj, index.field, None)) for pk, obj in items)
+
+    def _unindex(self, pks: Iterable[int]) -> None:
+        """ Удалить объекты из индексов """
+        for pk in pks:
+            for index in self._all_indexes():
+                index.remove(pk)
 
     def add(self, obj: T) -> int:
         if getattr(obj, 'pk', None) != 0:
             raise ValueError(f'trying to add object {obj} with filled `pk` attribute')
-        pk = next(self._counter)
+        pk = self._next_pk
+        self._next_pk += 1
+        self._save([pk])
         self._container[pk] = obj
         obj.pk = pk
+        self._index([(pk, obj)])
+        self._notify('add', pk, obj)
         return pk
 
+    def add_many(self, objs: Iterable[T]) -> list[int]:
+        objs = list(objs)
+        for obj in objs:
+            if getattr(obj, 'pk', None) != 0:
+                raise ValueError(f'trying to add object {obj} with filled `pk` attribute')
+        pks = list(range(self._next_pk, self._next_pk + len(objs)))
+        self._next_pk += len(objs)
+        self._save(pks)
+        for pk, obj in zip(pks, objs):
+            obj.pk = pk
+        self._container.update(zip(pks, objs))
+        self._index(list(zip(pks, objs)))
+        for pk, obj in zip(pks, objs):
+            self._notify('add', pk, obj)
+        return pks
+
+    def restore_many(self, objs: Iterable[T]) -> None:
+        objs = list(objs)
+        pks = [obj.pk for obj in objs]
+        if len(set(pks)) != len(pks) or any(
+                pk <= 0 or pk in self._container for pk in pks):
+            raise ValueError('restored objects must have new unique positive ids')
+        self._save(pks)
+        self._container.update(zip(pks, objs))
+        self._index(list(zip(pks, objs)))
+        # следующий id должен быть больше всех восстановленных
+        self._next_pk = max([self._next_pk, *(pk + 1 for pk in pks)])
+        for pk, obj in zip(pks, objs):
+            self._notify('add', pk, obj)
+
     def get(self, pk: int) -> T | None:
         return self._container.get(pk)
 
-    def get_all(self, where: dict[str, Any] | None = None) -> list[T]:
+    def _plan(self, where: dict[str, Any]) -> Index | None:
+        """
+        Выбрать индекс для условия where: среди индексов, покрывающих
+        одно из полей условия, берется дающий меньше всего кандидатов
+        """
+        candidates = [self._indexes[attr] for attr in where if attr in self._indexes]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda index: index.count(where[index.field]))
+
+    def get_all(self, where: Where = None) -> list[T]:
         if where is None:
             return list(self._container.values())
-        return [obj for obj in self._container.values()
-                if all(getattr(obj, attr) == value for attr, value in where.items())]
+        return list(self.iter_all(where))
+
+    def iter_all(self, where: Where = None,
+                 batch_size: int = 1000) -> Iterator[T]:
+        """
+        Перебрать записи по условию where. Список id снимается до начала
+        перебора, поэтому репозиторий можно изменять во время перебора.
+        Expression проверяется скомпилированной функцией, индекс
+        выбирается по равенствам, объединенным через &.
+        """
+        match = None
+        if isinstance(where, Expression):
+            match, where = where.predicate(), equalities(where)
+        where = where or {}
+        index = self._plan(where)
+        if index is None:
+            pks: list[int] = list(self._container)
+        else:
+            pks = sorted(index.lookup(where[index.field]))
+            where = {attr: value for attr, value in where.items() if attr != index.field}
+        container = self._container
+        if match is not None:
+            for pk in pks:
+                obj = container.get(pk)
+                if obj is not None and match(obj):
+                    yield obj
+            return
+        for pk in pks:
+            obj = container.get(pk)
+            if obj is not None and all(getattr(obj, attr) == value
+                                       for attr, value in where.items()):
+                yield obj
 
     def get_all_like(self, like: dict[str, str]) -> list[T]:
         return [obj for obj in self._container.values()
                 if all(value in getattr(obj, attr) for attr, value in like.items())]
 
+    def _range(self, field: str, lo: Any, hi: Any) -> list[int]:
+        index = self._indexes.get(field)
+        if isinstance(index, SortedIndex):
+            return index.range(lo, hi)
+        return self._sorted_index(field).range(lo, hi)
+
+    def get_between(self, field: str, lo: Any, hi: Any) -> list[T]:
+        return [self._container[pk] for pk in self._range(field, lo, hi)]
+
+    def iter_between(self, field: str, lo: Any, hi: Any,
+                     batch_size: int = 1000) -> Iterator[T]:
+        for pk in self._range(field, lo, hi):
+            obj = self._container.get(pk)
+            if obj is not None:
+                yield obj
+
     def update(self, obj: T) -> None:
         if obj.pk == 0:
             raise ValueError('attempt to update object with unknown primary key')
+        self._save([obj.pk])
         self._container[obj.pk] = obj
+        self._index([(obj.pk, obj)])
+        self._notify('update', obj.pk, obj)
+
+    def update_many(self, objs: Iterable[T]) -> None:
+        objs = list(objs)
+        if any(obj.pk == 0 for obj in objs):
+            raise ValueError('attempt to update object with unknown primary key')
+        self._save(obj.pk for obj in objs)
+        self._container.update((obj.pk, obj) for obj in objs)
+        self._index([(obj.pk, obj) for obj in objs])
+        for obj in objs:
+            self._notify('update', obj.pk, obj)
 
     def delete(self, pk: int) -> None:
+        self._save([pk])
         self._container.pop(pk)
+        self._unindex([pk])
+        self._notify('delete', pk, None)
+
+    def delete_many(self, pks: Iterable[int]) -> None:
+        pks = list(pks)
+        for pk in pks:
+            if pk not in self._container:
+                raise KeyError(pk)
+        self._save(pks)
+        for pk in pks:
+            self._container.pop(pk, None)
+        self._unindex(pks)
+        for pk in dict.fromkeys(pks):
+            self._notify('delete', pk, None)
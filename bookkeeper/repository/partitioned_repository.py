@@ -0,0 +1,394 @@
+"""
+Модуль описывает репозиторий расходов SQLite, секционированный по времени
+
+Расходы хранятся в отдельных таблицах по месяцам или годам даты расхода
+(разделах): expense_2023_01, expense_2023_02, ... Таблица-каталог
+хранит список разделов, таблица-справочник - раздел каждого расхода
+по его id, id расходов сквозные для всех разделов. Запросы по диапазону
+дат расхода (get_between, iter_between, отчеты analytics) обращаются
+только к разделам, пересекающимся с диапазоном. Разделы за прошедшие
+периоды можно сделать доступными только для чтения.
+"""
+import heapq
+import sqlite3
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from inspect import get_annotations
+from itertools import chain, islice
+from typing import Any, Iterable, Iterator, Sequence
+
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import AbstractRepository
+from bookkeeper.repository.connection_pool import ConnectionPool
+from bookkeeper.repository.expressions import Expression, Where, equalities, field_range
+from bookkeeper.repository.query import OrderBy, parse_order, sort_key
+from bookkeeper.repository.sqlite_repository import SqliteRepository
+
+GRANULARITIES = ('month', 'year')
+
+
+def partition_key(granularity: str, date: datetime) -> str:
+    """ Получить ключ раздела для даты: '2023_01' для месяца, '2023' для года """
+    if granularity == 'month':
+        return f'{date.year:04}_{date.month:02}'
+    if granularity == 'year':
+        return f'{date.year:04}'
+    raise ValueError(f'unknown granularity "{granularity}"')
+
+
+def partition_bounds(key: str) -> tuple[datetime, datetime]:
+    """ Получить начало раздела и начало следующего раздела по ключу """
+    year, _, month = key.partition('_')
+    if not month:
+        return datetime(int(year), 1, 1), datetime(int(year) + 1, 1, 1)
+    start = datetime(int(year), int(month), 1)
+    if start.month == 12:
+        return start, datetime(start.year + 1, 1, 1)
+    return start, start.replace(month=start.month + 1)
+
+
+class PartitionedExpenseRepository(AbstractRepository[Expense]):
+    """
+    Репозиторий расходов, секционированный по месяцам или годам.
+    db_file - путь к файлу БД
+    granularity - размер раздела: 'month' или 'year'
+    pool, shared - пул соединений, как в SqliteRepository; все разделы
+    используют один пул
+    indexes - поля, по которым создаются индексы в каждом разделе
+    name - префикс имен таблиц
+    get_all и iter_all возвращают расходы по разделам в порядке времени,
+    внутри раздела - по id.
+    """
+
+    def __init__(self,  # pylint: disable=too-many-arguments
+                 db_file: str, granularity: str = 'month',
+                 pool: ConnectionPool | None = None, shared: bool = False,
+                 indexes: Iterable[str] = ('expense_date',),
+                 name: str = 'expense') -> None:
+        if granularity not in GRANULARITIES:
+            raise ValueError(f'unknown granularity "{granularity}"')
+        super().__init__()
+        self.db_file = db_file
+        self.granularity = granularity
+        self.name = name
+        self.fields = get_annotations(Expense, eval_str=True)
+        self.fields.pop('pk')
+        self.indexes = list(indexes)
+        self._owns_pool = pool is None and not shared
+        if pool is None:
+            pool = ConnectionPool.shared(db_file) if shared else ConnectionPool(db_file)
+        self.pool = pool
+        self._directory = f'{name}_directory'
+        self._catalog = f'{name}_partitions'
+        self._partitions: dict[str, SqliteRepository[Expense]] = {}
+        self._read_only: set[str] = set()
+        with self.pool.transaction() as con:
+            con.execute(f'CREATE TABLE IF NOT EXISTS {self._directory} '
+                        f'(pk INTEGER PRIMARY KEY, partition TEXT NOT NULL)')
+            con.execute(f'CREATE TABLE IF NOT EXISTS {self._catalog} '
+                        f'(name TEXT PRIMARY KEY, read_only INTEGER NOT NULL DEFAULT 0)')
+        self._load()
+
+    def _load(self) -> None:
+        """ Прочитать каталог разделов """
+        with self.pool.connection() as con:
+            rows = con.execute(
+                f'SELECT name, read_only FROM {self._catalog} ORDER BY name').fetchall()
+        size = 7 if self.granularity == 'month' else 4
+        partitions = {}
+        for key, _ in rows:
+            if len(key) != size:
+                raise ValueError(f'partition "{key}" does not match '
+                                 f'granularity "{self.granularity}"')
+            partitions[key] = self._partitions.get(key) or self._open(key)
+        self._partitions = partitions
+        self._read_only = {key for key, read_only in rows if read_only}
+
+    def _open(self, key: str) -> SqliteRepository[Expense]:
+        return SqliteRepository[Expense](self.db_file, Expense, pool=self.pool,
+                                         indexes=self.indexes,
+                                         table_name=f'{self.name}_{key}')
+
+    def close(self) -> None:
+        """ Закрыть соединения, если пул принадлежит репозиторию """
+        if self._owns_pool:
+            self.pool.close()
+
+    def __enter__(self) -> 'PartitionedExpenseRepository':
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    @contextmanager
+    def _writing(self) -> Iterator[sqlite3.Connection]:
+        """
+        Транзакция записи. При откате каталог перечитывается, чтобы
+        забыть разделы, созданные в отмененной транзакции.
+        """
+        try:
+            with self.pool.transaction() as con:
+                yield con
+        except BaseException:
+            self._load()
+            raise
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """ Выполнить изменения во всех разделах в одной транзакции БД """
+        with self.deferred_events(), self._writing():
+            yield
+
+    @property
+    def keys(self) -> list[str]:
+        """ Ключи разделов в порядке времени """
+        return list(self._partitions)
+
+    def partitions(self, lo: datetime | None = None,
+                   hi: datetime | None = None) -> list[SqliteRepository[Expense]]:
+        """
+        Получить разделы, в которые могут попасть расходы с датой
+        от lo до hi включительно, в порядке времени
+        """
+        result = []
+        for key, part in self._partitions.items():
+            start, end = partition_bounds(key)
+            if (hi is None or start <= hi) and (lo is None or end > lo):
+                result.append(part)
+        return result
+
+    def _partition(self, key: str) -> SqliteRepository[Expense]:
+        """ Получить раздел по ключу, создав его при необходимости """
+        part = self._partitions.get(key)
+        if part is None:
+            part = self._open(key)
+            with self.pool.transaction() as con:
+                con.execute(f'INSERT INTO {self._catalog} (name) VALUES (?)', (key,))
+            self._partitions = dict(sorted({**self._partitions, key: part}.items()))
+        return part
+
+    def _key(self, obj: Expense) -> str:
+        key = partition_key(self.granularity, obj.expense_date)
+        if key in self._read_only:
+            raise ValueError(f'partition "{key}" is read-only')
+        return key
+
+    def _locate(self, pk: int) -> str | None:
+        """ Получить ключ раздела расхода по id """
+        with self.pool.connection() as con:
+            row = con.execute(f'SELECT partition FROM {self._directory} WHERE pk = ?',
+                              (pk,)).fetchone()
+        return None if row is None else row[0]
+
+    def _check_fields(self, fields: Iterable[str]) -> None:
+        for field in fields:
+            if field != 'pk' and field not in self.fields:
+                raise ValueError(f'unknown field "{field}"')
+
+    def set_read_only(self, key: str, read_only: bool = True) -> None:
+        """
+        Запретить (или разрешить) изменение раздела key. Запрет
+        поддерживается триггерами, поэтому действует и для изменений
+        в обход репозитория.
+        """
+        if key not in self._partitions:
+            raise KeyError(f'no partition "{key}"')
+        table = self._partitions[key].table_name
+        with self.pool.transaction() as con:
+            con.execute(f'UPDATE {self._catalog} SET read_only = ? WHERE name = ?',
+                        (int(read_only), key))
+            for action in ('insert', 'update', 'delete'):
+                trigger = f'{table}_read_only_{action}'
+                con.execute(
+                    f'CREATE TRIGGER IF NOT EXISTS {trigger} BEFORE {action.upper()} '
+                    f'ON {table} BEGIN '
+                    f'SELECT RAISE(ABORT, \'partition "{key}" is read-only\'); END'
+                    if read_only else f'DROP TRIGGER IF EXISTS {trigger}')
+        if read_only:
+            self._read_only.add(key)
+        else:
+            self._read_only.discard(key)
+
+    def freeze(self, before: datetime) -> list[str]:
+        """
+        Сделать доступными только для чтения все разделы, которые
+        заканчиваются не позже before. Вернуть ключи этих разделов.
+        """
+        keys = [key for key in self._partitions
+                if partition_bounds(key)[1] <= before and key not in self._read_only]
+        for key in keys:
+            self.set_read_only(key)
+        return keys
+
+    def is_read_only(self, key: str) -> bool:
+        """ Доступен ли раздел только для чтения """
+        return key in self._read_only
+
+    def add(self, obj: Expense) -> int:
+        if getattr(obj, 'pk', None) != 0:
+            raise ValueError(f'trying to add object {obj} with filled `pk` attribute')
+        key = self._key(obj)
+        try:
+            with self._writing() as con:
+                part = self._partition(key)
+                cur = con.execute(f'INSERT INTO {self._directory} (partition) VALUES (?)',
+                                  (key,))
+                obj.pk = cur.lastrowid  # type: ignore[assignment]
+                part.restore_many([obj])
+        except BaseException:
+            obj.pk = 0
+            raise
+        self._notify('add', obj.pk, obj)
+        return obj.pk
+
+    def add_many(self, objs: Iterable[Expense]) -> list[int]:
+        """
+        Добавить расходы в одной транзакции: id выделяются подряд
+        после наибольшего id справочника, расходы записываются в разделы
+        одним запросом executemany на раздел
+        """
+        objs = list(objs)
+        for obj in objs:
+            if getattr(obj, 'pk', None) != 0:
+                raise ValueError(f'trying to add object {obj} with filled `pk` attribute')
+        if not objs:
+            return []
+        keys = [self._key(obj) for obj in objs]
+        try:
+            with self._writing() as con:
+                if not con.in_transaction:
+                    con.execute('BEGIN IMMEDIATE')
+                first, = con.execute(
+                    f'SELECT coalesce(max(pk), 0) + 1 FROM {self._directory}').fetchone()
+                for pk, obj in enumerate(objs, first):
+                    obj.pk = pk
+                self._write(con, keys, objs)
+        except BaseException:
+            for obj in objs:
+                obj.pk = 0
+            raise
+        for obj in objs:
+            self._notify('add', obj.pk, obj)
+        return [obj.pk for obj in objs]
+
+    def restore_many(self, objs: Iterable[Expense]) -> None:
+        """
+        Добавить расходы с заполненными id. Если расход с таким id
+        уже есть, выбрасывается sqlite3.IntegrityError
+        """
+        objs = list(objs)
+        keys = [self._key(obj) for obj in objs]
+        with self._writing() as con:
+            self._write(con, keys, objs)
+        for obj in objs:
+            self._notify('add', obj.pk, obj)
+
+    def _write(self, con: sqlite3.Connection, keys: list[str],
+               objs: list[Expense]) -> None:
+        """ Записать расходы с id в справочник и в разделы keys """
+        con.executemany(f'INSERT INTO {self._directory} (pk, partition) VALUES (?, ?)',
+                        ((obj.pk, key) for key, obj in zip(keys, objs)))
+        groups: dict[str, list[Expense]] = defaultdict(list)
+        for key, obj in zip(keys, objs):
+            groups[key].append(obj)
+        for key, group in groups.items():
+            self._partition(key).restore_many(group)
+
+    def get(self, pk: int) -> Expense | None:
+        key = self._locate(pk)
+        return None if key is None else self._partitions[key].get(pk)
+
+    def _where_partitions(self, where: Where) -> list[SqliteRepository[Expense]]:
+        """
+        Разделы, в которых могут быть расходы, подходящие под условие.
+        Для Expression учитываются равенство pk и границы даты расхода
+        из условий, объединенных через &.
+        """
+        if where is None:
+            return list(self._partitions.values())
+        if isinstance(where, Expression):
+            self._check_fields(where.fields())
+            equal = equalities(where)
+            lo, hi = field_range(where, 'expense_date')
+        else:
+            self._check_fields(where)
+            equal = where
+            lo = hi = where.get('expense_date')
+        if 'pk' in equal:
+            key = self._locate(equal['pk'])
+            return [] if key is None else [self._partitions[key]]
+        return self.partitions(lo, hi)
+
+    def get_all(self, where: Where = None) -> list[Expense]:
+        return [exp for part in self._where_partitions(where)
+                for exp in part.get_all(where)]
+
+    def iter_all(self, where: Where = None,
+                 batch_size: int = 1000) -> Iterator[Expense]:
+        return chain.from_iterable(part.iter_all(where, batch_size)
+                                   for part in self._where_partitions(where))
+
+    def query(self,  # pylint: disable=too-many-arguments
+              fields: Sequence[str] | None = None, where: Where = None,
+              order_by: OrderBy = None, limit: int | None = None,
+              after: Any = None) -> list[Any]:
+        """
+        Выполнить запрос (проекция, условие, порядок, after и limit)
+        в БД в каждом разделе и слить упорядоченные результаты разделов,
+        взяв первые limit записей
+        """
+        found = [part.query(fields, where, order_by, limit, after)
+                 for part in self._where_partitions(where)]
+        merged = heapq.merge(*found, key=sort_key(parse_order(order_by)))
+        return list(islice(merged, limit))
+
+    def get_all_like(self, like: dict[str, str]) -> list[Expense]:
+        self._check_fields(like)
+        return [exp for part in self._partitions.values()
+                for exp in part.get_all_like(like)]
+
+    def _range_partitions(self, field: str, lo: Any,
+                          hi: Any) -> list[SqliteRepository[Expense]]:
+        self._check_fields([field])
+        if field == 'expense_date':
+            return self.partitions(lo, hi)
+        return list(self._partitions.values())
+
+    def get_between(self, field: str, lo: Any, hi: Any) -> list[Expense]:
+        return [exp for part in self._range_partitions(field, lo, hi)
+                for exp in part.get_between(field, lo, hi)]
+
+    def iter_between(self, field: str, lo: Any, hi: Any,
+                     batch_size: int = 1000) -> Iterator[Expense]:
+        return chain.from_iterable(part.iter_between(field, lo, hi, batch_size)
+                                   for part in self._range_partitions(field, lo, hi))
+
+    def update(self, obj: Expense) -> None:
+        old = self._locate(obj.pk)
+        if old is None:
+            raise ValueError('No object with such primary key in DB to update.')
+        if old in self._read_only:
+            raise ValueError(f'partition "{old}" is read-only')
+        new = self._key(obj)
+        with self._writing() as con:
+            if old == new:
+                self._partitions[old].update(obj)
+            else:
+                # расход с новой датой переносится в другой раздел
+                self._partitions[old].delete(obj.pk)
+                self._partition(new).restore_many([obj])
+                con.execute(f'UPDATE {self._directory} SET partition = ? WHERE pk = ?',
+                            (new, obj.pk))
+        self._notify('update', obj.pk, obj)
+
+    def delete(self, pk: int) -> None:
+        key = self._locate(pk)
+        if key is None:
+            raise KeyError('No object with such primary key in DB to delete.')
+        if key in self._read_only:
+            raise ValueError(f'partition "{key}" is read-only')
+        with self._writing() as con:
+            self._partitions[key].delete(pk)
+            con.execute(f'DELETE FROM {self._directory} WHERE pk = ?', (pk,))
+        self._notify('delete', pk, None)
@@ -0,0 +1,135 @@
+"""
+Модуль описывает параметры выборки AbstractRepository.query
+
+Проекция (fields) - список полей, вместо объектов возвращаются легкие
+именованные кортежи Row с этими полями. Поля порядка и pk, не указанные
+в fields, добавляются в конец Row, поэтому последнюю строку страницы
+можно передать в after для получения следующей. Порядок (order_by) - поле или
+список полей, '-' перед именем поля означает порядок по убыванию;
+в конец порядка всегда добавляется pk, поэтому порядок однозначен.
+Постраничный вывод по ключу (after) - выдать записи, следующие в этом
+порядке за записью after (последней записью предыдущей страницы).
+Значения None считаются меньше любых других, как NULL в SQLite.
+Для постраничного вывода из SQLite поля порядка не должны быть None:
+сравнение с NULL в условии after ложно.
+"""
+import heapq
+from collections import namedtuple
+from functools import lru_cache
+from typing import Any, Callable, Iterable, NamedTuple, Sequence
+
+# поле или список полей, '-' перед именем - по убыванию
+OrderBy = str | Sequence[str] | None
+
+
+def parse_order(order_by: OrderBy) -> list[tuple[str, bool]]:
+    """
+    Получить порядок в виде списка пар (поле, по убыванию),
+    заканчивающегося полем pk
+    """
+    names = [] if order_by is None else [order_by] if isinstance(order_by, str) \
+        else list(order_by)
+    order = [(name[1:], True) if name.startswith('-') else (name, False)
+             for name in names]
+    if 'pk' not in (field for field, _ in order):
+        order.append(('pk', False))
+    return order
+
+
+def projection(fields: Sequence[str], order: list[tuple[str, bool]]) -> tuple[str, ...]:
+    """ Получить поля Row: fields и недостающие поля порядка order """
+    fields = tuple(fields)
+    return fields + tuple(field for field, _ in order if field not in fields)
+
+
+def check_after(order: list[tuple[str, bool]], after: Any) -> None:
+    """ Проверить, что у записи after есть все поля порядка order """
+    missing = [field for field, _ in order if not hasattr(after, field)]
+    if missing:
+        raise ValueError(f'after must have order fields {", ".join(missing)}')
+
+
+@lru_cache(maxsize=256)
+def row_type(fields: tuple[str, ...]) -> type[NamedTuple]:
+    """ Получить класс именованного кортежа с полями fields """
+    return namedtuple('Row', fields)  # type: ignore[return-value]
+
+
+class _Descending:
+    """ Обертка значения ключа сортировки с обратным порядком """
+    __slots__ = ('value',)
+
+    def __init__(self, value: Any) -> None:
+        self.value = value
+
+    def __lt__(self, other: '_Descending') -> bool:
+        return bool(other.value < self.value)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _Descending) and self.value == other.value
+
+    __hash__ = None  # type: ignore[assignment]
+
+
+def sort_key(order: list[tuple[str, bool]]) -> Callable[[Any], tuple[Any, ...]]:
+    """ Получить ключ сортировки объектов или строк в порядке order """
+    def key(obj: Any) -> tuple[Any, ...]:
+        values = []
+        for field, descending in order:
+            value = getattr(obj, field)
+            item = (value is not None, value)
+            values.append(_Descending(item) if descending else item)
+        return tuple(values)
+    return key
+
+
+def keyset_condition(order: list[tuple[str, bool]], column: Callable[[str], str],
+                     after: Any) -> tuple[str, list[Any]]:
+    """
+    Получить условие SQL "запись следует за after в порядке order"
+    и его параметры. column - функция, возвращающая выражение столбца
+    по имени поля. Если все поля упорядочены в одну сторону, условие
+    записывается сравнением кортежей и может использовать индекс.
+    """
+    check_after(order, after)
+    values = [getattr(after, field) for field, _ in order]
+    columns = [column(field) for field, _ in order]
+    directions = {descending for _, descending in order}
+    if len(directions) == 1:
+        op = '<' if directions.pop() else '>'
+        return (f'({", ".join(columns)}) {op} ({", ".join("?" * len(columns))})',
+                values)
+    alternatives, params = [], []
+    for i, (_, descending) in enumerate(order):
+        parts = [f'{col} = ?' for col in columns[:i]]
+        parts.append(f'{columns[i]} {"<" if descending else ">"} ?')
+        alternatives.append(f'({" AND ".join(parts)})')
+        params.extend(values[:i + 1])
+    return f'({" OR ".join(alternatives)})', params
+
+
+def select(objs: Iterable[Any], fields: Sequence[str] | None = None,
+           order_by: OrderBy = None, limit: int | None = None,
+           after: Any = None) -> list[Any]:
+    """
+    Выбрать из objs записи по параметрам query: отсортировать,
+    пропустить записи до after включительно, взять первые limit
+    (выбор limit наименьших выполняется кучей за O(n log limit))
+    и спроецировать на поля fields
+    """
+    order = parse_order(order_by)
+    key = sort_key(order)
+    if after is not None:
+        check_after(order, after)
+        bound = key(after)
+        objs = (obj for obj in objs if bound < key(obj))
+    if limit is None:
+        result = sorted(objs, key=key)
+    else:
+        result = heapq.nsmallest(limit, objs, key=key)
+    if fields is None:
+        return result
+    fields = projection(fields, order)
+    make = row_type(fields)._make
+    return [make([getattr(obj, field) for field in fields]) for obj in result]
+
@@ -0,0 +1,258 @@
+"""
+Модуль описывает полнотекстовый поиск по текстовому полю объектов
+(например, по комментариям расходов)
+
+Запрос состоит из слов, найденный объект должен содержать все слова
+запроса. Слово со звездочкой на конце (такс*) ищется как префикс.
+Регистр не учитывается, словом считается последовательность букв и цифр.
+Результаты упорядочены по релевантности (BM25), при равной
+релевантности - по id.
+
+Для SQLite используется виртуальная таблица FTS5, которая обновляется
+триггерами на таблице репозитория. Для остальных репозиториев
+поддерживается инвертированный индекс в памяти, который обновляется
+по событиям репозитория.
+
+Индекс для репозитория создается функцией make_search_index.
+"""
+import heapq
+import re
+from abc import ABC, abstractmethod
+from bisect import bisect_left, insort
+from collections import Counter
+from math import log
+from typing import Any, Generic, NamedTuple
+
+from bookkeeper.repository.abstract_repository import AbstractRepository, T
+from bookkeeper.repository.sqlite_repository import SqliteRepository, quote
+
+# параметры BM25, как в функции bm25 FTS5
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD = re.compile(r'[^\W_]+')
+_TERM = re.compile(r'([^\W_]+)(\*?)')
+
+
+def tokenize(text: str) -> list[str]:
+    """ Разбить текст на слова в нижнем регистре """
+    return _WORD.findall(text.casefold())
+
+
+class Term(NamedTuple):
+    """ Слово запроса, prefix - искать слова, начинающиеся с text """
+    text: str
+    prefix: bool
+
+
+def parse_query(query: str) -> list[Term]:
+    """ Разобрать запрос на слова """
+    return [Term(text, bool(star)) for text, star in _TERM.findall(query.casefold())]
+
+
+class AbstractSearchIndex(ABC, Generic[T]):
+    """
+    Абстрактный полнотекстовый индекс по полю field объектов репозитория.
+    Абстрактные методы:
+    search_pks
+    """
+
+    def __init__(self, repo: AbstractRepository[T], field: str = 'comment') -> None:
+        self.repo = repo
+        self.field = field
+
+    def close(self) -> None:
+        """ Перестать обновлять индекс """
+
+    @abstractmethod
+    def search_pks(self, query: str, limit: int | None = None) -> list[int]:
+        """
+        Получить id объектов, подходящих под запрос, по убыванию
+        релевантности, не больше limit
+        """
+
+    def search(self, query: str, limit: int | None = None) -> list[T]:
+        """ Получить объекты, подходящие под запрос, по убыванию релевантности """
+        found = (self.repo.get(pk) for pk in self.search_pks(query, limit))
+        return [obj for obj in found if obj is not None]
+
+
+class InvertedIndex(AbstractSearchIndex[T]):
+    """
+    Инвертированный индекс в памяти для любого репозитория: для каждого
+    слова хранятся id объектов и число вхождений слова. Индекс строится
+    по всем объектам репозитория и обновляется по событиям add, update
+    и delete. Словарь слов хранится отсортированным для поиска по префиксу.
+    """
+
+    def __init__(self, repo: AbstractRepository[T], field: str = 'comment') -> None:
+        super().__init__(repo, field)
+        self._postings: dict[str, dict[int, int]] = {}
+        self._docs: dict[int, Counter[str]] = {}
+        self._words: list[str] = []
+        self._length = 0
+        for obj in repo.iter_all():
+            self._add(obj.pk, obj)  # type: ignore[attr-defined]
+        repo.subscribe(self._on_event)
+
+    def close(self) -> None:
+        self.repo.unsubscribe(self._on_event)
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def _on_event(self, event: str, pk: int, obj: Any) -> None:
+        self._remove(pk)
+        if event != 'delete':
+            self._add(pk, obj)
+
+    def _add(self, pk: int, obj: Any) -> None:
+        counts = Counter(tokenize(getattr(obj, self.field) or ''))
+        self._docs[pk] = counts
+        self._length += counts.total()
+        for word, count in counts.items():
+            posting = self._postings.get(word)
+            if posting is None:
+                posting = self._postings[word] = {}
+                insort(self._words, word)
+            posting[pk] = count
+
+    def _remove(self, pk: int) -> None:
+        counts = self._docs.pop(pk, None)
+        if counts is None:
+            return
+        self._length -= counts.total()
+        for word in counts:
+            posting = self._postings[word]
+            del posting[pk]
+            if not posting:
+                del self._postings[word]
+                del self._words[bisect_left(self._words, word)]
+
+    def _matches(self, term: Term) -> dict[int, int]:
+        """ Получить id объектов со словом term и число вхождений """
+        if not term.prefix:
+            return self._postings.get(term.text, {})
+        matches: Counter[int] = Counter()
+        for i in range(bisect_left(self._words, term.text), len(self._words)):
+            word = self._words[i]
+            if not word.startswith(term.text):
+                break
+            matches.update(self._postings[word])
+        return matches
+
+    def scores(self, query: str) -> dict[int, float]:
+        """ Получить релевантность (BM25) объектов, подходящих под запрос """
+        terms = parse_query(query)
+        if not terms:
+            return {}
+        matches = sorted(map(self._matches, terms), key=len)
+        candidates = set(matches[0]).intersection(*matches[1:])
+        docs = len(self._docs)
+        average = self._length / docs if docs else 0
+        result = dict.fromkeys(candidates, 0.0)
+        for found in matches:
+            idf = max(log((docs - len(found) + 0.5) / (len(found) + 0.5)), 1e-6)
+            for pk in candidates:
+                count = found[pk]
+                norm = 1 - BM25_B + BM25_B * self._docs[pk].total() / average
+                result[pk] += idf * count * (BM25_K1 + 1) / (count + BM25_K1 * norm)
+        return result
+
+    def search_pks(self, query: str, limit: int | None = None) -> list[int]:
+        scores = self.scores(query)
+        if limit is None:
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        else:
+            ranked = heapq.nsmallest(limit, scores.items(),
+                                     key=lambda item: (-item[1], item[0]))
+        return [pk for pk, _ in ranked]
+
+
+class SqliteSearchIndex(AbstractSearchIndex[T]):
+    """
+    Полнотекстовый индекс FTS5 для SQLite. Таблица индекса хранит только
+    слова (external content), текст читается из таблицы репозитория.
+    Индекс обновляется триггерами в той же транзакции, что и таблица,
+    поэтому изменения, сделанные в обход репозитория, тоже учитываются.
+    """
+
+    repo: SqliteRepository[T]
+
+    def __init__(self, repo: SqliteRepository[T], field: str = 'comment') -> None:
+        if repo.fields.get(field) not in (str, str | None):
+            raise ValueError(f'field "{field}" is not a text field')
+        super().__init__(repo, field)
+        self.table_name = f'{repo.table_name}_{field}_fts'
+        with repo.pool.transaction() as con:
+            exists = con.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                (self.table_name,)).fetchone()
+            for sql in self.schema_sql():
+                con.execute(sql)
+            if not exists:
+                self._fill(con)
+
+    def schema_sql(self) -> list[str]:
+        """ Получить DDL для таблицы индекса и триггеров """
+        table, fts, column = self.repo.table_name, self.table_name, quote(self.field)
+        insert = f'INSERT INTO {fts} (rowid, {column}) VALUES (NEW.ROWID, NEW.{column})'
+        delete = (f'INSERT INTO {fts} ({fts}, rowid, {column}) '
+                  f'VALUES (\'delete\', OLD.ROWID, OLD.{column})')
+        return [
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5('
+            f'{column}, content={table}, '
+            f'tokenize="unicode61 remove_diacritics 0")',
+            f'CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} '
+            f'BEGIN {insert}; END',
+            f'CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} '
+            f'BEGIN {delete}; END',
+            f'CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {column} '
+            f'ON {table} BEGIN {delete}; {insert}; END',
+        ]
+
+    def _fill(self, con: Any) -> None:
+        fts = self.table_name
+        con.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+    def rebuild(self) -> None:
+        """ Построить индекс заново по таблице репозитория """
+        with self.repo.pool.transaction() as con:
+            self._fill(con)
+
+    @staticmethod
+    def match_expression(query: str) -> str:
+        """
+        Получить выражение MATCH для запроса. Слова берутся в кавычки,
+        поэтому символы синтаксиса FTS5 в запросе не интерпретируются.
+        """
+        return ' '.join(f'"{term.text}"' + ('*' if term.prefix else '')
+                        for term in parse_query(query))
+
+    def _query(self, columns: str, query: str,
+               limit: int | None) -> list[tuple[Any, ...]]:
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        with self.repo.pool.connection() as con:
+            return con.execute(
+                f'SELECT {columns} FROM {self.table_name} f '
+                f'JOIN {self.repo.table_name} t ON t.ROWID = f.rowid '
+                f'WHERE {self.table_name} MATCH ? ORDER BY f.rank, f.rowid LIMIT ?',
+                (expression, -1 if limit is None else limit)).fetchall()
+
+    def search_pks(self, query: str, limit: int | None = None) -> list[int]:
+        return [row[0] for row in self._query('f.rowid', query, limit)]
+
+    def search(self, query: str, limit: int | None = None) -> list[T]:
+        columns = ', '.join(f't.{quote(field)}' for field in self.repo.fields)
+        rows = self._query(f'{columns}, t.ROWID', query, limit)
+        return list(map(self.repo._row2obj, rows))  # pylint: disable=protected-access
+
+
+def make_search_index(repo: AbstractRepository[T],
+                      field: str = 'comment') -> AbstractSearchIndex[T]:
+    """ Создать полнотекстовый индекс, подходящий для репозитория repo """
+    if isinstance(repo, SqliteRepository):
+        return SqliteSearchIndex(repo, field)
+    return InvertedIndex(repo, field)
@@ -0,0 +1,416 @@
+"""
+Модуль описывает двоичный формат резервной копии (снимка) учета
+
+Снимок содержит секции с объектами моделей (категории, расходы,
+бюджеты). Записи секции имеют фиксированный размер и упакованы
+модулем struct, строки хранятся в куче строк секции, повторяющиеся
+строки - один раз. Поэтому запись с любым номером читается без чтения
+предыдущих, и файл можно читать лениво через mmap.
+
+Формат файла (все числа - little-endian):
+MAGIC
+секции, каждая из которых состоит из
+    u32 - длина заголовка, заголовок - JSON с именем секции, именем
+        модели и списком полей [имя, код типа, может ли быть None]
+    u64 - количество записей, u64 - размер кучи строк
+    записи: битовая маска полей со значением None и значения полей
+    куча строк в UTF-8
+u32 0 - конец файла
+
+Даты хранятся в микросекундах от начала эпохи (без часового пояса),
+строки - смещением в куче и длиной.
+"""
+import json
+import mmap
+import os
+import shutil
+import struct
+from datetime import date, datetime, timedelta
+from inspect import get_annotations
+from itertools import islice
+from tempfile import SpooledTemporaryFile
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, Mapping, get_args
+
+from bookkeeper.models.budget import Budget
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import AbstractRepository
+
+MAGIC = b'BKSNAP\x00\x01'
+
+# коды типов полей и их представление в struct
+TYPE_CODES: dict[type, str] = {
+    bool: 'b', int: 'i', float: 'f', str: 's', bytes: 'y', datetime: 't', date: 'd'}
+STRUCT_CODES = {'b': '?', 'i': 'q', 'f': 'd', 's': 'QI', 'y': 'QI', 't': 'q', 'd': 'q'}
+
+# секции снимка учета и их модели
+LEDGER_MODELS: dict[str, type] = {
+    'category': Category, 'expense': Expense, 'budget': Budget}
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_HEADER = struct.Struct('<I')
+_COUNTS = struct.Struct('<QQ')
+_CHUNK = 1 << 20
+_MAX_CACHED_STRINGS = 100_000
+
+
+def model_fields(cls: type) -> list[tuple[str, str, bool]]:
+    """
+    Получить поля модели cls по аннотациям: список троек
+    (имя, код типа, может ли быть None)
+    """
+    fields = []
+    for name, hint in get_annotations(cls, eval_str=True).items():
+        args = get_args(hint)
+        nullable = type(None) in args
+        if nullable and len(args) == 2:
+            hint = next(arg for arg in args if arg is not type(None))
+        code = TYPE_CODES.get(hint)
+        if code is None:
+            raise ValueError(f'unsupported type of field "{name}": {hint}')
+        fields.append((name, code, nullable))
+    if 'pk' not in (name for name, _, _ in fields):
+        raise ValueError(f'model {cls.__name__} has no pk field')
+    if len(fields) > 64:
+        raise ValueError(f'model {cls.__name__} has too many fields')
+    return fields
+
+
+def row_struct(fields: list[tuple[str, str, bool]]) -> struct.Struct:
+    """ Получить формат записи секции с полями fields """
+    mask = next(code for code, bits in (('B', 8), ('H', 16), ('I', 32), ('Q', 64))
+                if len(fields) <= bits)
+    codes = ''.join(STRUCT_CODES[code] for _, code, _ in fields)
+    return struct.Struct('<' + mask + codes)
+
+
+class SnapshotWriter:
+    """
+    Запись снимка в файл path. Объекты каждой секции перебираются
+    один раз и сразу записываются в файл, куча строк накапливается
+    во временном файле, поэтому память не зависит от размера секции.
+    Снимок пишется во временный файл рядом с path, который заменяет
+    path только при успешном закрытии, поэтому при ошибке записи
+    прежний снимок сохраняется.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._temporary = f'{path}.tmp'
+        self._file: BinaryIO = open(  # pylint: disable=consider-using-with
+            self._temporary, 'wb')
+        self._file.write(MAGIC)
+
+    def close(self) -> None:
+        """ Записать признак конца файла, закрыть файл и заменить им path """
+        if not self._file.closed:
+            self._file.write(_HEADER.pack(0))
+            self._file.close()
+            os.replace(self._temporary, self.path)
+
+    def discard(self) -> None:
+        """ Закрыть и удалить незаконченный снимок, не трогая path """
+        if not self._file.closed:
+            self._file.close()
+            os.remove(self._temporary)
+
+    def __enter__(self) -> 'SnapshotWriter':
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, *exc_info: object) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def write_section(self, name: str, cls: type, objs: Iterable[Any]) -> int:
+        """ Записать секцию name с объектами objs модели cls, вернуть их количество """
+        file = self._file
+        fields = model_fields(cls)
+        header = json.dumps({'name': name, 'model': cls.__name__, 'fields': fields},
+                            ensure_ascii=False).encode()
+        file.write(_HEADER.pack(len(header)))
+        file.write(header)
+        counts_at = file.tell()
+        file.write(_COUNTS.pack(0, 0))
+        pack = row_struct(fields).pack
+        with SpooledTemporaryFile(max_size=_CHUNK) as heap:
+            offsets: dict[bytes, int] = {}
+            heap_size = 0
+
+            def heap_offset(data: bytes) -> int:
+                nonlocal heap_size
+                offset = offsets.get(data)
+                if offset is None:
+                    offset = heap_size
+                    heap.write(data)
+                    heap_size += len(data)
+                    if len(offsets) < _MAX_CACHED_STRINGS:
+                        offsets[data] = offset
+                return offset
+
+            rows = 0
+            buffer = bytearray()
+            for obj in objs:
+                mask = 0
+                values: list[Any] = []
+                for bit, (field, code, nullable) in enumerate(fields):
+                    value = getattr(obj, field)
+                    if value is None:
+                        if not nullable:
+                            raise ValueError(f'field "{field}" of {obj} is None')
+                        mask |= 1 << bit
+                        values.extend((0, 0) if code in 'sy' else (0,))
+                    elif code in 'sy':
+                        data = value.encode() if code == 's' else bytes(value)
+                        values.extend((heap_offset(data), len(data)))
+                    elif code == 't':
+                        values.append((value - _EPOCH) // _MICROSECOND)
+                    elif code == 'd':
+                        values.append(value.toordinal())
+                    else:
+                        values.append(value)
+                buffer += pack(mask, *values)
+                rows += 1
+                if len(buffer) >= _CHUNK:
+                    file.write(buffer)
+                    buffer.clear()
+            file.write(buffer)
+            heap.seek(0)
+            shutil.copyfileobj(heap, file)
+        end = file.tell()
+        file.seek(counts_at)
+        file.write(_COUNTS.pack(rows, heap_size))
+        file.seek(end)
+        return rows
+
+
+class SnapshotSection:
+    """
+    Секция снимка как последовательность объектов только для чтения.
+    Объекты создаются при обращении к записи или при переборе.
+    """
+
+    def __init__(self, data: mmap.mmap, cls: type,  # pylint: disable=too-many-arguments
+                 fields: list[tuple[str, str, bool]], rows: int, start: int) -> None:
+        self.cls = cls
+        self.fields = fields
+        self._data = data
+        self._rows = rows
+        self._start = start
+        self._struct = row_struct(fields)
+        self._decode = self._make_decoder(start + rows * self._struct.size)
+
+    def _make_decoder(self, heap: int) -> Callable[[tuple[Any, ...]], Any]:
+        """
+        Построить функцию, создающую объект по распакованной записи.
+        Функция генерируется один раз для секции, как фабрика строк
+        в SqliteRepository.
+        """
+        data = self._data
+        # строка хранится в куче один раз и декодируется один раз:
+        # объекты с одинаковыми комментариями ссылаются на одну строку
+        texts: dict[int, str] = {}
+
+        def text(offset: int, length: int) -> str:
+            value = texts[offset] = data[heap + offset:heap + offset + length].decode()
+            if len(texts) > _MAX_CACHED_STRINGS:
+                texts.clear()
+            return value
+
+        args = []
+        slot = 1
+        for bit, (field, code, nullable) in enumerate(self.fields):
+            if code == 's':
+                value = (f'(_texts[t[{slot}]] if t[{slot}] in _texts '
+                         f'else _text(t[{slot}], t[{slot + 1}]))')
+                slot += 2
+            elif code == 'y':
+                value = f'_data[_heap + t[{slot}]:_heap + t[{slot}] + t[{slot + 1}]]'
+                slot += 2
+            else:
+                value = {'t': f'_epoch + _us * t[{slot}]',
+                         'd': f'_ordinal(t[{slot}])'}.get(code, f't[{slot}]')
+                slot += 1
+            if nullable:
+                value = f'(None if t[0] & {1 << bit} else {value})'
+            args.append(f'{field}={value}')
+        decoder: Callable[[tuple[Any, ...]], Any] = eval(  # pylint: disable=eval-used
+            f'lambda t: _cls({", ".join(args)})',
+            {'_cls': self.cls, '_data': data, '_heap': heap, '_texts': texts,
+             '_text': text, '_epoch': _EPOCH, '_us': _MICROSECOND,
+             '_ordinal': date.fromordinal})
+        return decoder
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def __getitem__(self, index: int) -> Any:
+        if index < 0:
+            index += self._rows
+        if not 0 <= index < self._rows:
+            raise IndexError('snapshot row index out of range')
+        return self._decode(self._struct.unpack_from(
+            self._data, self._start + index * self._struct.size))
+
+    def __iter__(self) -> Iterator[Any]:
+        size = self._struct.size
+        per_chunk = max(1, _CHUNK // size)
+        for first in range(0, self._rows, per_chunk):
+            last = min(first + per_chunk, self._rows)
+            chunk = self._data[self._start + first * size:self._start + last * size]
+            yield from map(self._decode, self._struct.iter_unpack(chunk))
+
+    def columns(self) -> tuple[dict[str, list[Any]], list[str]]:
+        """
+        Распаковать секцию по столбцам, не создавая объектов: для каждого
+        поля - список значений в формате хранения (даты - микросекунды
+        от начала эпохи, date - порядковый номер дня), для строк - номер
+        строки в возвращаемом списке строк, для None - None.
+        Записи распаковываются и транспонируются средствами struct и zip,
+        без цикла Python по записям (кроме строк и полей с None).
+        """
+        records = self._data[self._start:self._start + self._rows * self._struct.size]
+        raw = list(zip(*self._struct.iter_unpack(records))) if self._rows else \
+            [()] * (1 + sum(2 if code in 'sy' else 1 for _, code, _ in self.fields))
+        masks = raw[0] if any(raw[0]) else None
+        heap = self._start + self._rows * self._struct.size
+        strings: dict[tuple[int, int], int] = {}
+        columns: dict[str, list[Any]] = {}
+        slot = 1
+        for bit, (field, code, _) in enumerate(self.fields):
+            values: list[Any] = list(zip(raw[slot], raw[slot + 1])) if code in 'sy' \
+                else list(raw[slot])
+            slot += 2 if code in 'sy' else 1
+            if masks is not None:
+                values = [None if mask & (1 << bit) else value
+                          for mask, value in zip(masks, values)]
+            if code == 's':
+                values = [None if key is None else strings.setdefault(key, len(strings))
+                          for key in values]
+            elif code == 'y':
+                values = [None if key is None else
+                          bytes(self._data[heap + key[0]:heap + key[0] + key[1]])
+                          for key in values]
+            columns[field] = values
+        texts = [self._data[heap + offset:heap + offset + length].decode()
+                 for offset, length in strings]
+        return columns, texts
+
+
+class SnapshotReader:
+    """
+    Чтение снимка из файла path через mmap. Секции доступны по имени
+    (reader['expense']), объекты читаются лениво.
+    models - модели секций по именам секций
+    """
+
+    def __init__(self, path: str, models: Mapping[str, type] | None = None) -> None:
+        models = LEDGER_MODELS if models is None else models
+        with open(path, 'rb') as file:
+            self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.sections: dict[str, SnapshotSection] = {}
+        try:
+            self._read_sections(models)
+        except BaseException:
+            self._data.close()
+            raise
+
+    def _read_sections(self, models: Mapping[str, type]) -> None:
+        data = self._data
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError('not a snapshot file')
+        pos = len(MAGIC)
+        while True:
+            (length,) = _HEADER.unpack_from(data, pos)
+            pos += _HEADER.size
+            if length == 0:
+                return
+            header = json.loads(data[pos:pos + length])
+            pos += length
+            rows, heap_size = _COUNTS.unpack_from(data, pos)
+            pos += _COUNTS.size
+            fields = [tuple(field) for field in header['fields']]
+            name = header['name']
+            cls = models.get(name)
+            if cls is None:
+                raise ValueError(f'unknown snapshot section "{name}"')
+            known = {field for field, _, _ in model_fields(cls)}
+            missing = [field for field, _, _ in fields if field not in known]
+            if missing:
+                raise ValueError(f'model {cls.__name__} has no fields {missing}')
+            section = SnapshotSection(
+                data, cls, fields, rows, pos)  # type: ignore[arg-type]
+            self.sections[name] = section
+            row_size = section._struct.size  # pylint: disable=protected-access
+            pos += rows * row_size + heap_size
+
+    def close(self) -> None:
+        """ Закрыть файл """
+        self._data.close()
+
+    def __enter__(self) -> 'SnapshotReader':
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def __getitem__(self, name: str) -> SnapshotSection:
+        return self.sections[name]
+
+    def load(self, name: str, repo: AbstractRepository[Any],
+             chunk_size: int = 10_000) -> int:
+        """
+        Загрузить объекты секции name в репозиторий repo с сохранением id
+        (restore_many) пакетами по chunk_size в одной транзакции репозитория.
+        Расходы загружаются в репозиторий с методом restore_columns
+        (ColumnarExpenseRepository) столбцами, без создания объектов.
+        Вернуть количество загруженных объектов.
+        """
+        section = self.sections[name]
+        restore_columns = getattr(repo, 'restore_columns', None)
+        if restore_columns is not None and section.cls is Expense:
+            # колоночный репозиторий принимает столбцы снимка без объектов
+            with repo.transaction():
+                restore_columns(*section.columns())
+            return len(section)
+        objs = iter(section)
+        with repo.transaction():
+            while chunk := list(islice(objs, chunk_size)):
+                repo.restore_many(chunk)
+        return len(self.sections[name])
+
+
+def export_ledger(path: str, cat_repo: AbstractRepository[Category],
+                  exp_repo: AbstractRepository[Expense],
+                  budget_repo: AbstractRepository[Budget] | None = None
+                  ) -> dict[str, int]:
+    """
+    Записать снимок учета: категории, расходы и (если задан
+    репозиторий) бюджеты. Вернуть количество объектов в секциях.
+    """
+    repos: dict[str, AbstractRepository[Any]] = {
+        'category': cat_repo, 'expense': exp_repo}
+    if budget_repo is not None:
+        repos['budget'] = budget_repo
+    with SnapshotWriter(path) as writer:
+        return {name: writer.write_section(name, LEDGER_MODELS[name], repo.iter_all())
+                for name, repo in repos.items()}
+
+
+def import_ledger(path: str, cat_repo: AbstractRepository[Category],
+                  exp_repo: AbstractRepository[Expense],
+                  budget_repo: AbstractRepository[Budget] | None = None
+                  ) -> dict[str, int]:
+    """
+    Загрузить снимок учета в пустые репозитории с сохранением id.
+    Вернуть количество загруженных объектов в секциях.
+    """
+    repos: dict[str, AbstractRepository[Any]] = {
+        'category': cat_repo, 'expense': exp_repo}
+    if budget_repo is not None:
+        repos['budget'] = budget_repo
+    with SnapshotReader(path) as reader:
+        return {name: reader.load(name, repo) for name, repo in repos.items()
+                if name in reader.sections}
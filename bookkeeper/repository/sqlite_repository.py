@@ -2,115 +2,452 @@
 Модуль содержит описание репозитория для SQLite
 """
 import sqlite3
-
-from inspect import get_annotations
-from typing import Any
+from contextlib import contextmanager
+from datetime import date, datetime
+from inspect import get_annotations, signature
+from math import inf
+from typing import Any, Callable, Iterable, Iterator, Sequence, get_args
 
 from bookkeeper.repository.abstract_repository import AbstractRepository, T
+from bookkeeper.repository.connection_pool import ConnectionPool
+from bookkeeper.repository.expressions import Expression, Where
+from bookkeeper.repository.instrumentation import explain_query_plan
+from bookkeeper.repository.query import (
+    OrderBy, keyset_condition, parse_order, projection, row_type)
 
+# типы столбцов SQLite для типов полей модели
+SQL_TYPES: dict[type, str] = {
+    int: 'INTEGER',
+    bool: 'INTEGER',
+    float: 'REAL',
+    str: 'TEXT',
+    bytes: 'BLOB',
+    datetime: 'TIMESTAMP',
+    date: 'DATE',
+}
 
-class SqliteRepository(AbstractRepository[T]):
+# Даты хранятся строками ISO 8601 с пробелом между датой и временем, как
+# у адаптеров sqlite3 по умолчанию (устарели в Python 3.12), чтобы строки
+# в существующих БД сравнивались с новыми. Обратно строки преобразуются
+# функцией, построенной _make_row_factory.
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+
+
+def sql_type(hint: Any) -> str:
+    """
+    Получить тип столбца SQLite для аннотации поля. Для необязательных
+    полей (X | None) используется тип X, для неизвестных типов - пустая
+    строка (столбец без объявленного типа).
+    """
+    args = [arg for arg in get_args(hint) if arg is not type(None)]
+    if len(args) == 1:
+        hint = args[0]
+    return SQL_TYPES.get(hint, '')
+
+
+def quote(name: str) -> str:
+    """ Заключить имя столбца в кавычки """
+    return f'"{name}"'
 
+
+class SqliteRepository(AbstractRepository[T]):
     """
     Репозиторий для SQLite. Хранит данные в БД.
+    Соединения с БД берутся из пула и не закрываются между вызовами.
+    db_file - путь к файлу БД
+    cls - класс хранимых объектов, имя таблицы по умолчанию - имя класса
+    в нижнем регистре
+    pool - пул соединений; если не задан, репозиторий создает свой пул
+    shared - использовать общий пул для всех репозиториев с тем же файлом БД
+    create_table - создать таблицу по аннотациям модели, если ее нет
+    indexes - поля, по которым нужно создать индексы, например
+    ('expense_date', 'category') для расходов
+    table_name - имя таблицы, если оно отличается от имени класса
     """
-    def __init__(self, db_file: str, cls: type) -> None:
+
+    def __init__(self, db_file: str, cls: type,  # pylint: disable=too-many-arguments
+                 pool: ConnectionPool | None = None,
+                 shared: bool = False,
+                 create_table: bool = True,
+                 indexes: Iterable[str] = (),
+                 table_name: str | None = None) -> None:
+        super().__init__()
         self.db_file = db_file
-        self.table_name = cls.__name__.lower()
+        self.table_name = table_name or cls.__name__.lower()
         self.fields = get_annotations(cls, eval_str=True)
         self.fields.pop('pk')
         self.obj_cls = cls
+        self._owns_pool = pool is None and not shared
+        if pool is None:
+            pool = ConnectionPool.shared(db_file) if shared else ConnectionPool(db_file)
+        self.pool = pool
+
+        # тексты запросов строятся один раз, подготовленные выражения
+        # кэшируются соединениями пула по тексту запроса
+        # имена столбцов заключаются в кавычки: поля модели могут совпадать
+        # с ключевыми словами SQL (например, Budget.limit)
+        names = ', '.join(map(quote, self.fields))
+        placeholders = ', '.join('?' * len(self.fields))
+        assignments = ', '.join(f'{quote(f)} = ?' for f in self.fields)
+        self._sql_insert = (f'INSERT INTO {self.table_name} ({names}) '
+                            f'VALUES ({placeholders})')
+        self._sql_select = f'SELECT {names}, ROWID FROM {self.table_name}'
+        self._sql_get = f'{self._sql_select} WHERE ROWID = ?'
+        self._sql_update = (f'UPDATE {self.table_name} SET {assignments} '
+                            f'WHERE ROWID = ?')
+        self._sql_delete = f'DELETE FROM {self.table_name} WHERE ROWID = ?'
+        self._sql_restore = (f'INSERT INTO {self.table_name} (ROWID, {names}) '
+                             f'VALUES (?, {placeholders})')
+        self._row2obj = self._make_row_factory()
+        self.indexes = list(indexes)
+        for field in self.indexes:
+            if field not in self.fields:
+                raise ValueError(f'unknown field "{field}"')
+        if create_table or self.indexes:
+            with self.pool.transaction() as con:
+                for sql in self.schema_sql(create_table):
+                    con.execute(sql)
+
+    def schema_sql(self, create_table: bool = True) -> list[str]:
+        """
+        Получить DDL для таблицы и индексов репозитория. Таблица содержит
+        столбец pk - псевдоним ROWID, чтобы id не менялись при VACUUM.
+        """
+        statements = []
+        if create_table:
+            columns = ', '.join(f'{quote(name)} {sql_type(hint)}'.rstrip()
+                                for name, hint in self.fields.items())
+            statements.append(f'CREATE TABLE IF NOT EXISTS {self.table_name} '
+                              f'(pk INTEGER PRIMARY KEY, {columns})')
+        statements.extend(f'CREATE INDEX IF NOT EXISTS {self.table_name}_{field} '
+                          f'ON {self.table_name} ({quote(field)})'
+                          for field in self.indexes)
+        return statements
+
+    def close(self) -> None:
+        """ Закрыть соединения, если пул принадлежит репозиторию """
+        if self._owns_pool:
+            self.pool.close()
+
+    def __enter__(self) -> 'SqliteRepository[T]':
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        Выполнить изменения в блоке with в одной транзакции БД.
+        Репозитории с общим пулом соединений, изменяемые в том же потоке
+        внутри блока, участвуют в той же транзакции.
+        """
+        with self.deferred_events(), self.pool.transaction():
+            yield
+
+    def _values(self, obj: T) -> list[Any]:
+        return [getattr(obj, f) for f in self.fields]
 
     def add(self, obj: T) -> int:
         if getattr(obj, 'pk', None) != 0:
             raise ValueError(f'trying to add object {obj} with filled `pk` attribute')
-        names = ', '.join(self.fields.keys())
-        p = ', '.join("?" * len(self.fields))
-        values = [getattr(obj, f) for f in self.fields]
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
-            cur.execute('PRAGMA foreign_keys = ON')
-            cur.execute(
-                f'INSERT INTO {self.table_name} ({names}) VALUES({p})',
-                values
-            )
-            if (type(cur.lastrowid) is int):
+        with self.pool.transaction() as con:
+            cur = con.execute(self._sql_insert, self._values(obj))
+            if isinstance(cur.lastrowid, int):
                 obj.pk = cur.lastrowid
-        con.close()
+        self._notify('add', obj.pk, obj)
         return obj.pk
 
-    """ Метод преобразует строку в объект типа Т """
-    def _row2obj(self, rowid: int, row: tuple[Any]) -> T:
-        kwargs = dict(zip(self.fields, row))
-        obj = self.obj_cls(**kwargs)
-        obj.pk = rowid
-        return obj
+    def add_many(self, objs: Iterable[T]) -> list[int]:
+        """
+        Добавить объекты одним запросом executemany в одной транзакции.
+        Пока транзакция держит блокировку на запись, новые строки получают
+        идущие подряд ROWID, больше максимального ROWID до вставки.
+        Это проверяется, после чего id записываются в объекты.
+        """
+        objs = list(objs)
+        for obj in objs:
+            if getattr(obj, 'pk', None) != 0:
+                raise ValueError(f'trying to add object {obj} with filled `pk` attribute')
+        if not objs:
+            return []
+        with self.pool.transaction() as con:
+            if not con.in_transaction:
+                con.execute('BEGIN IMMEDIATE')
+            prev_max = con.execute(
+                f'SELECT max(ROWID) FROM {self.table_name}').fetchone()[0] or 0
+            con.executemany(self._sql_insert, map(self._values, objs))
+            last = con.execute('SELECT last_insert_rowid()').fetchone()[0]
+            first = last - len(objs) + 1
+            inserted = con.execute(
+                f'SELECT count(*) FROM {self.table_name} '
+                f'WHERE ROWID BETWEEN ? AND ?', (first, last)).fetchone()[0]
+            if first <= prev_max or inserted != len(objs):
+                raise RuntimeError('cannot determine primary keys of inserted rows')
+            for pk, obj in enumerate(objs, first):
+                obj.pk = pk
+        for obj in objs:
+            self._notify('add', obj.pk, obj)
+        return list(range(first, last + 1))
+
+    def restore_many(self, objs: Iterable[T]) -> None:
+        """
+        Добавить объекты с заполненными id одним запросом executemany
+        в одной транзакции. Если запись с таким id уже есть, выбрасывается
+        sqlite3.IntegrityError и ни один объект не добавляется.
+        """
+        objs = list(objs)
+        with self.pool.transaction() as con:
+            con.executemany(self._sql_restore,
+                            ([obj.pk, *self._values(obj)] for obj in objs))
+        for obj in objs:
+            self._notify('add', obj.pk, obj)
+
+    def _make_row_factory(self) -> Callable[[tuple[Any, ...]], T]:
+        """
+        Построить функцию, преобразующую строку таблицы (поля, ROWID)
+        в объект типа T. Функция генерируется один раз для модели:
+        если конструктор принимает поля модели и pk позиционно в том же
+        порядке, объект создается позиционным вызовом без промежуточного
+        словаря. Поля типа datetime, хранящиеся в БД строками,
+        преобразуются обратно в datetime.
+        """
+        cls = self.obj_cls
+        decode = [i for i, hint in enumerate(self.fields.values())
+                  if hint is datetime or datetime in get_args(hint)]
+        try:
+            params = list(signature(cls).parameters)
+        except (TypeError, ValueError):
+            params = []
+        if params == [*self.fields, 'pk']:
+            if not decode:
+                return lambda row: cls(*row)  # type: ignore[no-any-return]
+            args = ', '.join(
+                f'(_iso(r[{i}]) if r[{i}].__class__ is str else r[{i}])'
+                if i in decode else f'r[{i}]'
+                for i in range(len(params)))
+            factory: Callable[[tuple[Any, ...]], T] = eval(  # pylint: disable=eval-used
+                f'lambda r: _cls({args})',
+                {'_cls': cls, '_iso': datetime.fromisoformat})
+            return factory
+        names = list(self.fields)
+
+        def make(row: tuple[Any, ...]) -> T:
+            values = list(row)
+            for i in decode:
+                if isinstance(values[i], str):
+                    values[i] = datetime.fromisoformat(values[i])
+            obj: T = cls(**dict(zip(names, values)))
+            obj.pk = row[-1]
+            return obj
+        return make
 
     def get(self, pk: int) -> T | None:
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
-            row = cur.execute(
-                f'SELECT * FROM {self.table_name} '
-                + f'WHERE ROWID=={pk}'
-            ).fetchone()
-        con.close()
+        with self.pool.connection() as con:
+            row = con.execute(self._sql_get, (pk,)).fetchone()
         if row is None:
             return None
-        obj = self._row2obj(pk, row)
-        return obj
-
-    def get_all(self, where: dict[str, Any] | None = None) -> list[T]:
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
-            if where is None:  # если условие не задано (по умолчанию), вернуть все записи
-                rows = cur.execute(
-                    f'SELECT ROWID, * FROM {self.table_name} '
-                ).fetchall()
-            else:
-                fields = " AND ".join([f"{f}=?" for f in where.keys()])
-                rows = cur.execute(
-                    f'SELECT ROWID, * FROM {self.table_name} '
-                    + f'WHERE {fields}',
-                    list(where.values())
-                ).fetchall()
-        con.close()
-        return [self._row2obj(r[0], r[1:-1]) for r in rows]
+        return self._row2obj(row)
+
+    def _select(self, condition: str = '', params: Iterable[Any] = ()) -> list[T]:
+        """
+        Получить объекты по условию на языке SQL
+        condition - текст условия WHERE (без ключевого слова) или пустая строка
+        params - значения параметров условия
+        """
+        sql = f'{self._sql_select} WHERE {condition}' if condition else self._sql_select
+        with self.pool.connection() as con:
+            rows = con.execute(sql, list(params)).fetchall()
+        return list(map(self._row2obj, rows))
+
+    def _iter_select(self, condition: str = '', params: Iterable[Any] = (),
+                     batch_size: int = 1000) -> Iterator[T]:
+        """
+        Перебрать объекты по условию на языке SQL пакетами по batch_size.
+        Каждый пакет читается отдельным запросом с продолжением после
+        последнего прочитанного ROWID, поэтому между пакетами соединение
+        возвращается в пул и не удерживает транзакцию чтения.
+        """
+        params = list(params)
+        condition = f' AND ({condition})' if condition else ''
+        sql = (f'{self._sql_select} WHERE ROWID > ?{condition} '
+               f'ORDER BY ROWID LIMIT ?')
+        last: float = -inf
+        while True:
+            with self.pool.connection() as con:
+                cur = con.execute(sql, [last, *params, batch_size])
+                rows = cur.fetchmany(batch_size)
+            yield from map(self._row2obj, rows)
+            if len(rows) < batch_size:
+                return
+            last = rows[-1][-1]
+
+    def _where_sql(self, where: dict[str, Any]) -> str:
+        """ Получить текст условия на равенство полям where """
+        for field in where:
+            if field not in self.fields and field != 'pk':
+                raise ValueError(f'unknown field "{field}"')
+        return ' AND '.join('ROWID = ?' if f == 'pk' and f not in self.fields
+                            else f'{quote(f)} = ?' for f in where)
+
+    def _condition(self, where: Where) -> tuple[str, list[Any]]:
+        """ Получить текст условия where (словаря или Expression) и параметры """
+        if isinstance(where, Expression):
+            for field in where.fields():
+                self._column(field)
+            return where.sql()
+        return self._where_sql(where), list(where.values())  # type: ignore[union-attr]
+
+    def explain(self, where: Where = None) -> list[str]:
+        """
+        Получить план выполнения (EXPLAIN QUERY PLAN) запроса get_all(where),
+        например, чтобы проверить, используется ли индекс
+        """
+        sql = self._sql_select
+        condition, params = ('', []) if where is None else self._condition(where)
+        if condition:
+            sql += f' WHERE {condition}'
+        with self.pool.connection() as con:
+            return explain_query_plan(con, sql, params)
+
+    def get_all(self, where: Where = None) -> list[T]:
+        if where is None:  # если условие не задано (по умолчанию), вернуть все записи
+            return self._select()
+        return self._select(*self._condition(where))
+
+    def iter_all(self, where: Where = None,
+                 batch_size: int = 1000) -> Iterator[T]:
+        if where is None:
+            return self._iter_select(batch_size=batch_size)
+        return self._iter_select(*self._condition(where), batch_size)
 
     def get_all_like(self, like: dict[str, str]) -> list[T]:
-        values = [f"%{v}%" for v in like.values()]
-        where = dict(zip(like.keys(), values))
-        return self.get_all(where=where)
+        """
+        Получить записи, поля которых содержат подстроки из like.
+        Подстроки ищутся оператором LIKE, символы % и _ в них экранируются;
+        как и LIKE в SQLite, поиск не учитывает регистр латинских букв.
+        """
+        condition = ' AND '.join(f"{self._column(field)} LIKE ? ESCAPE '\\'"
+                                 for field in like)
+        params = ['%' + value.replace('\\', '\\\\').replace('%', '\\%')
+                  .replace('_', '\\_') + '%' for value in like.values()]
+        return self._select(condition, params)
+
+    def get_between(self, field: str, lo: Any, hi: Any) -> list[T]:
+        if field not in self.fields:
+            raise ValueError(f'unknown field "{field}"')
+        return self._select(f'{quote(field)} BETWEEN ? AND ?', (lo, hi))
+
+    def iter_between(self, field: str, lo: Any, hi: Any,
+                     batch_size: int = 1000) -> Iterator[T]:
+        if field not in self.fields:
+            raise ValueError(f'unknown field "{field}"')
+        return self._iter_select(f'{quote(field)} BETWEEN ? AND ?', (lo, hi),
+                                 batch_size)
+
+    def _column(self, field: str) -> str:
+        """ Получить выражение столбца для поля модели или pk """
+        if field == 'pk':
+            return 'ROWID'
+        if field not in self.fields:
+            raise ValueError(f'unknown field "{field}"')
+        return quote(field)
+
+    def _projector(self, fields: tuple[str, ...]) -> Callable[[tuple[Any, ...]], Any]:
+        """
+        Получить функцию, преобразующую строку выборки полей fields
+        в именованный кортеж; даты, хранящиеся строками, преобразуются
+        в datetime
+        """
+        make = row_type(fields)._make
+        decode = [i for i, field in enumerate(fields) if field != 'pk' and (
+            self.fields[field] is datetime or datetime in get_args(self.fields[field]))]
+        if not decode:
+            return make
+
+        def project(row: tuple[Any, ...]) -> Any:
+            values = list(row)
+            for i in decode:
+                if isinstance(values[i], str):
+                    values[i] = datetime.fromisoformat(values[i])
+            return make(values)
+        return project
+
+    def query(self,  # pylint: disable=too-many-arguments
+              fields: Sequence[str] | None = None, where: Where = None,
+              order_by: OrderBy = None, limit: int | None = None,
+              after: Any = None) -> list[Any]:
+        """
+        Получить записи одним запросом: проекция, условие, порядок,
+        условие after и limit выполняются в БД. При проекции объекты
+        модели не создаются.
+        """
+        order = parse_order(order_by)
+        sql_order = ', '.join(f'{self._column(field)}{" DESC" if descending else ""}'
+                              for field, descending in order)
+        condition, params = ('', []) if where is None else self._condition(where)
+        conditions = [condition] if condition else []
+        if after is not None:
+            condition, values = keyset_condition(order, self._column, after)
+            conditions.append(condition)
+            params.extend(values)
+        if fields is None:
+            sql = self._sql_select
+            convert = self._row2obj
+        else:
+            fields = projection(fields, order)
+            sql = (f'SELECT {", ".join(map(self._column, fields))} '
+                   f'FROM {self.table_name}')
+            convert = self._projector(fields)
+        if conditions:
+            sql += f' WHERE {" AND ".join(conditions)}'
+        sql += f' ORDER BY {sql_order} LIMIT ?'
+        params.append(-1 if limit is None else limit)
+        with self.pool.connection() as con:
+            rows = con.execute(sql, params).fetchall()
+        return list(map(convert, rows))
 
     def update(self, obj: T) -> None:
-        fields = ", ".join([f"{f}=?" for f in self.fields.keys()])
-        values = [getattr(obj, f) for f in self.fields]
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
-            cur.execute(
-                f'UPDATE {self.table_name} SET {fields} '
-                + f'WHERE ROWID=={obj.pk}',
-                values
-            )
+        with self.pool.transaction() as con:
+            cur = con.execute(self._sql_update, self._values(obj) + [obj.pk])
             if cur.rowcount == 0:
                 raise ValueError('No object with such primary key in DB to update.')
-        con.close()
+        self._notify('update', obj.pk, obj)
+
+    def update_many(self, objs: Iterable[T]) -> None:
+        objs = list(objs)
+        with self.pool.transaction() as con:
+            cur = con.executemany(self._sql_update,
+                                  (self._values(obj) + [obj.pk] for obj in objs))
+            if cur.rowcount != len(objs):
+                raise ValueError('No object with such primary key in DB to update.')
+        for obj in objs:
+            self._notify('update', obj.pk, obj)
 
-    """ Удалить запись """
     def delete(self, pk: int) -> None:
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
-            cur.execute(
-                f'DELETE FROM  {self.table_name} '
-                + f'WHERE ROWID=={pk}'
-            )
+        with self.pool.transaction() as con:
+            cur = con.execute(self._sql_delete, (pk,))
             if cur.rowcount == 0:
-                raise ValueError('No object with such primary key in DB to delete.')
-        con.close()
+                raise KeyError('No object with such primary key in DB to delete.')
+        self._notify('delete', pk, None)
+
+    def delete_many(self, pks: Iterable[int]) -> None:
+        pks = list(dict.fromkeys(pks))
+        with self.pool.transaction() as con:
+            cur = con.executemany(self._sql_delete, ((pk,) for pk in pks))
+            if cur.rowcount != len(pks):
+                raise KeyError('No object with such primary key in DB to delete.')
+        for pk in pks:
+            self._notify('delete', pk, None)
 
-    """ Удалить все записи """
     def delete_all(self) -> None:
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
-            cur.execute('PRAGMA foreign_keys = ON')
-            cur.execute(f'DELETE FROM {self.table_name}')
-            con.close()
+        """ Удалить все записи """
+        with self.pool.transaction() as con:
+            pks = []
+            if self._listeners:
+                pks = [pk for pk, in con.execute(
+                    f'SELECT ROWID FROM {self.table_name}')]
+            con.execute(f'DELETE FROM {self.table_name}')
+        for pk in pks:
+            self._notify('delete', pk, None)
@@ -0,0 +1,46 @@
+"""
+Модуль описывает единицу работы (unit of work) над несколькими репозиториями
+"""
+from contextlib import ExitStack
+from types import TracebackType
+from typing import Any
+
+from bookkeeper.repository.abstract_repository import AbstractRepository
+
+
+class UnitOfWork:
+    """
+    Единица работы: изменения нескольких репозиториев в блоке with
+    выполняются как одна транзакция и откатываются при исключении.
+
+    Репозитории SQLite должны использовать общий пул соединений
+    (параметры pool или shared), тогда все изменения фиксируются одним
+    COMMIT. Репозитории в разных файлах БД фиксируются по отдельности.
+    События изменений доставляются подписчикам только после фиксации
+    всех транзакций.
+
+    Пример:
+    with UnitOfWork(exp_repo, budget_repo):
+        exp_repo.add(expense)
+        budget_repo.update(budget)
+    """
+
+    def __init__(self, *repos: AbstractRepository[Any]) -> None:
+        self.repos = repos
+        self._stack: ExitStack | None = None
+
+    def __enter__(self) -> 'UnitOfWork':
+        with ExitStack() as stack:
+            for repo in self.repos:
+                stack.enter_context(repo.deferred_events())
+            for repo in self.repos:
+                stack.enter_context(repo.transaction())
+            self._stack = stack.pop_all()
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None,
+                 exc: BaseException | None,
+                 traceback: TracebackType | None) -> bool:
+        assert self._stack is not None
+        stack, self._stack = self._stack, None
+        return stack.__exit__(exc_type, exc, traceback)
@@ -4,6 +4,7 @@
 
 from bookkeeper.models.category import Category
 from bookkeeper.models.expense import Expense
+from bookkeeper.importer import import_file
 from bookkeeper.repository.memory_repository import MemoryRepository
 from bookkeeper.utils import read_tree
 
@@ -33,6 +34,18 @@ while True:
         print(*cat_repo.get_all(), sep='\n')
     elif cmd == 'расходы':
         print(*exp_repo.get_all(), sep='\n')
+    elif cmd.startswith('импорт '):
+        path = cmd.split(maxsplit=1)[1]
+        try:
+            with open(path, encoding='utf-8') as file:
+                report = import_file(file, exp_repo, cat_repo,
+                                     'ofx' if path.lower().endswith('.ofx') else 'csv')
+        except OSError as error:
+            print(error)
+            continue
+        print(report)
+        for reject in report.rejects[:10]:
+            print(f'строка {reject.line}: {reject.reason}')
     elif cmd[0].isdecimal():
         amount, name = cmd.split(maxsplit=1)
         try:
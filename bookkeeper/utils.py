@@ -16,6 +16,62 @@ def _lines_with_indent(lines: Iterable[str]) -> Iterator[tuple[int, str]]:
         yield _get_indent(line), line.strip()
 
 
+def iter_tree_paths(lines: Iterable[str]) -> Iterator[tuple[str, ...]]:
+    """
+    Прочитать структуру дерева из текста на основе отступов, как read_tree,
+    по одной строке за раз. Для каждого элемента выдать его путь - кортеж
+    названий от элемента верхнего уровня до самого элемента.
+    Хранится только путь к текущему элементу, поэтому файл любого размера
+    читается в постоянной памяти (пропорциональной глубине дерева).
+
+    Пример. Для текста из примера read_tree:
+    ('parent',), ('parent', 'child1'), ('parent', 'child1', 'child2'),
+    ('parent', 'child3')
+
+    Parameters
+    ----------
+    lines - Итерируемый объект, содержащий строки текста (файл или список строк)
+
+    Yields
+    -------
+    Пути элементов в порядке топологической сортировки
+    """
+    indents: list[int] = []
+    path: list[str] = []
+    for i, (indent, name) in enumerate(_lines_with_indent(lines)):
+        if indents and indent <= indents[-1]:
+            while indents and indent < indents[-1]:
+                indents.pop()
+                path.pop()
+            if not indents or indent != indents[-1]:
+                raise IndentationError(
+                    f'unindent does not match any outer indentation '
+                    f'level in line {i}:\n'
+                )
+            indents.pop()
+            path.pop()
+        indents.append(indent)
+        path.append(name)
+        yield tuple(path)
+
+
+def iter_tree(lines: Iterable[str]) -> Iterator[tuple[str, str | None]]:
+    """
+    Перебрать пары "потомок-родитель" дерева из текста на основе отступов,
+    как read_tree, не строя список пар
+
+    Parameters
+    ----------
+    lines - Итерируемый объект, содержащий строки текста (файл или список строк)
+
+    Yields
+    -------
+    Пары "потомок-родитель" в порядке топологической сортировки
+    """
+    for path in iter_tree_paths(lines):
+        yield path[-1], path[-2] if len(path) > 1 else None
+
+
 def read_tree(lines: Iterable[str]) -> list[tuple[str, str | None]]:
     """
     Прочитать структуру дерева из текста на основе отступов. Вернуть список
@@ -42,22 +98,4 @@ def read_tree(lines: Iterable[str]) -> list[tuple[str, str | None]]:
     -------
     Список пар "потомок-родитель"
     """
-    parents: list[tuple[str | None, int]] = []
-    last_indent = -1
-    last_name = None
-    result: list[tuple[str, str | None]] = []
-    for i, (indent, name) in enumerate(_lines_with_indent(lines)):
-        if indent > last_indent:
-            parents.append((last_name, last_indent))
-        elif indent < last_indent:
-            while indent < last_indent:
-                _, last_indent = parents.pop()
-            if indent != last_indent:
-                raise IndentationError(
-                    f'unindent does not match any outer indentation '
-                    f'level in line {i}:\n'
-                )
-        result.append((name, parents[-1][0]))
-        last_name = name
-        last_indent = indent
-    return result
+    return list(iter_tree(lines))
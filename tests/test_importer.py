@@ -0,0 +1,172 @@
+import io
+from datetime import datetime, timezone
+from textwrap import dedent
+
+import pytest
+
+from bookkeeper.importer import (
+    CategoryResolver, ExpenseImporter, import_file, parse_amount, parse_date,
+    read_csv, read_ofx)
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SqliteRepository
+
+OFX = dedent('''
+    OFXHEADER:100
+    <OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+    <STMTTRN>
+    <TRNTYPE>DEBIT
+    <DTPOSTED>20230115123000.000[+3:MSK]
+    <TRNAMT>-250.50
+    <NAME>Пятерочка
+    <MEMO>продукты
+    </STMTTRN>
+    <STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20230116<TRNAMT>1000.00<NAME>Зарплата</STMTTRN>
+    <STMTTRN>
+    <TRNTYPE>DEBIT
+    <DTPOSTED>20230117
+    <TRNAMT>-99
+    <NAME>Такси
+    </STMTTRN>
+    </BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+''')
+
+
+@pytest.fixture
+def cat_repo():
+    repo = MemoryRepository()
+    Category.create_from_tree([('Продукты', None), ('Транспорт', None)], repo)
+    return repo
+
+
+def test_parse_date():
+    assert parse_date('2023-01-15') == datetime(2023, 1, 15)
+    assert parse_date('2023-01-15T10:20') == datetime(2023, 1, 15, 10, 20)
+    assert parse_date('15.01.2023') == datetime(2023, 1, 15)
+    assert parse_date('15.01.2023 10:20') == datetime(2023, 1, 15, 10, 20)
+    assert parse_date('20230115') == datetime(2023, 1, 15)
+    assert parse_date('20230115102030.123') == datetime(2023, 1, 15, 10, 20, 30)
+    with pytest.raises(ValueError):
+        parse_date('yesterday')
+
+
+def test_parse_date_with_offset():
+    date = parse_date('2024-01-06T10:00:00+03:00')
+    assert date.tzinfo is None
+    assert date == datetime(2024, 1, 6, 7, 0, tzinfo=timezone.utc).astimezone() \
+        .replace(tzinfo=None)
+    # тот же момент в формате OFX
+    assert parse_date('20240106020000[-5:EST]') == date
+    assert parse_date('20240106123000.000[+5.5]') == date
+
+
+def test_import_offset_dates(cat_repo):
+    lines = ['date,amount,category,comment',
+             '2024-01-05,10,Продукты,',
+             '2024-01-06T10:00:00+03:00,20,Продукты,']
+    for exp_repo in (MemoryRepository(),
+                     MemoryRepository(sorted_indexes=['expense_date'])):
+        report = ExpenseImporter(exp_repo, CategoryResolver(cat_repo)).run(
+            read_csv(io.StringIO('\n'.join(lines))))
+        assert (report.imported, report.rejected) == (2, 0)
+        found = exp_repo.get_between('expense_date', datetime(2024, 1, 1),
+                                     datetime(2024, 1, 31))
+        assert len(found) == 2
+
+
+def test_parse_amount():
+    assert parse_amount('100') == 100
+    assert parse_amount('1 234,5') == 1235
+    assert parse_amount('12.34', scale=100) == 1234
+    for value in ['', 'abc', 'NaN', 'inf']:
+        with pytest.raises(ValueError):
+            parse_amount(value)
+
+
+def test_read_csv():
+    text = 'Дата;Сумма;Описание\n15.01.2023;100;хлеб\n16.01.2023;200;\n'
+    records = list(read_csv(io.StringIO(text), delimiter=';', columns={
+        'date': 'Дата', 'amount': 'Сумма', 'comment': 'Описание'}))
+    assert [r.line for r in records] == [2, 3]
+    assert records[0].fields == {'date': '15.01.2023', 'amount': '100',
+                                 'category': '', 'comment': 'хлеб'}
+
+
+def test_read_ofx():
+    records = list(read_ofx(io.StringIO(OFX)))
+    assert len(records) == 3
+    assert records[0].line == 4
+    assert records[0].fields == {'date': '20230115123000.000[+3:MSK]',
+                                 'amount': '250.50', 'category': '',
+                                 'comment': 'Пятерочка продукты'}
+    assert records[1].fields['amount'] == '-1000.00'
+    assert records[2].fields['amount'] == '99'
+
+
+def test_category_resolver(cat_repo):
+    resolver = CategoryResolver(cat_repo, rules={'ТАКСИ': 'Транспорт'},
+                                default='Продукты')
+    assert resolver.resolve('продукты') == 1
+    assert resolver.resolve('', 'такси до дома') == 2
+    assert resolver.resolve('', 'прочее') == 1
+    with pytest.raises(ValueError):
+        resolver.resolve('книги')
+    resolver = CategoryResolver(cat_repo, create_missing=True)
+    pk = resolver.resolve('Книги')
+    assert cat_repo.get(pk).name == 'Книги'
+    assert resolver.resolve('книги') == pk
+    with pytest.raises(ValueError):
+        resolver.resolve('')
+
+
+def test_import_csv_chunks_and_rejects(cat_repo):
+    lines = ['date,amount,category,comment']
+    for i in range(25):
+        lines.append(f'2023-01-{i % 28 + 1:02},{i * 10},Продукты,{i}')
+    lines.append('2023-01-01,10,Книги,')
+    lines.append('not a date,10,Продукты,')
+    exp_repo = MemoryRepository()
+    importer = ExpenseImporter(exp_repo, CategoryResolver(cat_repo),
+                               chunk_size=10, max_rejects=2)
+    report = importer.run(read_csv(io.StringIO('\n'.join(lines))))
+    assert report.read == 27
+    assert report.imported == 24
+    assert report.rejected == 3
+    assert [(r.line, r.reason) for r in report.rejects] == [
+        (2, 'not an expense: amount 0'), (27, 'unknown category "Книги"')]
+    assert report.chunks == 3
+    assert report.rows_per_sec > 0
+    assert 'imported 24' in str(report)
+    exps = exp_repo.get_all()
+    assert len(exps) == 24
+    assert exps[0] == Expense(10, 1, datetime(2023, 1, 2), exps[0].added_date, '1', 1)
+
+
+def test_rejected_record_creates_no_category(cat_repo):
+    lines = ['date,amount,category,comment', 'bad-date,50,newcat,x']
+    importer = ExpenseImporter(MemoryRepository(),
+                               CategoryResolver(cat_repo, create_missing=True))
+    report = importer.run(read_csv(io.StringIO('\n'.join(lines))))
+    assert (report.imported, report.rejected) == (0, 1)
+    assert [c.name for c in cat_repo.get_all()] == ['Продукты', 'Транспорт']
+
+
+def test_import_ofx(cat_repo, tmp_path):
+    exp_repo = SqliteRepository(str(tmp_path / 'test.db'), Expense)
+    report = import_file(io.StringIO(OFX), exp_repo, cat_repo, 'ofx',
+                         rules={'такси': 'Транспорт'}, default='Продукты', scale=100)
+    assert (report.imported, report.rejected) == (2, 1)
+    assert report.rejects[0].reason == 'not an expense: amount -1000.00'
+    posted = datetime(2023, 1, 15, 9, 30, tzinfo=timezone.utc).astimezone() \
+        .replace(tzinfo=None)
+    assert [(e.amount, e.category, e.expense_date) for e in exp_repo.get_all()] == [
+        (25050, 1, posted), (9900, 2, datetime(2023, 1, 17))]
+    exp_repo.close()
+
+
+def test_import_file_options(cat_repo):
+    with pytest.raises(ValueError):
+        import_file(io.StringIO(''), MemoryRepository(), cat_repo, 'xls')
+    with pytest.raises(TypeError):
+        import_file(io.StringIO(''), MemoryRepository(), cat_repo, unknown=1)
@@ -1,7 +1,7 @@
 import pytest
 from datetime import datetime, timedelta
 
-from bookkeeper.models.budget import Budget
+from bookkeeper.models.budget import Budget, period_bounds
 from bookkeeper.models.expense import Expense
 
 from bookkeeper.repository.memory_repository import MemoryRepository
@@ -41,3 +41,91 @@ def test_update_spent_day(repo):
     assert b.spent == 500
 
 
+def test_period_bounds():
+    now = datetime(2023, 3, 15, 13, 45)  # среда
+    assert period_bounds('Day', now) == (datetime(2023, 3, 15), datetime(2023, 3, 16))
+    assert period_bounds('Week', now) == (datetime(2023, 3, 13), datetime(2023, 3, 20))
+    assert period_bounds('Month', now) == (datetime(2023, 3, 1), datetime(2023, 4, 1))
+    assert period_bounds('Month', datetime(2023, 12, 31)) == (datetime(2023, 12, 1),
+                                                              datetime(2024, 1, 1))
+
+def test_update_spent_periods(repo):
+    now = datetime(2023, 3, 15, 13, 45)
+    dates = [datetime(2023, 3, 15, 0, 0), datetime(2023, 3, 15, 23, 59),
+             datetime(2023, 3, 13, 8, 0), datetime(2023, 3, 1, 0, 0),
+             datetime(2023, 3, 12, 23, 59), datetime(2023, 4, 1, 0, 0)]
+    for d in dates:
+        repo.add(Expense(10, 1, expense_date=d))
+    spent = {}
+    for period in ['Day', 'Week', 'Month']:
+        b = Budget(period)
+        b.update_spent(repo, now=now)
+        spent[period] = b.spent
+    assert spent == {'Day': 20, 'Week': 30, 'Month': 50}
+
+def test_update_spent_with_total(repo):
+    calls = []
+
+    def total(start, end):
+        calls.append((start, end))
+        return 42
+
+    b = Budget('Day')
+    b.update_spent(repo, now=datetime(2023, 3, 15, 13, 45), total=total)
+    assert b.spent == 42
+    assert calls == [(datetime(2023, 3, 15),
+                      datetime(2023, 3, 16) - timedelta(microseconds=1))]
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def test_incremental_spent(repo):
+    clock = Clock(datetime(2023, 3, 15, 12, 0))
+    old = Expense(1000, 1, expense_date=datetime(2023, 3, 10))
+    today = Expense(100, 1, expense_date=datetime(2023, 3, 15, 9, 0))
+    repo.add_many([old, today])
+    b = Budget('Day', 1000)
+    b.subscribe(repo, clock=clock)
+    assert b.spent == 100
+
+    e = Expense(50, 1, expense_date=datetime(2023, 3, 15, 11, 0))
+    repo.add(e)
+    assert b.spent == 150
+    e.amount = 70
+    repo.update(e)
+    assert b.spent == 170
+    today.expense_date = datetime(2023, 3, 14)  # перенос траты на другой день
+    repo.update(today)
+    assert b.spent == 70
+    old.expense_date = datetime(2023, 3, 15)
+    repo.update(old)
+    assert b.spent == 1070
+    repo.delete(old.pk)
+    assert b.spent == 70
+    assert b.is_consistent()
+
+    b.unsubscribe()
+    repo.add(Expense(10, 1, expense_date=datetime(2023, 3, 15, 11, 0)))
+    assert b.spent == 70
+
+def test_incremental_roll_over(repo):
+    clock = Clock(datetime(2023, 3, 15, 23, 59))
+    repo.add(Expense(100, 1, expense_date=datetime(2023, 3, 15, 9, 0)))
+    repo.add(Expense(30, 1, expense_date=datetime(2023, 3, 16, 9, 0)))
+    b = Budget('Day', 1000)
+    b.subscribe(repo, clock=clock)
+    assert b.spent == 100
+    assert not b.roll_over()
+
+    clock.now = datetime(2023, 3, 16, 0, 1)
+    repo.add(Expense(5, 1, expense_date=datetime(2023, 3, 16, 0, 0)))
+    assert b.spent == 35
+    assert b.is_consistent()
+
+    clock.now = datetime(2023, 3, 20)
+    assert b.roll_over()
+    assert b.spent == 0
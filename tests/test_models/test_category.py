@@ -106,3 +106,40 @@ def test_create_from_tree_error(repo):
     tree = [('1', 'parent'), ('parent', None)]
     with pytest.raises(KeyError):
         Category.create_from_tree(tree, repo)
+
+
+def test_create_from_tree_error_rolls_back(repo):
+    tree = [('parent', None), ('1', 'parent'), ('2', 'unknown')]
+    with pytest.raises(KeyError):
+        Category.create_from_tree(tree, repo)
+    assert repo.get_all() == []
+
+
+def test_create_from_paths(repo):
+    paths = [('food',), ('food', 'other'), ('transport',), ('transport', 'other'),
+             ('transport', 'other', 'food')]
+    cats = Category.create_from_paths(paths, repo, batch_size=2)
+    assert [c.name for c in cats] == [path[-1] for path in paths]
+    food, food_other, transport, transport_other, nested = cats
+    assert food.parent is None and transport.parent is None
+    assert food_other.parent == food.pk
+    assert transport_other.parent == transport.pk
+    assert nested.parent == transport_other.pk
+    assert len(repo.get_all()) == len(paths)
+
+
+def test_create_from_paths_separator(repo):
+    cats = Category.create_from_paths([('a',), ('a', 'b')], repo, separator='/')
+    assert [c.name for c in cats] == ['a', 'a/b']
+
+
+def test_create_from_paths_is_generator_friendly(repo):
+    paths = (('root',) + ('x',) * depth for depth in range(5))
+    cats = Category.create_from_paths(paths, repo, batch_size=3)
+    assert [c.parent for c in cats] == [None] + [c.pk for c in cats[:-1]]
+
+
+def test_create_from_paths_error_rolls_back(repo):
+    with pytest.raises(ValueError):
+        Category.create_from_paths([('a',), ('a', 'b'), ('c', 'd')], repo)
+    assert repo.get_all() == []
@@ -19,3 +19,38 @@ def test_can_create_subclass():
 
     t = Test()
     assert isinstance(t, AbstractRepository)
+
+
+def test_default_bulk_methods():
+    class Test(AbstractRepository):
+        def __init__(self):
+            self.calls = []
+        def add(self, obj): self.calls.append(('add', obj)); return obj
+        def get(self, pk): pass
+        def get_all(self, where=None): pass
+        def update(self, obj): self.calls.append(('update', obj))
+        def delete(self, pk): self.calls.append(('delete', pk))
+        def get_all_like(self, like): pass
+
+    t = Test()
+    assert t.add_many([1, 2]) == [1, 2]
+    t.update_many([3])
+    t.delete_many([4, 5])
+    assert t.calls == [('add', 1), ('add', 2), ('update', 3),
+                       ('delete', 4), ('delete', 5)]
+
+
+def test_default_get_between():
+    class Obj:
+        def __init__(self, value):
+            self.value = value
+
+    class Test(AbstractRepository):
+        def add(self, obj): pass
+        def get(self, pk): pass
+        def get_all(self, where=None): return [Obj(i) for i in range(5)]
+        def update(self, obj): pass
+        def delete(self, pk): pass
+        def get_all_like(self, like): pass
+
+    assert [o.value for o in Test().get_between('value', 1, 3)] == [1, 2, 3]
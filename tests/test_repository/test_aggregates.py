@@ -0,0 +1,78 @@
+from datetime import datetime
+
+import pytest
+
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.aggregates import (
+    MemoryAggregates, SqliteAggregates, Totals, period_key)
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SqliteRepository
+
+
+@pytest.fixture
+def sqlite_repo(tmp_path):
+    repo = SqliteRepository(str(tmp_path / 'test.db'), Expense)
+    yield repo
+    repo.close()
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def repo_and_aggregates(request, sqlite_repo):
+    if request.param == 'memory':
+        repo = MemoryRepository()
+        return repo, lambda: MemoryAggregates(repo)
+    return sqlite_repo, lambda: SqliteAggregates(sqlite_repo)
+
+
+def test_period_key():
+    date = datetime(2023, 3, 19, 10, 0)  # воскресенье
+    assert period_key('day', date) == '2023-03-19'
+    assert period_key('week', date) == '2023-03-13'
+    assert period_key('month', date) == '2023-03'
+    with pytest.raises(ValueError):
+        period_key('year', date)
+
+
+def test_aggregates(repo_and_aggregates):
+    repo, make_aggregates = repo_and_aggregates
+    # часть расходов добавлена до создания агрегатов
+    repo.add(Expense(100, 1, expense_date=datetime(2023, 3, 13, 10, 0)))
+    repo.add(Expense(50, 2, expense_date=datetime(2023, 3, 13, 11, 0)))
+    aggregates = make_aggregates()
+    e1 = Expense(30, 1, expense_date=datetime(2023, 3, 19, 23, 0))
+    e2 = Expense(20, 1, expense_date=datetime(2023, 4, 1, 0, 0))
+    repo.add_many([e1, e2])
+
+    assert aggregates.by_category('day', datetime(2023, 3, 13)) == {
+        1: Totals(100, 1), 2: Totals(50, 1)}
+    assert aggregates.by_category('week', datetime(2023, 3, 15)) == {
+        1: Totals(130, 2), 2: Totals(50, 1)}
+    assert aggregates.by_category('month', datetime(2023, 4, 15)) == {1: Totals(20, 1)}
+    assert aggregates.series('month') == {'2023-03': Totals(180, 3),
+                                          '2023-04': Totals(20, 1)}
+    assert aggregates.series('day', category=1, start=datetime(2023, 3, 14),
+                             end=datetime(2023, 3, 31)) == {'2023-03-19': Totals(30, 1)}
+
+    e1.category = 2
+    e1.amount = 40
+    repo.update(e1)
+    assert aggregates.by_category('week', datetime(2023, 3, 15)) == {
+        1: Totals(100, 1), 2: Totals(90, 2)}
+    e2.expense_date = datetime(2023, 3, 1)
+    repo.update(e2)
+    repo.delete(e1.pk)
+    assert aggregates.by_category('month', datetime(2023, 3, 1)) == {
+        1: Totals(120, 2), 2: Totals(50, 1)}
+    assert aggregates.by_category('month', datetime(2023, 4, 1)) == {}
+
+
+def test_sqlite_rebuild(sqlite_repo):
+    sqlite_repo.add(Expense(100, 1, expense_date=datetime(2023, 3, 13)))
+    aggregates = SqliteAggregates(sqlite_repo)
+    with sqlite_repo.pool.transaction() as con:
+        con.execute('DELETE FROM expense_totals')
+    assert aggregates.series('day') == {}
+    aggregates.rebuild()
+    assert aggregates.series('day') == {'2023-03-13': Totals(100, 1)}
+    # повторное создание не дублирует данные
+    assert SqliteAggregates(sqlite_repo).series('day') == {'2023-03-13': Totals(100, 1)}
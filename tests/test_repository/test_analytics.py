@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.aggregates import Totals, period_key
+from bookkeeper.repository.analytics import (
+    ColumnarExpenseAnalytics, ExpenseAnalytics, SqliteExpenseAnalytics,
+    make_analytics, periods)
+from bookkeeper.repository.category_hierarchy import (
+    CategoryHierarchy, SqliteCategoryHierarchy)
+from bookkeeper.repository.columnar_repository import ColumnarExpenseRepository
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SqliteRepository
+
+START = datetime(2023, 1, 30, 10)
+
+
+def make_expenses():
+    return [Expense(i * 10, i % 4 + 1, START + timedelta(days=i, hours=i % 5),
+                    comment=f'{i}')
+            for i in range(60)]
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'columnar'])
+def repos(request, tmp_path):
+    if request.param == 'memory':
+        exp_repo, cat_repo = MemoryRepository(), MemoryRepository()
+    elif request.param == 'columnar':
+        exp_repo, cat_repo = ColumnarExpenseRepository(), MemoryRepository()
+    else:
+        db_file = str(tmp_path / 'test.db')
+        exp_repo = SqliteRepository(db_file, Expense)
+        cat_repo = SqliteRepository(db_file, Category)
+    exp_repo.add_many(make_expenses())
+    # 1 - корень, 2 и 3 - подкатегории 1, 4 - подкатегория 3
+    Category.create_from_tree([('a', None), ('b', 'a'), ('c', 'a'), ('d', 'c')],
+                              cat_repo)
+    return exp_repo, cat_repo
+
+
+def expected(by, exps):
+    result = {}
+    for exp in exps:
+        key = exp.category if by == 'category' else period_key(by, exp.expense_date)
+        total, count = result.get(key, (0, 0))
+        result[key] = Totals(total + exp.amount, count + 1)
+    return dict(sorted(result.items()))
+
+
+def test_make_analytics(repos):
+    analytics = make_analytics(repos[0])
+    cls = {MemoryRepository: ExpenseAnalytics, SqliteRepository: SqliteExpenseAnalytics,
+           ColumnarExpenseRepository: ColumnarExpenseAnalytics}[type(repos[0])]
+    assert type(analytics) is cls
+
+
+@pytest.mark.parametrize('by', ['category', 'day', 'week', 'month'])
+def test_totals(repos, by):
+    analytics = make_analytics(repos[0])
+    exps = make_expenses()
+    assert analytics.totals(by) == expected(by, exps)
+    lo, hi = datetime(2023, 2, 3), datetime(2023, 2, 20, 12)
+    in_period = [e for e in exps if lo <= e.expense_date <= hi]
+    assert analytics.totals(by, lo, hi) == expected(by, in_period)
+    assert analytics.totals(by, lo, hi, where={'category': 2}) == \
+        expected(by, [e for e in in_period if e.category == 2])
+    assert analytics.total(lo, hi) == sum(e.amount for e in in_period)
+    assert analytics.total(where={'category': 3}) == \
+        sum(e.amount for e in exps if e.category == 3)
+    assert list(analytics.totals(by)) == sorted(analytics.totals(by))
+
+
+def test_unknown_grouping(repos):
+    with pytest.raises(ValueError):
+        make_analytics(repos[0]).totals('year')
+
+
+def test_subtree_totals(repos):
+    exp_repo, cat_repo = repos
+    if isinstance(cat_repo, SqliteRepository):
+        hierarchy = SqliteCategoryHierarchy(cat_repo)
+    else:
+        hierarchy = CategoryHierarchy(cat_repo)
+    by_category = expected('category', make_expenses())
+    result = make_analytics(exp_repo).subtree_totals(hierarchy, [1, 3, 2])
+    assert list(result) == [1, 3, 2]
+    assert result[1] == Totals(sum(t.total for t in by_category.values()), 60)
+    assert result[3] == Totals(by_category[3].total + by_category[4].total, 30)
+    assert result[2] == by_category[2]
+
+
+def test_rolling_average(repos):
+    analytics = make_analytics(repos[0])
+    monthly = analytics.totals('month')
+    rolling = analytics.rolling_average('month', 2)
+    assert list(rolling) == ['2023-01', '2023-02', '2023-03']
+    jan, feb, mar = (monthly[key].total for key in rolling)
+    assert rolling == {'2023-01': jan, '2023-02': (jan + feb) / 2,
+                       '2023-03': (feb + mar) / 2}
+    rolling = analytics.rolling_average('month', 2, end=datetime(2023, 5, 1))
+    assert rolling['2023-04'] == mar / 2
+    assert rolling['2023-05'] == 0
+    assert analytics.rolling_average('day', 3, start=datetime(2030, 1, 1)) == {}
+
+
+def test_top(repos):
+    analytics = make_analytics(repos[0])
+    top = analytics.top(2)
+    by_category = expected('category', make_expenses())
+    best = sorted(by_category.items(), key=lambda item: item[1].total, reverse=True)
+    assert top == best[:2]
+    assert [e.amount for e in analytics.top_expenses(3)] == [590, 580, 570]
+    assert [e.amount for e in analytics.top_expenses(2, where={'category': 1})] == \
+        [560, 520]
+    assert [e.amount for e in analytics.top_expenses(
+        1, end=datetime(2023, 2, 1))] == [10]
+
+
+def test_periods():
+    assert periods('month', datetime(2023, 11, 15), datetime(2024, 2, 1)) == \
+        ['2023-11', '2023-12', '2024-01', '2024-02']
+    assert periods('week', datetime(2023, 3, 15), datetime(2023, 3, 27)) == \
+        ['2023-03-13', '2023-03-20', '2023-03-27']
+    assert periods('day', datetime(2023, 3, 15, 12), datetime(2023, 3, 16)) == \
+        ['2023-03-15', '2023-03-16']
+    with pytest.raises(ValueError):
+        periods('year', datetime(2023, 1, 1), datetime(2023, 1, 1))
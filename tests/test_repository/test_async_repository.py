@@ -0,0 +1,97 @@
+import asyncio
+import sqlite3
+import time
+from dataclasses import dataclass
+
+import pytest
+
+from bookkeeper.repository.async_repository import (
+    AsyncAbstractRepository, AsyncMemoryRepository, AsyncSqliteRepository)
+
+
+@dataclass
+class Custom:
+    int_value: int = 0
+    str_value: str = ''
+    pk: int = 0
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def repo(request, tmp_path):
+    if request.param == 'memory':
+        yield AsyncMemoryRepository()
+        return
+    db_file = str(tmp_path / 'test.db')
+    with sqlite3.connect(db_file) as con:
+        con.execute('CREATE TABLE custom(int_value int, str_value text)')
+    con.close()
+    repo = AsyncSqliteRepository(db_file, Custom, readers=2)
+    yield repo
+    repo.close()
+
+
+def test_cannot_create_abstract_repository():
+    with pytest.raises(TypeError):
+        AsyncAbstractRepository()
+
+
+def test_crud(repo):
+    async def scenario():
+        obj = Custom(1, 'a')
+        pk = await repo.add(obj)
+        assert obj.pk == pk
+        assert await repo.get(pk) == obj
+        obj.str_value = 'b'
+        await repo.update(obj)
+        assert await repo.get_all({'str_value': 'b'}) == [obj]
+        await repo.delete(pk)
+        assert await repo.get(pk) is None
+
+    asyncio.run(scenario())
+
+
+def test_bulk_and_iteration(repo):
+    async def scenario():
+        objects = [Custom(i, str(i)) for i in range(10)]
+        await repo.add_many(objects)
+        assert await repo.get_between('int_value', 2, 4) == objects[2:5]
+        assert [o async for o in repo.iter_all(batch_size=3)] == objects
+        await repo.delete_many([o.pk for o in objects[:5]])
+        assert await repo.get_all() == objects[5:]
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_reads_and_writes(repo):
+    async def scenario():
+        writes = [repo.add(Custom(i)) for i in range(20)]
+        pks = await asyncio.gather(*writes)
+        reads = await asyncio.gather(*(repo.get(pk) for pk in pks))
+        assert [obj.int_value for obj in reads] == list(range(20))
+
+    asyncio.run(scenario())
+
+
+def test_aclose_does_not_block_event_loop(tmp_path):
+    db_file = str(tmp_path / 'test.db')
+    with sqlite3.connect(db_file) as con:
+        con.execute('CREATE TABLE custom(int_value int, str_value text)')
+    con.close()
+
+    async def ticker(ticks):
+        while True:
+            await asyncio.sleep(0.01)
+            ticks.append(1)
+
+    async def scenario():
+        ticks = []
+        task = asyncio.create_task(ticker(ticks))
+        async with AsyncSqliteRepository(db_file, Custom, readers=1) as repo:
+            pending = asyncio.ensure_future(repo._write(time.sleep, 0.2))
+            await asyncio.sleep(0)
+        task.cancel()
+        await pending
+        assert repo._writer._shutdown
+        assert len(ticks) > 5
+
+    asyncio.run(scenario())
@@ -0,0 +1,144 @@
+import threading
+
+import pytest
+
+from bookkeeper.models.category import Category
+from bookkeeper.repository.cached_repository import CachedRepository, CacheStats
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.unit_of_work import UnitOfWork
+
+
+class CountingRepository(MemoryRepository):
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+
+    def get(self, pk):
+        self.reads += 1
+        return super().get(pk)
+
+    def get_all(self, where=None):
+        self.reads += 1
+        return super().get_all(where)
+
+
+@pytest.fixture
+def inner():
+    return CountingRepository()
+
+
+@pytest.fixture
+def repo(inner):
+    return CachedRepository(inner, maxsize=2, cache_queries=True)
+
+
+def test_get_is_cached(repo, inner):
+    pk = repo.add(Category('a'))
+    inner.reads = 0
+    assert repo.get(pk).name == 'a'
+    assert repo.get(pk).name == 'a'
+    assert inner.reads == 0  # объект попал в кэш при добавлении
+    assert repo.get(100) is None
+    assert repo.get(100) is None
+    assert inner.reads == 2  # отсутствие объекта не кэшируется
+    assert repo.stats == CacheStats(hits=2, misses=2)
+    assert repo.stats.hit_ratio == 0.5
+
+
+def test_lru_eviction(repo, inner):
+    pks = [inner.add(Category(str(i))) for i in range(3)]
+    for pk in pks:
+        repo.get(pk)
+    repo.get(pks[0])
+    assert repo.stats.misses == 4  # первый объект вытеснен
+
+
+def test_write_through(repo, inner):
+    c = Category('a')
+    pk = repo.add(c)
+    repo.update(Category('b', pk=pk))
+    assert repo.get(pk).name == 'b'
+    inner.update(Category('c', pk=pk))  # изменение в обход обертки
+    assert repo.get(pk).name == 'c'
+    repo.delete(pk)
+    assert repo.get(pk) is None
+
+
+def test_query_cache(repo, inner):
+    repo.add_many([Category('a'), Category('b', 1)])
+    inner.reads = 0
+    assert [c.name for c in repo.get_all({'parent': 1})] == ['b']
+    assert [c.name for c in repo.get_all({'parent': 1})] == ['b']
+    assert len(repo.get_all()) == 2
+    assert inner.reads == 2
+    repo.add(Category('c', 1))
+    assert [c.name for c in repo.get_all({'parent': 1})] == ['b', 'c']
+    assert inner.reads == 3
+    assert repo.query_stats == CacheStats(hits=1, misses=3)
+
+
+def test_unhashable_query_is_not_cached(repo, inner):
+    repo.add(Category('a'))
+    inner.reads = 0
+    repo.get_all({'name': ['a']})
+    repo.get_all({'name': ['a']})
+    assert inner.reads == 2
+
+
+def test_transaction_bypasses_cache(repo, inner):
+    pk = repo.add(Category('a'))
+    assert repo.get(pk + 1) is None
+    with repo.transaction():
+        repo.delete(pk)
+        assert repo.get(pk) is None
+        new_pk = repo.add(Category('b'))
+        assert repo.get(new_pk).name == 'b'
+        assert repo.get_all({'name': 'a'}) == []
+    assert repo.get(pk) is None
+    assert repo.get(new_pk).name == 'b'
+    with pytest.raises(ZeroDivisionError):
+        with repo.transaction():
+            repo.update(Category('c', pk=new_pk))
+            assert repo.get(new_pk).name == 'c'
+            1 / 0
+    assert repo.get(new_pk).name == 'b'
+
+
+def test_transaction_on_inner_repository(repo, inner):
+    pk = repo.add(Category('a'))
+    with UnitOfWork(inner):
+        inner.update(Category('b', pk=pk))
+        assert repo.get(pk).name == 'b'
+    assert repo.get(pk).name == 'b'
+
+
+def test_transaction_bypasses_cache_only_in_its_thread(repo, inner):
+    pk = repo.add(Category('a'))
+    with repo.transaction():
+        reads = inner.reads
+        thread = threading.Thread(target=repo.get, args=(pk,))
+        thread.start()
+        thread.join()
+        assert inner.reads == reads  # другой поток читает из кэша
+        repo.get(pk)
+        assert inner.reads == reads + 1
+
+
+def test_events_are_forwarded(repo):
+    events = []
+    repo.subscribe(lambda event, pk, obj: events.append(event))
+    pk = repo.add(Category('a'))
+    repo.delete(pk)
+    assert events == ['add', 'delete']
+
+
+def test_parents_are_cached(repo, inner):
+    parent = None
+    for i in range(2):
+        c = Category(str(i), parent)
+        parent = repo.add(c)
+    repo.clear()
+    inner.reads = 0
+    for _ in range(3):
+        list(c.get_all_parents(repo))
+    assert inner.reads == 1
@@ -0,0 +1,110 @@
+from datetime import datetime
+
+import pytest
+
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.category_hierarchy import (
+    CategoryHierarchy, SqliteCategoryHierarchy)
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SqliteRepository
+
+
+@pytest.fixture
+def sqlite_repos(tmp_path):
+    db_file = str(tmp_path / 'test.db')
+    cat_repo = SqliteRepository(db_file, Category, shared=True)
+    exp_repo = SqliteRepository(db_file, Expense, shared=True)
+    yield cat_repo, exp_repo
+    cat_repo.pool.close()
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def repos(request, sqlite_repos):
+    if request.param == 'memory':
+        cat_repo = MemoryRepository()
+        return cat_repo, MemoryRepository(), lambda: CategoryHierarchy(cat_repo)
+    cat_repo, exp_repo = sqlite_repos
+    return cat_repo, exp_repo, lambda: SqliteCategoryHierarchy(cat_repo)
+
+
+def names(cats):
+    return sorted(c.name for c in cats)
+
+
+def test_hierarchy(repos):
+    cat_repo, exp_repo, make_hierarchy = repos
+    # часть дерева создана до индекса
+    cats = {c.name: c for c in Category.create_from_tree(
+        [('food', None), ('meat', 'food'), ('raw', 'meat')], cat_repo)}
+    hierarchy = make_hierarchy()
+    cats.update({c.name: c for c in Category.create_from_tree(
+        [('sweets', None), ('books', None)], cat_repo)})
+    cat_repo.update(Category('sweets', cats['food'].pk, cats['sweets'].pk))
+
+    assert names(hierarchy.descendants(cats['food'].pk)) == ['meat', 'raw', 'sweets']
+    assert [c.name for c in hierarchy.ancestors(cats['raw'].pk)] == ['meat', 'food']
+    assert hierarchy.ancestors(cats['food'].pk) == []
+    assert sorted(hierarchy.subtree(cats['meat'].pk)) == [cats['meat'].pk,
+                                                          cats['raw'].pk]
+
+    # перенос поддерева
+    cat_repo.update(Category('meat', cats['books'].pk, cats['meat'].pk))
+    assert names(hierarchy.descendants(cats['food'].pk)) == ['sweets']
+    assert names(hierarchy.descendants(cats['books'].pk)) == ['meat', 'raw']
+    assert [c.name for c in hierarchy.ancestors(cats['raw'].pk)] == ['meat', 'books']
+
+    cat_repo.delete(cats['raw'].pk)
+    assert names(hierarchy.descendants(cats['books'].pk)) == ['meat']
+
+
+def test_subtree_spent(repos):
+    cat_repo, exp_repo, make_hierarchy = repos
+    cats = {c.name: c for c in Category.create_from_tree(
+        [('food', None), ('meat', 'food'), ('books', None)], cat_repo)}
+    hierarchy = make_hierarchy()
+    exp_repo.add_many([
+        Expense(100, cats['food'].pk, expense_date=datetime(2023, 3, 1)),
+        Expense(30, cats['meat'].pk, expense_date=datetime(2023, 3, 10)),
+        Expense(7, cats['books'].pk, expense_date=datetime(2023, 3, 10)),
+    ])
+    assert hierarchy.subtree_spent(cats['food'].pk, exp_repo) == 130
+    assert hierarchy.subtree_spent(cats['meat'].pk, exp_repo) == 30
+    assert hierarchy.subtree_spent(cats['food'].pk, exp_repo,
+                                   start=datetime(2023, 3, 5)) == 30
+    assert hierarchy.subtree_spent(cats['books'].pk, exp_repo,
+                                   end=datetime(2023, 3, 5)) == 0
+    assert hierarchy.subtree_totals(cats['food'].pk,
+                                    {cats['food'].pk: 1, cats['meat'].pk: 2,
+                                     cats['books'].pk: 4}) == 3
+
+
+def test_is_descendant():
+    repo = MemoryRepository()
+    cats = Category.create_from_tree([('a', None), ('b', 'a'), ('c', None)], repo)
+    hierarchy = CategoryHierarchy(repo)
+    assert hierarchy.is_descendant(cats[1].pk, cats[0].pk)
+    assert not hierarchy.is_descendant(cats[0].pk, cats[1].pk)
+    assert not hierarchy.is_descendant(cats[2].pk, cats[0].pk)
+
+
+def test_sqlite_rebuild(sqlite_repos):
+    cat_repo, _ = sqlite_repos
+    cats = Category.create_from_tree([('a', None), ('b', 'a')], cat_repo)
+    hierarchy = SqliteCategoryHierarchy(cat_repo)
+    hierarchy.rebuild()
+    assert names(hierarchy.descendants(cats[0].pk)) == ['b']
+
+
+def test_category_methods_use_hierarchy(repos):
+    cat_repo, _, make_hierarchy = repos
+    tree = [('food', None), ('meat', 'food'), ('raw', 'meat'), ('sweets', 'food')]
+    cats = {c.name: c for c in Category.create_from_tree(tree, cat_repo)}
+    hierarchy = make_hierarchy()
+    for cat in cats.values():
+        assert list(cat.get_all_parents(cat_repo, hierarchy)) == \
+            list(cat.get_all_parents(cat_repo))
+        assert names(cat.get_subcategories(cat_repo, hierarchy)) == \
+            names(cat.get_subcategories(cat_repo))
+    assert [c.name for c in cats['raw'].get_all_parents(cat_repo, hierarchy)] == \
+        ['meat', 'food']
@@ -0,0 +1,136 @@
+from datetime import datetime
+
+import pytest
+
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.columnar_repository import ColumnarExpenseRepository
+from bookkeeper.repository.memory_repository import MemoryRepository
+
+
+@pytest.fixture(params=[False, True], ids=['array', 'numpy'])
+def repo(request):
+    if request.param:
+        pytest.importorskip('numpy')
+    return ColumnarExpenseRepository(use_numpy=request.param)
+
+
+def make_expenses(n):
+    return [Expense(i, i % 3, datetime(2023, 1, 1 + i % 20),
+                    datetime(2023, 2, 1, 12, 30, 15, 123456), f'comment {i % 4}')
+            for i in range(n)]
+
+
+def by_pk(exps):
+    return sorted(exps, key=lambda e: e.pk)
+
+
+def test_crud(repo):
+    exp = Expense(100, 1, datetime(2023, 1, 1), datetime(2023, 1, 2), 'test')
+    pk = repo.add(exp)
+    assert exp.pk == pk
+    assert repo.get(pk) == exp
+    assert repo.get(pk) is not repo.get(pk)
+    exp.amount = 200
+    repo.update(exp)
+    assert repo.get(pk).amount == 200
+    repo.delete(pk)
+    assert repo.get(pk) is None
+    assert len(repo) == 0
+
+
+def test_errors(repo):
+    with pytest.raises(ValueError):
+        repo.add(Expense(1, 1, pk=1))
+    with pytest.raises(KeyError):
+        repo.delete(1)
+    with pytest.raises(ValueError):
+        repo.update(Expense(1, 1, pk=1))
+    with pytest.raises(ValueError):
+        repo.get_all({'unknown': 1})
+    with pytest.raises(TypeError):
+        repo.add_many([Expense(1, 1), Expense(1.5, 1)])
+    assert len(repo) == 0
+
+
+def test_same_results_as_memory_repository(repo):
+    memory = MemoryRepository()
+    memory.add_many(make_expenses(100))
+    repo.add_many(make_expenses(100))
+    memory.delete_many(range(1, 100, 7))
+    repo.delete_many(range(1, 100, 7))
+    assert repo.get_all() == memory.get_all()
+    assert list(repo.iter_all()) == memory.get_all()
+    where = {'category': 1, 'comment': 'comment 2'}
+    assert repo.get_all(where) == memory.get_all(where)
+    assert repo.get_all({'comment': 'unknown'}) == []
+    assert repo.get_all_like({'comment': '3'}) == memory.get_all_like({'comment': '3'})
+    lo, hi = datetime(2023, 1, 3), datetime(2023, 1, 7)
+    assert repo.get_between('expense_date', lo, hi) == \
+        by_pk(memory.get_between('expense_date', lo, hi))
+    assert list(repo.iter_between('amount', 10, 20)) == \
+        by_pk(memory.get_between('amount', 10, 20))
+
+
+def test_aggregates(repo):
+    exps = make_expenses(100)
+    repo.add_many(exps)
+    assert repo.total() == sum(range(100))
+    assert repo.count({'category': 1}) == 33
+    lo, hi = datetime(2023, 1, 3), datetime(2023, 1, 7)
+    in_period = [e for e in exps if lo <= e.expense_date <= hi]
+    assert repo.total(start=lo, end=hi) == sum(e.amount for e in in_period)
+    assert repo.count(end=hi) == len([e for e in exps if e.expense_date <= hi])
+    totals = repo.totals_by_category(lo, hi)
+    assert totals == {cat: sum(e.amount for e in in_period if e.category == cat)
+                      for cat in range(3)}
+    assert repo.totals_by_category(datetime(2030, 1, 1)) == {}
+
+
+def test_compaction(repo):
+    repo.add_many(make_expenses(10))
+    repo.delete_many(range(1, 7))
+    assert len(repo._alive) == 4
+    assert [e.pk for e in repo.get_all()] == [7, 8, 9, 10]
+    assert repo.add(Expense(1, 1)) == 11
+    assert repo.get(11) is not None
+
+
+def test_transaction_rollback(repo):
+    repo.add_many(make_expenses(10))
+    with pytest.raises(RuntimeError):
+        with repo.transaction():
+            repo.add(Expense(1000, 1))
+            repo.delete_many(range(1, 9))
+            raise RuntimeError('error')
+    assert len(repo) == 10
+    assert repo.total() == sum(range(10))
+    assert repo.add(Expense(1, 1)) == 11
+
+
+def test_transaction_rollback_restores_changed_rows(repo):
+    repo.add_many(make_expenses(10))
+    expected = repo.get_all()
+    with pytest.raises(RuntimeError):
+        with repo.transaction():
+            exp = repo.get(3)
+            exp.amount, exp.comment = 500, 'новый'
+            repo.update(exp)
+            repo.delete(3)
+            repo.delete_many(range(5, 11))
+            repo.restore_many([Expense(7, 1, pk=20)])
+            raise RuntimeError('error')
+    assert repo.get_all() == expected
+    assert repo.get_all({'comment': 'comment 3'}) == [expected[3], expected[7]]
+    assert repo.add(Expense(1, 1)) == 11
+    with repo.transaction():
+        repo.delete_many(range(1, 9))
+    assert [e.pk for e in repo.get_all()] == [9, 10, 11]
+
+
+def test_events(repo):
+    events = []
+    repo.subscribe(lambda event, pk, obj: events.append((event, pk)))
+    pk = repo.add(Expense(1, 1))
+    repo.update(repo.get(pk))
+    repo.delete(pk)
+    assert events == [('add', pk), ('update', pk), ('delete', pk)]
@@ -0,0 +1,116 @@
+import sqlite3
+import threading
+
+import pytest
+
+from bookkeeper.repository.connection_pool import ConnectionPool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    with ConnectionPool(str(tmp_path / 'test.db'), size=2) as p:
+        yield p
+
+
+def test_connection_is_reused(pool):
+    with pool.connection() as con1:
+        pass
+    with pool.connection() as con2:
+        pass
+    assert con1 is con2
+
+
+def test_nested_connection_is_same(pool):
+    with pool.connection() as con1:
+        with pool.connection() as con2:
+            assert con1 is con2
+
+
+def test_foreign_keys_enabled(pool):
+    with pool.connection() as con:
+        assert con.execute('PRAGMA foreign_keys').fetchone() == (1,)
+
+
+def test_threads_get_different_connections(pool):
+    connections = []
+    barrier = threading.Barrier(2)
+
+    def worker():
+        with pool.connection() as con:
+            connections.append(con)
+            barrier.wait()
+
+    threads = [threading.Thread(target=worker) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert connections[0] is not connections[1]
+
+
+def test_memory_pool_has_single_connection():
+    pool = ConnectionPool(':memory:', size=4)
+    assert pool.size == 1
+    pool.close()
+
+
+def test_shared_pool(tmp_path):
+    db_file = str(tmp_path / 'test.db')
+    pool = ConnectionPool.shared(db_file)
+    assert ConnectionPool.shared(db_file) is pool
+    pool.close()
+    assert ConnectionPool.shared(db_file) is not pool
+
+
+def test_cannot_use_closed_pool(pool):
+    pool.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        with pool.connection():
+            pass
+
+
+def test_invalid_size(tmp_path):
+    with pytest.raises(ValueError):
+        ConnectionPool(str(tmp_path / 'test.db'), size=0)
+
+
+def test_default_pragmas(pool):
+    with pool.connection() as con:
+        assert con.execute('PRAGMA journal_mode').fetchone() == ('wal',)
+        assert con.execute('PRAGMA synchronous').fetchone() == (1,)  # NORMAL
+
+
+def test_custom_pragmas(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'test.db'),
+                          pragmas={'synchronous': 'FULL', 'cache_size': -1000})
+    with pool.connection() as con:
+        assert con.execute('PRAGMA synchronous').fetchone() == (2,)
+        assert con.execute('PRAGMA cache_size').fetchone() == (-1000,)
+    pool.close()
+
+
+def test_invalid_pragma(tmp_path):
+    with pytest.raises(ValueError):
+        ConnectionPool(str(tmp_path / 'test.db'),
+                       pragmas={'synchronous': 'OFF; DROP TABLE x'})
+
+
+def test_read_during_write(pool):
+    with pool.connection() as con:
+        con.execute('CREATE TABLE t(x int)')
+        con.execute('INSERT INTO t VALUES (1)')
+        con.commit()
+    result = []
+    with pool.connection() as writer:
+        writer.execute('BEGIN IMMEDIATE')
+        writer.execute('INSERT INTO t VALUES (2)')
+
+        def read():
+            with pool.connection() as reader:
+                result.extend(reader.execute('SELECT x FROM t').fetchall())
+
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join(timeout=5)
+        writer.commit()
+    assert result == [(1,)]
@@ -0,0 +1,144 @@
+from datetime import datetime
+
+import pytest
+
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.cached_repository import CachedRepository
+from bookkeeper.repository.columnar_repository import ColumnarExpenseRepository
+from bookkeeper.repository.expressions import (
+    F, compile_python, compile_sql, equalities, field_range, where_expression)
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.partitioned_repository import PartitionedExpenseRepository
+from bookkeeper.repository.sqlite_repository import SqliteRepository
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'columnar', 'partitioned', 'cached'])
+def repo(request, tmp_path):
+    db_file = str(tmp_path / 'test.db')
+    repo = {'memory': lambda: MemoryRepository[Expense](hash_indexes=['category']),
+            'sqlite': lambda: SqliteRepository[Expense](db_file, Expense),
+            'columnar': ColumnarExpenseRepository,
+            'partitioned': lambda: PartitionedExpenseRepository(db_file),
+            'cached': lambda: CachedRepository(MemoryRepository[Expense](),
+                                               cache_queries=True)}[request.param]()
+    repo.add_many([Expense(i * 7 % 10, i % 3, datetime(2023, 1 + i % 3, 1 + i),
+                           datetime(2023, 4, 1), f'comment {i % 4}')
+                   for i in range(25)])
+    yield repo
+    if hasattr(repo, 'close'):
+        repo.close()
+
+
+def pks(objs):
+    return sorted(obj.pk for obj in objs)
+
+
+CONDITIONS = [
+    F('amount') > 5,
+    (F('amount') >= 2) & (F('category') == 1),
+    F('category').in_([0, 2]) | (F('amount') < 3),
+    ~(F('comment') == 'comment 1'),
+    F('expense_date').between(datetime(2023, 1, 5), datetime(2023, 2, 20)),
+    (F('category') != 1) & ~F('amount').in_([0, 7]),
+    F('pk') <= 4,
+    F('amount').in_([]),
+]
+
+
+@pytest.mark.parametrize('condition', CONDITIONS)
+def test_where_expression(repo, condition):
+    match = condition.predicate()
+    expected = pks(obj for obj in repo.get_all() if match(obj))
+    assert pks(repo.get_all(condition)) == expected
+    assert pks(repo.iter_all(condition, batch_size=3)) == expected
+    assert pks(repo.query(where=condition)) == expected
+
+
+def test_expression_matches_dict(repo):
+    where = {'category': 2, 'comment': 'comment 1'}
+    assert pks(repo.get_all(where_expression(where))) == pks(repo.get_all(where))
+
+
+def test_query_with_expression(repo):
+    condition = (F('amount') > 2) & (F('category') != 0)
+    found = repo.query(['amount'], condition, order_by='-amount', limit=4)
+    expected = sorted((obj for obj in repo.get_all() if obj.amount > 2 and obj.category),
+                      key=lambda obj: (-obj.amount, obj.pk))[:4]
+    assert [row.amount for row in found] == [obj.amount for obj in expected]
+
+
+def test_unknown_field(repo):
+    if isinstance(repo, (MemoryRepository, CachedRepository)):
+        pytest.skip('memory repository has no schema')
+    with pytest.raises(ValueError):
+        repo.get_all(F('missing') == 1)
+
+
+@pytest.mark.parametrize('kind', ['memory', 'sqlite'])
+def test_null_semantics(kind, tmp_path):
+    repo = MemoryRepository[Category]() if kind == 'memory' else \
+        SqliteRepository[Category](str(tmp_path / 'test.db'), Category)
+    repo.add_many([Category('a'), Category('b', 1), Category('c', 2)])
+    assert pks(repo.get_all(F('parent') == None)) == [1]  # noqa: E711
+    assert pks(repo.get_all(F('parent') != None)) == [2, 3]  # noqa: E711
+    assert pks(repo.get_all(F('parent') > 1)) == [3]
+    assert pks(repo.get_all(~(F('parent') > 1))) == [1, 2]
+    assert pks(repo.get_all(~(F('parent') == 1) & (F('name') != 'c'))) == [1]
+
+
+def test_shape_cache():
+    first = (F('amount') > 1) & F('category').in_([1, 2])
+    second = (F('amount') > 5) & F('category').in_([3, 4])
+    assert first.shape == second.shape
+    assert compile_sql(first.shape) is compile_sql(second.shape)
+    assert compile_python(first.shape) is compile_python(second.shape)
+    assert first.sql() == ('("amount" > ? AND "category" IN (?, ?))', [1, 1, 2])
+    assert F('category').in_([1]).shape != F('category').in_([1, 2]).shape
+
+
+def test_combinators_flatten():
+    condition = (F('a') == 1) & (F('b') == 2) & (F('c') == 3)
+    assert condition.shape[0] == 'and' and len(condition.shape) == 4
+    assert condition.fields() == {'a', 'b', 'c'}
+
+
+def test_bool_is_error():
+    with pytest.raises(TypeError):
+        bool(F('a') == 1)
+
+
+def test_invalid_field_name():
+    with pytest.raises(ValueError):
+        F('amount; DROP TABLE expense')
+    with pytest.raises(ValueError):
+        F('class')
+
+
+def test_equalities_and_range():
+    start, end = datetime(2023, 1, 1), datetime(2023, 3, 1)
+    condition = (F('category') == 1) & (F('expense_date') >= start) \
+        & (F('expense_date') < end)
+    assert equalities(condition) == {'category': 1}
+    assert field_range(condition, 'expense_date') == (start, end)
+    assert field_range(condition | (F('amount') == 1), 'expense_date') == (None, None)
+    between = F('expense_date').between(start, end)
+    assert field_range(between, 'expense_date') == (start, end)
+
+
+def test_partition_pruning(tmp_path):
+    repo = PartitionedExpenseRepository(str(tmp_path / 'test.db'))
+    repo.add_many([Expense(1, 1, datetime(2023, month, 1)) for month in range(1, 7)])
+    condition = F('expense_date').between(datetime(2023, 2, 1), datetime(2023, 3, 31))
+    assert len(repo._where_partitions(condition)) == 2
+    assert len(repo.get_all(condition)) == 2
+    repo.close()
+
+
+def test_cached_expression(tmp_path):
+    repo = CachedRepository(MemoryRepository[Expense](), cache_queries=True)
+    repo.add(Expense(1, 1))
+    assert len(repo.get_all(F('amount') > 0)) == 1
+    assert len(repo.get_all(F('amount') > 0)) == 1
+    assert repo.query_stats.hits == 1
+    assert repo.get_all(F('amount') > 1) == []
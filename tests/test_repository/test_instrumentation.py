@@ -0,0 +1,118 @@
+import logging
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.instrumentation import (
+    LATENCY_BUCKETS, InstrumentedRepository, QueryProfiler, TimingStats,
+    explain_query_plan)
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SqliteRepository
+
+
+@pytest.fixture
+def sqlite_repo(tmp_path):
+    repo = SqliteRepository(str(tmp_path / 'test.db'), Expense, indexes=['category'])
+    yield repo
+    repo.close()
+
+
+def test_timing_stats():
+    stats = TimingStats()
+    stats.record(0.5, rows=3)
+    stats.record(2.0, error=True)
+    assert stats.calls == 2
+    assert stats.errors == 1
+    assert stats.rows == 3
+    assert stats.mean == pytest.approx(1.25)
+    assert stats.max == 2.0
+    assert stats.histogram[LATENCY_BUCKETS.index(1.0)] == 1
+    assert stats.histogram[-1] == 1
+
+
+def test_instrumented_repository():
+    repo = InstrumentedRepository(MemoryRepository())
+    events = []
+    repo.subscribe(lambda event, pk, obj: events.append(event))
+    pk = repo.add(Expense(1, 1))
+    repo.add_many([Expense(2, 1), Expense(3, 2)])
+    repo.get(pk)
+    repo.get(100)
+    assert len(repo.get_all({'category': 1})) == 2
+    assert len(list(repo.iter_all())) == 3
+    repo.delete(pk)
+    with pytest.raises(KeyError):
+        repo.delete(pk)
+    assert events == ['add', 'add', 'add', 'delete']
+    assert repo.stats['add'].calls == 1
+    assert repo.stats['add_many'].rows == 2
+    assert repo.stats['get'].calls == 2
+    assert repo.stats['get'].rows == 1
+    assert repo.stats['get_all'].rows == 2
+    assert repo.stats['iter_all'].rows == 3
+    assert repo.stats['delete'].calls == 2
+    assert repo.stats['delete'].errors == 1
+    assert 'get_all' in repo.report()
+    repo.reset()
+    assert not repo.stats
+
+
+def test_profiler_disabled(sqlite_repo):
+    with sqlite_repo.pool.connection() as con:
+        assert type(con).__name__ == 'Connection'
+
+
+def test_profiler_records_queries(sqlite_repo):
+    profiler = QueryProfiler()
+    sqlite_repo.pool.profiler = profiler
+    sqlite_repo.add_many([Expense(i, i % 2) for i in range(10)])
+    assert len(sqlite_repo.get_all({'category': 1})) == 5
+    assert len(list(sqlite_repo.iter_all(batch_size=4))) == 10
+    sqlite_repo.delete(1)
+    select = profiler.queries[f'{sqlite_repo._sql_select} WHERE "category" = ?']
+    assert select.calls == 1
+    assert select.rows == 5
+    assert profiler.queries[sqlite_repo._sql_insert].rows == 10
+    assert profiler.queries[sqlite_repo._sql_delete].rows == 1
+    iter_sql = [sql for sql in profiler.queries if 'LIMIT' in sql]
+    assert len(iter_sql) == 1
+    assert profiler.queries[iter_sql[0]].calls == 3
+    assert profiler.queries[iter_sql[0]].rows == 10
+    assert '"category" = ?' in profiler.report()
+    sqlite_repo.pool.profiler = None
+    profiler.reset()
+    sqlite_repo.get_all()
+    assert not profiler.queries
+
+
+def test_profiler_slow_queries(sqlite_repo, caplog):
+    sqlite_repo.pool.profiler = QueryProfiler(slow_threshold=0, explain_slow=True)
+    sqlite_repo.add(Expense(1, 1))
+    with caplog.at_level(logging.WARNING):
+        sqlite_repo.get_all({'category': 1})
+    slow = sqlite_repo.pool.profiler.slow[-1]
+    assert slow.sql.endswith('WHERE "category" = ?')
+    assert slow.params == [1]
+    assert slow.rows == 1
+    assert any('expense_category' in line for line in slow.plan)
+    assert 'slow query' in caplog.text
+
+
+def test_profiler_error(sqlite_repo):
+    sqlite_repo.pool.profiler = profiler = QueryProfiler()
+    with pytest.raises(sqlite3.OperationalError):
+        with sqlite_repo.pool.connection() as con:
+            con.execute('SELECT * FROM unknown')
+    assert profiler.queries['SELECT * FROM unknown'].errors == 1
+
+
+def test_explain(sqlite_repo):
+    plan = sqlite_repo.explain({'category': 1})
+    assert any('USING INDEX expense_category' in line for line in plan)
+    assert any('SCAN' in line for line in sqlite_repo.explain())
+    with sqlite_repo.pool.connection() as con:
+        plan = explain_query_plan(con, 'SELECT * FROM expense WHERE expense_date > ?',
+                                  [datetime(2020, 1, 1)])
+    assert plan
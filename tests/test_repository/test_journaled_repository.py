@@ -0,0 +1,163 @@
+import sqlite3
+import time
+from datetime import datetime
+
+import pytest
+
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.journaled_repository import JournaledRepository
+from bookkeeper.repository.sqlite_repository import SqliteRepository
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    return str(tmp_path / 'test.db')
+
+
+def stored(db_file, cls=Expense):
+    with SqliteRepository(db_file, cls) as repo:
+        return repo.get_all()
+
+
+def test_crud_and_flush(db_file):
+    with JournaledRepository(db_file, Expense, flush_interval=None) as repo:
+        exp = Expense(100, 1, datetime(2023, 1, 1), datetime(2023, 1, 2), 'test')
+        pk = repo.add(exp)
+        assert repo.get(pk) == exp
+        assert repo.pending == 1
+        assert stored(db_file) == []
+        exp.amount = 200
+        repo.update(exp)
+        repo.add_many([Expense(1, 1), Expense(2, 1)])
+        repo.delete(3)
+        # изменения одного объекта объединяются
+        assert repo.pending == 3
+        assert repo.flush() == 3
+        assert repo.pending == 0
+        assert stored(db_file) == repo.get_all()
+        assert repo.get(pk).amount == 200
+
+
+def test_size_trigger(db_file):
+    with JournaledRepository(db_file, Category, flush_rows=10,
+                             flush_interval=None) as repo:
+        repo.add_many([Category(str(i)) for i in range(10)])
+        for _ in range(100):
+            if repo.flushes:
+                break
+            time.sleep(0.01)
+        assert len(stored(db_file, Category)) == 10
+
+
+def test_time_trigger(db_file):
+    with JournaledRepository(db_file, Category, flush_interval=0.01) as repo:
+        repo.add(Category('a'))
+        for _ in range(100):
+            if repo.flushes:
+                break
+            time.sleep(0.01)
+        assert stored(db_file, Category) == [Category('a', pk=1)]
+
+
+def test_close_flushes(db_file):
+    repo = JournaledRepository(db_file, Category, flush_interval=None)
+    repo.add(Category('a'))
+    repo.close()
+    assert stored(db_file, Category) == [Category('a', pk=1)]
+    with JournaledRepository(db_file, Category) as repo:
+        assert repo.get_all() == [Category('a', pk=1)]
+        assert repo.add(Category('b')) == 2
+
+
+def crash(repo):
+    """ Остановить репозиторий без записи в БД, как при аварийном завершении """
+    repo._stopped = True
+    repo._wakeup.set()
+    repo._thread.join()
+    repo._journal.close()
+    repo.store.close()
+
+
+def test_recovery(db_file):
+    repo = JournaledRepository(db_file, Expense, flush_interval=None)
+    repo.add_many([Expense(i, 1, datetime(2023, 1, i + 1), comment=f'{i}')
+                   for i in range(5)])
+    repo.flush()
+    exp = repo.get(2)
+    exp.comment = 'изменен'
+    repo.update(exp)
+    repo.delete(4)
+    repo.add(Expense(10, 2, datetime(2023, 2, 1)))
+    expected = repo.get_all()
+    crash(repo)
+    assert len(stored(db_file)) == 5
+    with open(f'{db_file}.journal', 'ab') as journal:
+        journal.write(b'["add",7,[1,')
+    with JournaledRepository(db_file, Expense) as repo:
+        assert repo.get_all() == expected
+        assert repo.pending == 0
+        assert stored(db_file) == expected
+
+
+def test_damaged_line_in_the_middle(db_file):
+    repo = JournaledRepository(db_file, Expense, flush_interval=None)
+    pks = repo.add_many([Expense(i, 1) for i in range(3)])
+    repo.delete(pks[0])
+    crash(repo)
+    with open(f'{db_file}.journal', 'rb') as journal:
+        lines = journal.readlines()
+    lines[0] = b'["add",1,[0,\n'
+    with open(f'{db_file}.journal', 'wb') as journal:
+        journal.writelines(lines)
+    with pytest.raises(ValueError):
+        JournaledRepository(db_file, Expense)
+
+
+def test_unfinished_line_is_cut_off(db_file):
+    with open(f'{db_file}.journal', 'wb') as journal:
+        journal.write(b'["add",1,[1,')
+    with JournaledRepository(db_file, Expense, flush_interval=None) as repo:
+        assert repo.get_all() == []
+        repo.add(Expense(5, 1))
+        crash(repo)
+    with JournaledRepository(db_file, Expense) as repo:
+        assert [exp.amount for exp in repo.get_all()] == [5]
+
+
+def test_journal_truncated_after_flush(db_file):
+    with JournaledRepository(db_file, Category, flush_interval=None) as repo:
+        repo.add(Category('a'))
+        with open(repo.journal_file, 'rb') as journal:
+            assert journal.read().count(b'\n') == 1
+        repo.flush()
+        with open(repo.journal_file, 'rb') as journal:
+            assert journal.read() == b''
+        repo.add(Category('b'))
+        with open(repo.journal_file, 'rb') as journal:
+            assert journal.read().count(b'\n') == 1
+
+
+def test_rolled_back_changes_not_journaled(db_file):
+    with JournaledRepository(db_file, Category, flush_interval=None) as repo:
+        with pytest.raises(RuntimeError):
+            with repo.transaction():
+                repo.add(Category('a'))
+                raise RuntimeError
+        assert repo.pending == 0
+        assert repo.get_all() == []
+
+
+def test_failed_flush_keeps_changes(db_file):
+    with JournaledRepository(db_file, Category, flush_interval=None) as repo:
+        repo.add(Category('a'))
+        with repo.store.pool.connection() as con:
+            con.execute('DROP TABLE category')
+        with pytest.raises(sqlite3.OperationalError):
+            repo.flush()
+        assert repo.pending == 1
+        with repo.store.pool.connection() as con:
+            con.execute('CREATE TABLE category (pk INTEGER PRIMARY KEY, name TEXT, '
+                        'parent INTEGER)')
+        assert repo.flush() == 1
+    assert stored(db_file, Category) == [Category('a', pk=1)]
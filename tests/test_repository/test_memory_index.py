@@ -0,0 +1,52 @@
+import pytest
+
+from bookkeeper.repository.memory_index import HashIndex, SortedIndex
+
+
+@pytest.fixture(params=[HashIndex, SortedIndex])
+def index(request):
+    return request.param('field')
+
+
+def test_lookup(index):
+    index.add(1, 'a')
+    index.add(2, 'b')
+    index.add(3, 'a')
+    assert sorted(index.lookup('a')) == [1, 3]
+    assert index.count('a') == 2
+    assert index.lookup('c') == []
+    assert len(index) == 3
+
+
+def test_readd_moves_object(index):
+    index.add(1, 'a')
+    index.add(1, 'b')
+    assert index.lookup('a') == []
+    assert index.lookup('b') == [1]
+
+
+def test_remove(index):
+    index.add(1, 'a')
+    index.add(2, 'a')
+    index.remove(1)
+    index.remove(100)
+    assert index.lookup('a') == [2]
+
+
+def test_add_many(index):
+    index.add(1, 'x')
+    index.add_many((pk, str(pk % 3)) for pk in range(1, 100))
+    assert sorted(index.lookup('0')) == list(range(3, 100, 3))
+    assert index.lookup('x') == []
+    assert len(index) == 99
+
+
+def test_sorted_range():
+    index = SortedIndex('field')
+    for pk, value in enumerate([5, 3, None, 1, 3, 4], 1):
+        index.add(pk, value)
+    assert index.range(2, 4) == [2, 5, 6]
+    assert index.count_range(2, 4) == 3
+    assert index.range(10, 20) == []
+    index.remove(3)
+    assert index.range(0, 10) == [4, 2, 5, 6, 1]
@@ -1,3 +1,6 @@
+from inspect import isgenerator
+
+from bookkeeper.models.category import Category
 from bookkeeper.repository.memory_repository import MemoryRepository
 
 import pytest
@@ -81,3 +84,168 @@ def test_get_like(repo, custom_class):
     assert repo.get_all_like({'name': '0'}) == [objects[0]]
     assert repo.get_all_like({'test': 'test'}) == objects
 
+
+def test_add_many(repo, custom_class):
+    objects = [custom_class() for i in range(5)]
+    pks = repo.add_many(objects)
+    assert pks == [o.pk for o in objects]
+    assert len(set(pks)) == 5
+    assert repo.get_all() == objects
+
+
+def test_cannot_add_many_with_pk(repo, custom_class):
+    objects = [custom_class() for i in range(3)]
+    objects[2].pk = 10
+    with pytest.raises(ValueError):
+        repo.add_many(objects)
+    assert repo.get_all() == []
+
+
+def test_update_many(repo, custom_class):
+    objects = [custom_class() for i in range(3)]
+    repo.add_many(objects)
+    new_objects = []
+    for o in objects:
+        new = custom_class()
+        new.pk = o.pk
+        new_objects.append(new)
+    repo.update_many(new_objects)
+    assert repo.get_all() == new_objects
+
+
+def test_delete_many(repo, custom_class):
+    objects = [custom_class() for i in range(5)]
+    repo.add_many(objects)
+    repo.delete_many([objects[0].pk, objects[3].pk])
+    assert repo.get_all() == [objects[1], objects[2], objects[4]]
+    with pytest.raises(KeyError):
+        repo.delete_many([objects[1].pk, 100])
+    assert repo.get(objects[1].pk) is objects[1]
+
+
+def test_get_between(repo, custom_class):
+    objects = []
+    for i in [5, 1, 4, 2, 3]:
+        o = custom_class()
+        o.value = i
+        objects.append(o)
+    repo.add_many(objects)
+    assert [o.value for o in repo.get_between('value', 2, 4)] == [2, 3, 4]
+    o = custom_class()
+    o.value = 3
+    repo.add(o)
+    assert [o.value for o in repo.get_between('value', 3, 3)] == [3, 3]
+    repo.delete(objects[2].pk)
+    assert [o.value for o in repo.get_between('value', 2, 4)] == [2, 3, 3]
+    assert repo.get_between('value', 10, 20) == []
+
+
+@pytest.fixture
+def indexed_repo():
+    return MemoryRepository(hash_indexes=['name'], sorted_indexes=['value'])
+
+
+def make_objects(custom_class, n):
+    objects = []
+    for i in range(n):
+        o = custom_class()
+        o.name = str(i % 3)
+        o.value = i
+        objects.append(o)
+    return objects
+
+
+def test_indexed_get_all(indexed_repo, custom_class):
+    objects = make_objects(custom_class, 10)
+    indexed_repo.add_many(objects[:5])
+    for o in objects[5:]:
+        indexed_repo.add(o)
+    assert indexed_repo.get_all({'name': '1'}) == [objects[1], objects[4], objects[7]]
+    assert indexed_repo.get_all({'value': 4}) == [objects[4]]
+    assert indexed_repo.get_all({'name': '1', 'value': 4}) == [objects[4]]
+    assert indexed_repo.get_all({'name': '2', 'value': 4}) == []
+
+
+def test_indexes_follow_updates(indexed_repo, custom_class):
+    objects = make_objects(custom_class, 6)
+    indexed_repo.add_many(objects)
+    objects[0].name = '1'
+    objects[0].value = 100
+    indexed_repo.update(objects[0])
+    assert indexed_repo.get_all({'name': '0'}) == [objects[3]]
+    assert indexed_repo.get_all({'name': '1'}) == [objects[0], objects[1], objects[4]]
+    assert indexed_repo.get_between('value', 50, 200) == [objects[0]]
+    indexed_repo.delete(objects[1].pk)
+    indexed_repo.delete_many([objects[4].pk])
+    assert indexed_repo.get_all({'name': '1'}) == [objects[0]]
+    assert indexed_repo.get_between('value', 0, 5) == [objects[2], objects[3],
+                                                        objects[5]]
+
+
+def test_events(repo, custom_class):
+    events = []
+    listener = lambda event, pk, obj: events.append((event, pk, obj))
+    repo.subscribe(listener)
+    o1, o2, o3 = custom_class(), custom_class(), custom_class()
+    repo.add(o1)
+    repo.add_many([o2, o3])
+    repo.update(o1)
+    repo.update_many([o2])
+    repo.delete(o1.pk)
+    repo.delete_many([o2.pk, o3.pk])
+    assert events == [('add', o1.pk, o1), ('add', o2.pk, o2), ('add', o3.pk, o3),
+                      ('update', o1.pk, o1), ('update', o2.pk, o2),
+                      ('delete', o1.pk, None), ('delete', o2.pk, None),
+                      ('delete', o3.pk, None)]
+    repo.unsubscribe(listener)
+    repo.add(custom_class())
+    assert len(events) == 8
+
+
+def test_iter_all(indexed_repo, custom_class):
+    objects = make_objects(custom_class, 10)
+    indexed_repo.add_many(objects)
+    gen = indexed_repo.iter_all()
+    assert isgenerator(gen)
+    assert list(gen) == objects
+    assert list(indexed_repo.iter_all({'name': '1', 'value': 4})) == [objects[4]]
+    # репозиторий можно изменять во время перебора
+    for o in indexed_repo.iter_all({'name': '0'}):
+        indexed_repo.delete(o.pk)
+    assert indexed_repo.get_all({'name': '0'}) == []
+
+
+def test_iter_between(indexed_repo, custom_class):
+    objects = make_objects(custom_class, 10)
+    indexed_repo.add_many(objects)
+    assert list(indexed_repo.iter_between('value', 3, 5)) == objects[3:6]
+    assert [o.value for o in indexed_repo.iter_between('name', '1', '1')] == [1, 4, 7]
+
+
+def test_transaction_rollback_restores_changes():
+    repo = MemoryRepository[Category](hash_indexes=['parent'], sorted_indexes=['name'])
+    a, b, c = Category('a'), Category('b', 1), Category('c', 1)
+    repo.add_many([a, b, c])
+    with pytest.raises(RuntimeError), repo.transaction():
+        repo.update(Category('x', None, b.pk))
+        repo.delete(c.pk)
+        repo.add(Category('d', 1))
+        with repo.transaction():
+            repo.delete(a.pk)
+        raise RuntimeError
+    assert sorted(repo.get_all(), key=lambda cat: cat.pk) == [a, b, c]
+    assert {cat.pk for cat in repo.get_all({'parent': 1})} == {b.pk, c.pk}
+    assert repo.get_between('name', 'a', 'z') == [a, b, c]
+    assert repo.add(Category('e')) == 4
+
+
+def test_range_index_is_updated_incrementally():
+    repo = MemoryRepository[Category]()
+    repo.add_many([Category('b'), Category('d')])
+    assert [c.name for c in repo.get_between('name', 'a', 'z')] == ['b', 'd']
+    index = repo._sorted['name']
+    repo.add(Category('c'))
+    repo.update(Category('a', None, 2))
+    repo.delete(1)
+    assert repo._sorted['name'] is index
+    assert [c.name for c in repo.get_between('name', 'a', 'z')] == ['a', 'c']
@@ -0,0 +1,185 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from bookkeeper.models.budget import Budget
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.analytics import (
+    ExpenseAnalytics, PartitionedExpenseAnalytics, make_analytics)
+from bookkeeper.repository.instrumentation import QueryProfiler
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.partitioned_repository import (
+    PartitionedExpenseRepository, partition_bounds, partition_key)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    with PartitionedExpenseRepository(str(tmp_path / 'test.db')) as repo:
+        yield repo
+
+
+def make_expenses():
+    return [Expense(i, i % 3 + 1, datetime(2022 + i // 24, i // 2 % 12 + 1, 1 + i % 28),
+                    datetime(2024, 1, 1), f'expense {i}')
+            for i in range(48)]
+
+
+def tables(profiler):
+    return {sql.split(' FROM ')[1].split()[0] for sql in profiler.queries
+            if ' FROM expense_2' in sql}
+
+
+def test_partition_key():
+    assert partition_key('month', datetime(2023, 2, 5)) == '2023_02'
+    assert partition_key('year', datetime(2023, 2, 5)) == '2023'
+    assert partition_bounds('2023_12') == (datetime(2023, 12, 1), datetime(2024, 1, 1))
+    assert partition_bounds('2023') == (datetime(2023, 1, 1), datetime(2024, 1, 1))
+    with pytest.raises(ValueError):
+        partition_key('week', datetime(2023, 2, 5))
+
+
+def test_crud(repo):
+    exp = Expense(100, 1, datetime(2023, 1, 15), comment='test')
+    pk = repo.add(exp)
+    assert repo.keys == ['2023_01']
+    assert repo.get(pk) == exp
+    exp.amount = 200
+    repo.update(exp)
+    assert repo.get(pk).amount == 200
+    # изменение даты переносит расход в другой раздел с тем же id
+    exp.expense_date = datetime(2022, 12, 31)
+    repo.update(exp)
+    assert repo.keys == ['2022_12', '2023_01']
+    assert repo.get(pk) == exp
+    assert repo.get_all({'expense_date': datetime(2023, 1, 15)}) == []
+    repo.delete(pk)
+    assert repo.get(pk) is None
+    assert repo.get_all() == []
+    with pytest.raises(KeyError):
+        repo.delete(pk)
+    with pytest.raises(ValueError):
+        repo.update(exp)
+
+
+def test_add_many_same_as_memory(repo):
+    memory = MemoryRepository[Expense]()
+    memory.add_many(make_expenses())
+    pks = repo.add_many(make_expenses())
+    assert pks == list(range(1, 49))
+    assert len(repo.keys) == 24
+    assert sorted(repo.get_all(), key=lambda e: e.pk) == memory.get_all()
+    assert repo.get_all({'category': 2}) == memory.get_all({'category': 2})
+    assert sorted(repo.iter_all(batch_size=5), key=lambda e: e.pk) == memory.get_all()
+    lo, hi = datetime(2022, 3, 1), datetime(2022, 5, 31)
+    assert repo.get_between('expense_date', lo, hi) == memory.get_between(
+        'expense_date', lo, hi)
+    assert list(repo.iter_between('amount', 10, 20)) == memory.get_between(
+        'amount', 10, 20)
+    assert repo.get_all_like({'comment': 'expense 1%'}) == memory.get_all_like(
+        {'comment': 'expense 1%'})
+    assert repo.get_all({'pk': 7}) == [memory.get(7)]
+    assert repo.add(Expense(1, 1, datetime(2020, 1, 1))) == 49
+
+
+def test_unknown_field(repo):
+    with pytest.raises(ValueError):
+        repo.get_all({'unknown': 1})
+    with pytest.raises(ValueError):
+        repo.get_between('unknown', 1, 2)
+
+
+def test_pruning(repo):
+    repo.add_many(make_expenses())
+    profiler = QueryProfiler()
+    repo.pool.profiler = profiler
+    repo.get_between('expense_date', datetime(2022, 3, 1), datetime(2022, 4, 30))
+    assert tables(profiler) == {'expense_2022_03', 'expense_2022_04'}
+    profiler.reset()
+    analytics = make_analytics(repo)
+    assert isinstance(analytics, PartitionedExpenseAnalytics)
+    analytics.total(datetime(2023, 6, 1), datetime(2023, 6, 30))
+    assert tables(profiler) == {'expense_2023_06'}
+
+
+def test_analytics_same_as_generic(repo):
+    repo.add_many(make_expenses())
+    partitioned = make_analytics(repo)
+    generic = ExpenseAnalytics(repo)
+    start, end = datetime(2022, 5, 10), datetime(2023, 2, 1)
+    for by in ('category', 'month', 'week'):
+        assert partitioned.totals(by, start, end) == generic.totals(by, start, end)
+    assert partitioned.total() == generic.total()
+    assert partitioned.totals('category', where={'category': 1}) == generic.totals(
+        'category', where={'category': 1})
+    assert partitioned.top_expenses(3, start, end) == generic.top_expenses(3, start, end)
+
+
+def test_budget_update_spent(repo):
+    repo.add_many([Expense(100, 1, datetime(2023, 5, 10, 12)),
+                   Expense(50, 1, datetime(2023, 5, 11)),
+                   Expense(30, 1, datetime(2023, 4, 30))])
+    budget = Budget('Day', 1000)
+    budget.update_spent(repo, now=datetime(2023, 5, 10, 18))
+    assert budget.spent == 100
+    budget.spent = 0
+    budget.update_spent(repo, now=datetime(2023, 5, 10, 18),
+                        total=make_analytics(repo).total)
+    assert budget.spent == 100
+
+
+def test_read_only(repo):
+    repo.add_many(make_expenses())
+    assert repo.freeze(datetime(2022, 3, 1)) == ['2022_01', '2022_02']
+    assert repo.is_read_only('2022_02')
+    old = repo.get(1)
+    old.amount = 1000
+    with pytest.raises(ValueError):
+        repo.update(old)
+    with pytest.raises(ValueError):
+        repo.delete(1)
+    with pytest.raises(ValueError):
+        repo.add(Expense(1, 1, datetime(2022, 1, 5)))
+    # перенос расхода в раздел только для чтения тоже запрещен
+    new = repo.get(48)
+    new.expense_date = datetime(2022, 1, 5)
+    with pytest.raises(ValueError):
+        repo.update(new)
+    # запрет действует и для изменений в обход репозитория
+    with repo.pool.connection() as con:
+        with pytest.raises(sqlite3.IntegrityError):
+            con.execute('DELETE FROM expense_2022_01')
+    repo.set_read_only('2022_01', False)
+    repo.delete(1)
+    assert repo.get(1) is None
+
+
+def test_reopen(tmp_path):
+    db_file = str(tmp_path / 'test.db')
+    with PartitionedExpenseRepository(db_file) as repo:
+        repo.add_many(make_expenses())
+        repo.freeze(datetime(2022, 2, 1))
+    with PartitionedExpenseRepository(db_file) as repo:
+        assert len(repo.keys) == 24
+        assert repo.is_read_only('2022_01')
+        assert len(repo.get_all()) == 48
+    with pytest.raises(ValueError):
+        PartitionedExpenseRepository(db_file, granularity='year')
+
+
+def test_rollback(repo):
+    with pytest.raises(RuntimeError):
+        with repo.transaction():
+            repo.add(Expense(1, 1, datetime(2023, 1, 1)))
+            repo.add_many([Expense(2, 1, datetime(2024, 1, 1))])
+            raise RuntimeError
+    assert repo.keys == []
+    assert repo.get_all() == []
+    assert repo.add(Expense(1, 1, datetime(2023, 1, 1))) == 1
+
+
+def test_year_partitions(tmp_path):
+    with PartitionedExpenseRepository(str(tmp_path / 'test.db'), 'year') as repo:
+        repo.add_many(make_expenses())
+        assert repo.keys == ['2022', '2023']
+        assert len(repo.partitions(datetime(2023, 5, 1), datetime(2024, 1, 1))) == 1
@@ -0,0 +1,140 @@
+from datetime import datetime
+
+import pytest
+
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.cached_repository import CachedRepository
+from bookkeeper.repository.columnar_repository import ColumnarExpenseRepository
+from bookkeeper.repository.instrumentation import InstrumentedRepository, QueryProfiler
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.partitioned_repository import PartitionedExpenseRepository
+from bookkeeper.repository.query import keyset_condition, parse_order, row_type, select
+from bookkeeper.repository.sqlite_repository import SqliteRepository
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'columnar', 'partitioned'])
+def repo(request, tmp_path):
+    db_file = str(tmp_path / 'test.db')
+    repo = {'memory': MemoryRepository[Expense],
+            'sqlite': lambda: SqliteRepository[Expense](db_file, Expense),
+            'columnar': ColumnarExpenseRepository,
+            'partitioned': lambda: PartitionedExpenseRepository(db_file)}[request.param]()
+    repo.add_many([Expense(i * 7 % 10, i % 3, datetime(2023, 1 + i % 3, 1 + i),
+                           datetime(2023, 4, 1), f'comment {i % 4}')
+                   for i in range(25)])
+    yield repo
+    if hasattr(repo, 'close'):
+        repo.close()
+
+
+def test_parse_order():
+    assert parse_order(None) == [('pk', False)]
+    assert parse_order('-amount') == [('amount', True), ('pk', False)]
+    assert parse_order(['category', '-pk']) == [('category', False), ('pk', True)]
+
+
+def test_order_and_limit(repo):
+    exps = sorted(repo.get_all(), key=lambda e: (-e.amount, e.pk))
+    assert repo.query(order_by='-amount') == exps
+    assert repo.query(order_by='-amount', limit=5) == exps[:5]
+    assert repo.query(limit=3) == sorted(repo.get_all(), key=lambda e: e.pk)[:3]
+    latest = sorted(repo.get_all(), key=lambda e: (e.expense_date, e.pk), reverse=True)
+    assert repo.query(order_by=['-expense_date', '-pk'], limit=4) == latest[:4]
+
+
+def test_where(repo):
+    exps = sorted(repo.get_all({'category': 1}), key=lambda e: (e.amount, e.pk))
+    assert repo.query(where={'category': 1}, order_by='amount') == exps
+
+
+def test_projection(repo):
+    rows = repo.query(['pk', 'amount', 'expense_date'], order_by='-amount', limit=3)
+    exps = repo.query(order_by='-amount', limit=3)
+    assert rows == [(e.pk, e.amount, e.expense_date) for e in exps]
+    assert rows[0].amount == exps[0].amount
+    assert isinstance(rows[0].expense_date, datetime)
+    assert sum(row.amount for row in repo.query(['amount'])) == sum(
+        e.amount for e in repo.get_all())
+
+
+@pytest.mark.parametrize('order_by', [None, 'amount', ['-amount'],
+                                      ['category', '-amount'], ['-expense_date']])
+def test_keyset_pagination(repo, order_by):
+    expected = repo.query(order_by=order_by)
+    pages, after = [], None
+    while page := repo.query(order_by=order_by, limit=4, after=after):
+        pages.extend(page)
+        after = page[-1]
+    assert pages == expected
+    # курсором может быть и строка проекции с полями порядка
+    rows = repo.query(['amount', 'category', 'expense_date', 'pk'],
+                      order_by=order_by, limit=4)
+    assert repo.query(order_by=order_by, after=rows[-1]) == expected[4:]
+
+
+@pytest.mark.parametrize('order_by', [None, 'amount', ['category', '-amount']])
+def test_projection_pagination(repo, order_by):
+    expected = [exp.comment for exp in repo.query(order_by=order_by)]
+    pages, after = [], None
+    while page := repo.query(['comment'], order_by=order_by, limit=4, after=after):
+        pages.extend(row.comment for row in page)
+        after = page[-1]
+    assert pages == expected
+    row = repo.query(['comment'], order_by=order_by, limit=1)[0]
+    assert row._fields[0] == 'comment' and 'pk' in row._fields
+    with pytest.raises(ValueError):
+        repo.query(order_by=order_by, after=row_type(('comment',))('comment 0'))
+
+
+def test_wrappers(repo):
+    expected = repo.query(order_by='-amount', limit=2)
+    assert CachedRepository(repo).query(order_by='-amount', limit=2) == expected
+    instrumented = InstrumentedRepository(repo)
+    assert instrumented.query(order_by='-amount', limit=2) == expected
+    assert instrumented.stats['query'].rows == 2
+
+
+def test_sqlite_pushdown(tmp_path):
+    with SqliteRepository[Expense](str(tmp_path / 'test.db'), Expense,
+                                   indexes=['expense_date']) as repo:
+        repo.add_many([Expense(i, 1, datetime(2023, 1, 1 + i)) for i in range(20)])
+        profiler = QueryProfiler()
+        repo.pool.profiler = profiler
+        page = repo.query(['pk', 'amount'], order_by='-expense_date', limit=5)
+        assert [row.amount for row in page] == [19, 18, 17, 16, 15]
+        stats, = profiler.queries.values()
+        assert stats.rows == 5
+        with pytest.raises(ValueError):
+            repo.query(['unknown'])
+        with pytest.raises(ValueError):
+            repo.query(order_by='unknown')
+
+
+def test_partitioned_pushdown(tmp_path):
+    with PartitionedExpenseRepository(str(tmp_path / 'test.db')) as repo:
+        repo.add_many([Expense(i, 1, datetime(2023, 1 + i % 3, 1 + i))
+                       for i in range(20)])
+        profiler = QueryProfiler()
+        repo.pool.profiler = profiler
+        page = repo.query(['amount'], order_by='-expense_date', limit=5)
+        assert [row.amount for row in page] == [17, 14, 11, 8, 5]
+        assert page[0]._fields == ('amount', 'expense_date', 'pk')
+        assert len(profiler.queries) == 3
+        for sql, stats in profiler.queries.items():
+            assert sql.startswith('SELECT "amount", "expense_date", ROWID ')
+            assert stats.rows <= 5
+
+
+def test_keyset_condition():
+    after = row_type(('amount', 'pk'))(10, 3)
+    assert keyset_condition(parse_order('amount'), str, after) == (
+        '(amount, pk) > (?, ?)', [10, 3])
+    assert keyset_condition(parse_order('-amount'), str, after) == (
+        '((amount < ?) OR (amount = ? AND pk > ?))', [10, 10, 3])
+
+
+def test_select_none_first():
+    rows = [row_type(('value', 'pk'))(value, pk)
+            for pk, value in enumerate([3, None, 1], 1)]
+    assert [r.pk for r in select(rows, order_by='value')] == [2, 3, 1]
+    assert [r.pk for r in select(rows, order_by='-value')] == [1, 3, 2]
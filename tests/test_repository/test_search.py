@@ -0,0 +1,112 @@
+import pytest
+
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.search import (
+    InvertedIndex, SqliteSearchIndex, make_search_index, parse_query, tokenize)
+from bookkeeper.repository.sqlite_repository import SqliteRepository
+
+COMMENTS = ['Такси до работы', 'такси домой, такси обратно', 'Продукты в магазине',
+            'кафе с коллегами', 'продуктовый рынок', 'подарок маме', '']
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def repo(request, tmp_path):
+    if request.param == 'memory':
+        yield MemoryRepository[Expense]()
+    else:
+        repo = SqliteRepository[Expense](str(tmp_path / 'test.db'), Expense)
+        yield repo
+        repo.close()
+
+
+@pytest.fixture
+def index(repo):
+    repo.add_many([Expense(100, 1, comment=comment) for comment in COMMENTS])
+    index = make_search_index(repo)
+    yield index
+    index.close()
+
+
+def comments(exps):
+    return [exp.comment for exp in exps]
+
+
+def test_tokenize():
+    assert tokenize('Такси_до  работы, 2023!') == ['такси', 'до', 'работы', '2023']
+    assert parse_query('такс* Дом') == [('такс', True), ('дом', False)]
+
+
+def test_make_search_index(repo):
+    expected = SqliteSearchIndex if isinstance(repo, SqliteRepository) else InvertedIndex
+    assert isinstance(make_search_index(repo), expected)
+
+
+def test_search_terms(index):
+    assert comments(index.search('ТАКСИ работы')) == ['Такси до работы']
+    assert comments(index.search('магазин')) == []
+    assert index.search('') == []
+    assert index.search('"OR*') == []
+
+
+def test_search_prefix(index):
+    assert sorted(comments(index.search('продукт*'))) == [
+        'Продукты в магазине', 'продуктовый рынок']
+    assert index.search_pks('продукт* рын*') == [5]
+
+
+def test_search_ranking(index):
+    # слово встречается в комментарии чаще - комментарий выше
+    assert index.search_pks('такси') == [2, 1]
+    assert index.search_pks('такси', limit=1) == [2]
+
+
+def test_index_follows_changes(repo, index):
+    pk = repo.add(Expense(1, 1, comment='такси в аэропорт'))
+    assert pk in index.search_pks('аэропорт')
+    exp = repo.get(pk)
+    exp.comment = 'поезд'
+    repo.update(exp)
+    assert index.search_pks('аэропорт') == []
+    assert index.search_pks('поезд') == [pk]
+    repo.delete(pk)
+    assert index.search_pks('поезд') == []
+    assert index.search_pks('такси') == [2, 1]
+
+
+def test_index_ignores_rolled_back_changes(repo, index):
+    with pytest.raises(RuntimeError):
+        with repo.transaction():
+            repo.add(Expense(1, 1, comment='отмененное'))
+            raise RuntimeError
+    assert index.search('отмененное') == []
+
+
+def test_same_ranking(tmp_path):
+    texts = [f'{"кафе " * (i % 3 + 1)}обед {i} {"кофе" if i % 2 else "чай"}'
+             for i in range(30)]
+    memory = MemoryRepository[Expense]()
+    sqlite = SqliteRepository[Expense](str(tmp_path / 'test.db'), Expense)
+    for repo in (memory, sqlite):
+        repo.add_many([Expense(1, 1, comment=text) for text in texts])
+    for query in ('кафе', 'кафе кофе', 'ко*', 'обед 7'):
+        assert (InvertedIndex(memory).search_pks(query)
+                == SqliteSearchIndex(sqlite).search_pks(query))
+    sqlite.close()
+
+
+def test_existing_rows_are_indexed(tmp_path):
+    db_file = str(tmp_path / 'test.db')
+    repo = SqliteRepository[Expense](db_file, Expense)
+    repo.add(Expense(1, 1, comment='старый расход'))
+    assert SqliteSearchIndex(repo).search_pks('старый') == [1]
+    # повторное создание индекса не строит его заново
+    assert SqliteSearchIndex(repo).search_pks('старый') == [1]
+    repo.close()
+
+
+def test_not_text_field(tmp_path):
+    repo = SqliteRepository[Expense](str(tmp_path / 'test.db'), Expense)
+    with pytest.raises(ValueError):
+        SqliteSearchIndex(repo, 'amount')
+    repo.close()
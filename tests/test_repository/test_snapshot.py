@@ -0,0 +1,217 @@
+from datetime import date, datetime
+
+import pytest
+
+from bookkeeper.models.budget import Budget
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.columnar_repository import ColumnarExpenseRepository
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.snapshot import (
+    SnapshotReader, SnapshotWriter, export_ledger, import_ledger, model_fields)
+from bookkeeper.repository.sqlite_repository import SqliteRepository
+
+
+@pytest.fixture
+def ledger():
+    cat_repo = MemoryRepository[Category]()
+    exp_repo = MemoryRepository[Expense]()
+    budget_repo = MemoryRepository[Budget]()
+    food = cat_repo.add(Category('Продукты'))
+    cat_repo.add(Category('Мясо', food))
+    cat_repo.delete(cat_repo.add(Category('удалена')))
+    exp_repo.add_many([Expense(i * 10, food, datetime(2023, 1, 1 + i % 28),
+                               datetime(2023, 2, 1, 12, 30, 15, 123456),
+                               f'комментарий {i % 3}') for i in range(100)])
+    exp_repo.delete(5)
+    budget_repo.add(Budget('Day', 1000, 300))
+    return cat_repo, exp_repo, budget_repo
+
+
+def sqlite_repos(tmp_path):
+    db_file = str(tmp_path / 'ledger.db')
+    return (SqliteRepository(db_file, Category), SqliteRepository(db_file, Expense),
+            SqliteRepository(db_file, Budget))
+
+
+def test_model_fields():
+    assert model_fields(Category) == [
+        ('name', 's', False), ('parent', 'i', True), ('pk', 'i', False)]
+    assert ('expense_date', 't', False) in model_fields(Expense)
+
+
+def test_export_import_memory(ledger, tmp_path):
+    path = str(tmp_path / 'ledger.snap')
+    counts = export_ledger(path, *ledger)
+    assert counts == {'category': 2, 'expense': 99, 'budget': 1}
+    repos = (MemoryRepository[Category](), MemoryRepository[Expense](),
+             MemoryRepository[Budget]())
+    assert import_ledger(path, *repos) == counts
+    for old, new in zip(ledger, repos):
+        assert new.get_all() == old.get_all()
+    # id новых объектов продолжают восстановленные
+    assert repos[1].add(Expense(1, 1)) == 101
+
+
+def test_export_import_sqlite(ledger, tmp_path):
+    path = str(tmp_path / 'ledger.snap')
+    export_ledger(path, *ledger)
+    repos = sqlite_repos(tmp_path)
+    import_ledger(path, *repos)
+    for old, new in zip(ledger, repos):
+        assert new.get_all() == old.get_all()
+    assert repos[1].get(6) == ledger[1].get(6)
+    # снимок из SQLite совпадает со снимком из памяти
+    second = str(tmp_path / 'second.snap')
+    export_ledger(second, *repos)
+    with open(path, 'rb') as a, open(second, 'rb') as b:
+        assert a.read() == b.read()
+    for repo in repos:
+        repo.close()
+
+
+def test_import_columnar(ledger, tmp_path):
+    path = str(tmp_path / 'ledger.snap')
+    export_ledger(path, *ledger)
+    repo = ColumnarExpenseRepository()
+    with SnapshotReader(path) as reader:
+        assert reader.load('expense', repo, chunk_size=7) == 99
+    assert repo.get_all() == ledger[1].get_all()
+
+
+def test_import_columnar_by_columns(ledger, tmp_path):
+    path = str(tmp_path / 'ledger.snap')
+    export_ledger(path, *ledger)
+    repo = ColumnarExpenseRepository()
+    events = []
+    repo.subscribe(lambda event, pk, obj: events.append((event, pk, obj)))
+    with SnapshotReader(path) as reader:
+        columns, strings = reader['expense'].columns()
+        assert sorted(strings) == ['комментарий 0', 'комментарий 1', 'комментарий 2']
+        assert len(columns['pk']) == 99
+        reader.load('expense', repo)
+        with pytest.raises(ValueError):
+            reader.load('expense', repo)
+    exps = ledger[1].get_all()
+    assert repo.get_all() == exps
+    assert events == [('add', exp.pk, exp) for exp in exps]
+    assert repo.add(Expense(1, 1)) == 101
+
+
+def test_lazy_reader(ledger, tmp_path):
+    path = str(tmp_path / 'ledger.snap')
+    export_ledger(path, *ledger)
+    exps = ledger[1].get_all()
+    with SnapshotReader(path) as reader:
+        section = reader['expense']
+        assert len(section) == 99
+        assert section[0] == exps[0]
+        assert section[-1] == exps[-1]
+        assert list(section) == exps
+        with pytest.raises(IndexError):
+            section[99]
+        assert set(reader.sections) == {'category', 'expense', 'budget'}
+
+
+def test_nullable_and_types(tmp_path):
+    class Row:
+        name: str | None
+        data: bytes
+        day: date
+        ratio: float
+        flag: bool
+        pk: int
+
+        def __init__(self, name, data, day, ratio, flag, pk):
+            self.name, self.data, self.day = name, data, day
+            self.ratio, self.flag, self.pk = ratio, flag, pk
+
+        def __eq__(self, other):
+            return vars(self) == vars(other)
+
+    rows = [Row(None, b'\x00\x01', date(2023, 5, 1), 0.5, True, 1),
+            Row('', b'', date(1, 1, 1), -1.25, False, 2)]
+    path = str(tmp_path / 'rows.snap')
+    with SnapshotWriter(path) as writer:
+        assert writer.write_section('rows', Row, rows) == 2
+    with SnapshotReader(path, {'rows': Row}) as reader:
+        assert list(reader['rows']) == rows
+        columns, strings = reader['rows'].columns()
+        assert columns['name'] == [None, strings.index('')]
+        assert columns['data'] == [b'\x00\x01', b'']
+        assert columns['flag'] == [True, False]
+
+
+def test_not_nullable(tmp_path):
+    with SnapshotWriter(str(tmp_path / 'bad.snap')) as writer:
+        with pytest.raises(ValueError):
+            writer.write_section('category', Category, [Category(None)])
+
+
+def test_bad_file(tmp_path):
+    path = tmp_path / 'bad.snap'
+    path.write_bytes(b'not a snapshot')
+    with pytest.raises(ValueError):
+        SnapshotReader(str(path))
+
+
+def test_unknown_section(ledger, tmp_path):
+    path = str(tmp_path / 'ledger.snap')
+    export_ledger(path, *ledger)
+    with pytest.raises(ValueError):
+        SnapshotReader(path, {'category': Category})
+
+
+def test_failed_export_keeps_previous_snapshot(ledger, tmp_path):
+    path = str(tmp_path / 'ledger.snap')
+    counts = export_ledger(path, *ledger)
+    cat_repo, exp_repo, budget_repo = ledger
+    exp_repo.add(Expense(1, 1, comment=None))
+    with pytest.raises(ValueError):
+        export_ledger(path, cat_repo, exp_repo, budget_repo)
+    repos = (MemoryRepository[Category](), MemoryRepository[Expense](),
+             MemoryRepository[Budget]())
+    assert import_ledger(path, *repos) == counts
+    assert [p.name for p in tmp_path.iterdir()] == ['ledger.snap']
+
+
+def test_failed_import_rolls_back(ledger, tmp_path):
+    path = str(tmp_path / 'ledger.snap')
+    export_ledger(path, *ledger)
+    repo = MemoryRepository[Expense]()
+    repo.add(Expense(1, 1))
+    with SnapshotReader(path) as reader:
+        with pytest.raises(ValueError):
+            reader.load('expense', repo, chunk_size=10)
+    assert len(repo.get_all()) == 1
+
+
+def test_restore_many_memory():
+    repo = MemoryRepository[Category]()
+    repo.restore_many([Category('a', pk=3), Category('b', pk=7)])
+    assert repo.get(7).name == 'b'
+    assert repo.add(Category('c')) == 8
+    with pytest.raises(ValueError):
+        repo.restore_many([Category('d', pk=3)])
+    with pytest.raises(ValueError):
+        repo.restore_many([Category('d', pk=0)])
+
+
+def test_restore_many_sqlite(tmp_path):
+    repo = SqliteRepository(str(tmp_path / 'test.db'), Category)
+    events = []
+    repo.subscribe(lambda event, pk, obj: events.append((event, pk)))
+    repo.restore_many([Category('a', pk=3), Category('b', pk=7)])
+    assert events == [('add', 3), ('add', 7)]
+    assert repo.get(7) == Category('b', pk=7)
+    assert repo.add(Category('c')) == 8
+    repo.close()
+
+
+def test_restore_many_columnar():
+    repo = ColumnarExpenseRepository()
+    repo.restore_many([Expense(1, 1, pk=2), Expense(2, 1, pk=5)])
+    assert repo.get(5).amount == 2
+    assert repo.add(Expense(3, 1)) == 6
+    with pytest.raises(ValueError):
+        repo.restore_many([Expense(4, 1, pk=4)])
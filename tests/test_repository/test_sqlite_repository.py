@@ -4,9 +4,9 @@ import sqlite3
 from dataclasses import dataclass
 from datetime import datetime
 
+from bookkeeper.models.budget import Budget
 from bookkeeper.repository.sqlite_repository import SqliteRepository
 
-DB_FILE = "test4sql_repository.db"
 TEST_INT_VALUE = 73
 TEST_STR_VALUE = "test sring"
 
@@ -20,21 +20,25 @@ def custom_class():
     return Custom
 
 @pytest.fixture
-def drop_table():
-    with sqlite3.connect(DB_FILE) as con:
+def db_file(tmp_path):
+    return str(tmp_path / "test4sql_repository.db")
+
+@pytest.fixture
+def drop_table(db_file):
+    with sqlite3.connect(db_file) as con:
         cur = con.cursor()
         cur.execute("DROP TABLE IF EXISTS custom")
 
 @pytest.fixture
-def create_bd():
-    with sqlite3.connect(DB_FILE) as con:
+def create_bd(db_file):
+    with sqlite3.connect(db_file) as con:
         cur = con.cursor()
         cur.execute(f"CREATE TABLE IF NOT EXISTS custom(int_value int, str_value srt)")
     con.close()
 
 @pytest.fixture
-def repo(custom_class, create_bd):
-    return SqliteRepository(db_file=DB_FILE, cls=custom_class)
+def repo(custom_class, create_bd, db_file):
+    return SqliteRepository(db_file=db_file, cls=custom_class)
 
 def test_crud(repo, custom_class):
     # create object
@@ -114,7 +118,7 @@ def test_get_all_like(repo, custom_class):
         repo.add(o)
         objects.append(o)
     assert [objects[0]] == repo.get_all_like({'int_value': '0'})
-    assert objects == repo.get_all_like({'str_value': 'test srting'})
+    assert objects == repo.get_all_like({'str_value': 'test string'})
 
 def test_delete_all(repo, custom_class):
     objects = []
@@ -124,3 +128,217 @@ def test_delete_all(repo, custom_class):
     repo.delete_all()
     assert repo.get_all() == None
 
+
+def test_close_owned_pool(custom_class, tmp_path):
+    db_file = str(tmp_path / 'test.db')
+    with sqlite3.connect(db_file) as con:
+        con.execute("CREATE TABLE custom(int_value int, str_value text)")
+    con.close()
+    with SqliteRepository(db_file=db_file, cls=custom_class) as repo:
+        repo.add(custom_class())
+    assert repo.pool.closed
+
+def test_shared_pool(custom_class, tmp_path):
+    db_file = str(tmp_path / 'test.db')
+    with sqlite3.connect(db_file) as con:
+        con.execute("CREATE TABLE custom(int_value int, str_value text)")
+    con.close()
+    repo1 = SqliteRepository(db_file=db_file, cls=custom_class, shared=True)
+    repo2 = SqliteRepository(db_file=db_file, cls=custom_class, shared=True)
+    assert repo1.pool is repo2.pool
+    pk = repo1.add(custom_class())
+    repo1.close()
+    assert not repo2.pool.closed
+    assert repo2.get(pk) is not None
+    repo2.pool.close()
+
+@pytest.fixture
+def new_repo(custom_class, tmp_path):
+    db_file = str(tmp_path / 'test.db')
+    with sqlite3.connect(db_file) as con:
+        con.execute("CREATE TABLE custom(int_value int, str_value text)")
+    con.close()
+    with SqliteRepository(db_file=db_file, cls=custom_class) as repo:
+        yield repo
+
+def test_add_many(new_repo, custom_class):
+    new_repo.add(custom_class())
+    objects = [custom_class(int_value=i) for i in range(5)]
+    pks = new_repo.add_many(objects)
+    assert pks == [o.pk for o in objects]
+    for o in objects:
+        assert new_repo.get(o.pk) == o
+
+def test_cannot_add_many_with_pk(new_repo, custom_class):
+    objects = [custom_class(), custom_class(pk=5)]
+    with pytest.raises(ValueError):
+        new_repo.add_many(objects)
+    assert new_repo.get_all() == []
+
+def test_update_many(new_repo, custom_class):
+    objects = [custom_class(int_value=i) for i in range(5)]
+    new_repo.add_many(objects)
+    for o in objects:
+        o.str_value = 'updated'
+    new_repo.update_many(objects)
+    assert new_repo.get_all() == objects
+
+def test_update_many_unexistent_rolls_back(new_repo, custom_class):
+    obj = custom_class()
+    new_repo.add(obj)
+    obj.int_value = 1
+    with pytest.raises(ValueError):
+        new_repo.update_many([obj, custom_class(pk=100)])
+    assert new_repo.get(obj.pk).int_value == TEST_INT_VALUE
+
+def test_delete_many(new_repo, custom_class):
+    objects = [custom_class(int_value=i) for i in range(5)]
+    new_repo.add_many(objects)
+    new_repo.delete_many([objects[0].pk, objects[3].pk])
+    assert new_repo.get_all() == [objects[1], objects[2], objects[4]]
+    with pytest.raises(KeyError):
+        new_repo.delete_many([objects[1].pk, 100])
+    assert new_repo.get(objects[1].pk) == objects[1]
+    events = []
+    new_repo.subscribe(lambda event, pk, obj: events.append(pk))
+    new_repo.delete_many([objects[1].pk, objects[1].pk])
+    assert new_repo.get_all() == [objects[2], objects[4]]
+    assert events == [objects[1].pk]
+
+def test_get_all_like_escapes_wildcards(new_repo, custom_class):
+    objects = [custom_class(str_value=value) for value in ('100%', '1000', 'a_b', 'axb')]
+    new_repo.add_many(objects)
+    assert new_repo.get_all_like({'str_value': '0%'}) == [objects[0]]
+    assert new_repo.get_all_like({'str_value': '_'}) == [objects[2]]
+    assert new_repo.get_all_like({'str_value': 'x', 'int_value': '73'}) == [objects[3]]
+    with pytest.raises(ValueError):
+        new_repo.get_all_like({'missing': 'a'})
+
+def test_get_between(new_repo, custom_class):
+    objects = [custom_class(int_value=i) for i in range(5)]
+    new_repo.add_many(objects)
+    assert new_repo.get_between('int_value', 1, 3) == objects[1:4]
+    with pytest.raises(ValueError):
+        new_repo.get_between('unknown', 1, 3)
+
+def test_events(new_repo, custom_class):
+    events = []
+    new_repo.subscribe(lambda event, pk, obj: events.append((event, pk, obj)))
+    o1, o2, o3 = custom_class(), custom_class(), custom_class()
+    new_repo.add(o1)
+    new_repo.add_many([o2, o3])
+    new_repo.update(o1)
+    new_repo.update_many([o2])
+    new_repo.delete(o1.pk)
+    new_repo.delete_many([o2.pk])
+    new_repo.delete_all()
+    assert events == [('add', o1.pk, o1), ('add', o2.pk, o2), ('add', o3.pk, o3),
+                      ('update', o1.pk, o1), ('update', o2.pk, o2),
+                      ('delete', o1.pk, None), ('delete', o2.pk, None),
+                      ('delete', o3.pk, None)]
+
+def test_no_events_on_failed_update(new_repo, custom_class):
+    events = []
+    new_repo.subscribe(lambda event, pk, obj: events.append(event))
+    with pytest.raises(ValueError):
+        new_repo.update(custom_class(pk=100))
+    assert events == []
+
+def test_iter_all(new_repo, custom_class):
+    objects = [custom_class(int_value=i % 3) for i in range(10)]
+    new_repo.add_many(objects)
+    assert list(new_repo.iter_all(batch_size=3)) == objects
+    assert list(new_repo.iter_all(batch_size=5)) == objects
+    assert list(new_repo.iter_all({'int_value': 1}, batch_size=2)) == objects[1::3]
+    assert list(new_repo.iter_all({'int_value': 5})) == []
+
+def test_iter_all_while_writing(new_repo, custom_class):
+    new_repo.add_many([custom_class(int_value=i) for i in range(10)])
+    for obj in new_repo.iter_all(batch_size=4):
+        obj.str_value = 'updated'
+        new_repo.update(obj)
+    assert {o.str_value for o in new_repo.get_all()} == {'updated'}
+
+def test_iter_between(new_repo, custom_class):
+    objects = [custom_class(int_value=i) for i in range(10)]
+    new_repo.add_many(objects)
+    assert list(new_repo.iter_between('int_value', 2, 7, batch_size=4)) == objects[2:8]
+
+def test_datetime_fields_are_decoded(tmp_path):
+    @dataclass
+    class Dated:
+        date_value: datetime
+        optional_date: datetime | None = None
+        pk: int = 0
+
+    db_file = str(tmp_path / 'test.db')
+    with SqliteRepository(db_file=db_file, cls=Dated) as repo:
+        obj = Dated(datetime(2023, 3, 15, 10, 30, 15, 123))
+        repo.add(obj)
+        assert repo.get(obj.pk) == obj
+        assert repo.get_all() == [obj]
+        with repo.pool.connection() as con:
+            stored = con.execute('SELECT date_value FROM dated').fetchone()
+        assert stored == ('2023-03-15 10:30:15.000123',)
+
+def test_keyword_constructor(tmp_path):
+    class Reordered:
+        str_value: str
+        int_value: int
+        pk: int
+
+        def __init__(self, int_value, str_value, pk=0):
+            self.int_value = int_value
+            self.str_value = str_value
+            self.pk = pk
+
+    db_file = str(tmp_path / 'test.db')
+    with SqliteRepository(db_file=db_file, cls=Reordered) as repo:
+        pk = repo.add(Reordered(1, 'a'))
+        obj = repo.get(pk)
+        assert (obj.int_value, obj.str_value, obj.pk) == (1, 'a', pk)
+
+def test_create_table_and_indexes(tmp_path):
+    @dataclass
+    class Model:
+        amount: int
+        name: str
+        ratio: float
+        date_value: datetime
+        parent: int | None = None
+        pk: int = 0
+
+    db_file = str(tmp_path / 'test.db')
+    with SqliteRepository(db_file, Model, indexes=['date_value', 'parent']) as repo:
+        with repo.pool.connection() as con:
+            columns = [(name, type_, pk) for _, name, type_, _, _, pk
+                       in con.execute('PRAGMA table_info(model)')]
+            indexes = {row[1] for row in con.execute('PRAGMA index_list(model)')}
+            plan = con.execute('EXPLAIN QUERY PLAN SELECT * FROM model '
+                               'WHERE date_value BETWEEN ? AND ?', (1, 2)).fetchall()
+        assert columns == [('pk', 'INTEGER', 1), ('amount', 'INTEGER', 0),
+                           ('name', 'TEXT', 0), ('ratio', 'REAL', 0),
+                           ('date_value', 'TIMESTAMP', 0), ('parent', 'INTEGER', 0)]
+        assert indexes == {'model_date_value', 'model_parent'}
+        assert 'model_date_value' in plan[0][-1]
+        obj = Model(1, 'a', 0.5, datetime(2023, 1, 1))
+        repo.add(obj)
+        assert repo.get_all() == [obj]
+    # повторное создание репозитория не меняет схему
+    SqliteRepository(db_file, Model, indexes=['date_value']).close()
+
+def test_unknown_index_field(tmp_path, custom_class):
+    with pytest.raises(ValueError):
+        SqliteRepository(str(tmp_path / 'test.db'), custom_class, indexes=['unknown'])
+
+
+def test_keyword_field_names(tmp_path):
+    repo = SqliteRepository(str(tmp_path / 'test.db'), Budget)
+    budget = Budget('Day', 100)
+    repo.add(budget)
+    assert repo.get_all({'limit': 100}) == [budget]
+    assert repo.get_all({'pk': budget.pk}) == [budget]
+    assert repo.get_between('limit', 50, 150) == [budget]
+    with pytest.raises(ValueError):
+        repo.get_all({'unknown': 1})
+    repo.close()
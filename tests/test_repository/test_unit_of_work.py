@@ -0,0 +1,89 @@
+from datetime import datetime
+
+import pytest
+
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.cached_repository import CachedRepository
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SqliteRepository
+from bookkeeper.repository.unit_of_work import UnitOfWork
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def repos(request, tmp_path):
+    if request.param == 'memory':
+        yield MemoryRepository(), MemoryRepository(hash_indexes=['parent'])
+        return
+    db_file = str(tmp_path / 'test.db')
+    exp_repo = SqliteRepository(db_file, Expense, shared=True)
+    cat_repo = SqliteRepository(db_file, Category, shared=True)
+    yield exp_repo, cat_repo
+    exp_repo.pool.close()
+
+
+def test_commit(repos):
+    exp_repo, cat_repo = repos
+    events = []
+    exp_repo.subscribe(lambda event, pk, obj: events.append(event))
+    cat = Category('food')
+    cat_repo.add(cat)
+    with UnitOfWork(exp_repo, cat_repo):
+        exp_repo.add(Expense(100, cat.pk))
+        cat.name = 'groceries'
+        cat_repo.update(cat)
+        assert events == []  # события доставляются после фиксации
+    assert events == ['add']
+    assert len(exp_repo.get_all()) == 1
+    assert cat_repo.get(cat.pk).name == 'groceries'
+
+
+def test_rollback(repos):
+    exp_repo, cat_repo = repos
+    events = []
+    exp_repo.subscribe(lambda event, pk, obj: events.append(event))
+    exp_repo.add(Expense(1, 1))
+    cat_repo.add(Category('food'))
+    with pytest.raises(RuntimeError):
+        with UnitOfWork(exp_repo, cat_repo):
+            exp_repo.add_many([Expense(100, 1), Expense(200, 1)])
+            cat_repo.add(Category('meat', 1))
+            raise RuntimeError('error')
+    assert events == ['add']
+    assert [e.amount for e in exp_repo.get_all()] == [1]
+    assert [c.name for c in cat_repo.get_all()] == ['food']
+    assert cat_repo.get_all({'parent': 1}) == []
+    # после отката репозитории продолжают работать
+    exp_repo.add(Expense(5, 1))
+    assert sorted(e.amount for e in exp_repo.get_all()) == [1, 5]
+
+
+def test_nested_transactions(repos):
+    exp_repo, cat_repo = repos
+    with pytest.raises(RuntimeError):
+        with UnitOfWork(exp_repo):
+            with exp_repo.transaction():
+                exp_repo.add(Expense(1, 1))
+            raise RuntimeError('error')
+    assert exp_repo.get_all() == []
+
+
+def test_create_from_tree_is_atomic(tmp_path):
+    repo = SqliteRepository(str(tmp_path / 'test.db'), Category)
+    with pytest.raises(KeyError):
+        Category.create_from_tree([('a', None), ('b', 'a'), ('c', 'unknown')], repo)
+    assert repo.get_all() == []
+    cats = Category.create_from_tree([('a', None), ('b', 'a')], repo)
+    assert repo.get_all() == cats
+    repo.close()
+
+
+def test_cached_repository_rollback():
+    inner = MemoryRepository()
+    repo = CachedRepository(inner)
+    with pytest.raises(RuntimeError):
+        with UnitOfWork(repo):
+            pk = repo.add(Category('a'))
+            assert repo.get(pk) is not None
+            raise RuntimeError('error')
+    assert repo.get(pk) is None
@@ -1,9 +1,10 @@
 import tempfile
+from inspect import isgenerator
 from textwrap import dedent
 
 import pytest
 
-from bookkeeper.utils import read_tree
+from bookkeeper.utils import iter_tree, iter_tree_paths, read_tree
 
 
 def test_create_tree():
@@ -71,3 +72,38 @@ def test_with_file():
             ('child2', 'parent1'),
             ('parent2', None)
         ]
+
+
+def test_iter_tree_is_lazy():
+    lines = iter(['parent', '    child', 'other'])
+    pairs = iter_tree(lines)
+    assert isgenerator(pairs)
+    assert next(pairs) == ('parent', None)
+    assert next(lines) == '    child'
+
+
+def test_iter_tree_paths():
+    text = dedent('''
+        food
+            other
+        transport
+            other
+                food
+    ''')
+    assert list(iter_tree_paths(text.splitlines())) == [
+        ('food',),
+        ('food', 'other'),
+        ('transport',),
+        ('transport', 'other'),
+        ('transport', 'other', 'food'),
+    ]
+
+
+def test_iter_tree_paths_indentation_error():
+    text = dedent('''
+        parent1
+            child1
+          child2
+    ''')
+    with pytest.raises(IndentationError):
+        list(iter_tree_paths(text.splitlines()))